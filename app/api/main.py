@@ -6,7 +6,7 @@ from uuid import UUID
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Response, WebSocket, status
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.websockets import WebSocketDisconnect
 
@@ -17,12 +17,21 @@ from app.api.schemas import (
     HubConnectionRequest,
     CreateDeviceRequest,
     UpdateDeviceHubRequest,
+    LogRecordInfo,
+    LogLevelsRequest,
+    LLMClientStats,
+    PromptCacheStats,
+    IdleBudgetInfo,
+    UpdateIdleBudgetRequest,
 )
 from app.state import manager as defaultManager
 from app.network.manager import Manager
 from app.network.devices.ai_device import AIDevice
 from app.network.devices.room_hub import RoomHub
-from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
+from app.llm.idle_budget import IdleConfig
+from app.tracing import ringBuffer, getLogLevels, setLogLevels
+from app import metrics
 
 
 class StateBroadcaster:
@@ -77,6 +86,9 @@ def createApp(manager: Manager) -> FastAPI:
             situation=device.situation,
             runAI=getattr(device, "runAI", False),
             isStreaming=getattr(device, "isStreaming", False),
+            earlyToolDispatch=getattr(device, "earlyToolDispatch", False),
+            requestTimeout=getattr(device, "requestTimeout", 0.0),
+            coalesceWindow=getattr(device, "coalesceWindow", 0.0),
         )
 
     def snapshot_state() -> dict[str, Any]:
@@ -116,14 +128,7 @@ def createApp(manager: Manager) -> FastAPI:
     async def emit_packet_transfer(message: dict[str, Any]) -> None:
         await stateBroadcaster.broadcast(message)
 
-    def schedule_packet_transfer(sourceUuid: UUID, targetUuid: UUID, packet: ActionPacket) -> None:
-        payload: dict[str, Any] = {
-            "event": "packet.transfer",
-            "sourceUuid": str(sourceUuid),
-            "targetUuid": str(targetUuid),
-            "packet": packet.model_dump(mode="json"),
-            "sentAt": datetime.utcnow().isoformat() + "Z",
-        }
+    def schedule_packet_event(payload: dict[str, Any]) -> None:
         try:
             loop = asyncio.get_running_loop()
             loop.create_task(emit_packet_transfer(payload))
@@ -138,24 +143,51 @@ def createApp(manager: Manager) -> FastAPI:
                 except RuntimeError:
                     pass
 
+    def schedule_packet_transfer(sourceUuid: UUID, targetUuid: UUID, packet: Packet) -> None:
+        schedule_packet_event({
+            "event": "packet.transfer",
+            "sourceUuid": str(sourceUuid),
+            "targetUuid": str(targetUuid),
+            "packet": packet.toActionPacket().model_dump(mode="json"),
+            "sentAt": datetime.utcnow().isoformat() + "Z",
+        })
+
+    def schedule_packet_multicast(sourceUuid: UUID, targetUuids: List[UUID], packet: Packet) -> None:
+        schedule_packet_event({
+            "event": "packet.multicast",
+            "sourceUuid": str(sourceUuid),
+            "targetUuids": [str(targetUuid) for targetUuid in targetUuids],
+            "packet": packet.toActionPacket().model_dump(mode="json"),
+            "sentAt": datetime.utcnow().isoformat() + "Z",
+        })
+
     def handle_manager_state_change(reason: str, changes: dict[str, Any]) -> None:
         schedule_state_emit(reason, changes)
 
-    def handle_packet_transfer(sourceUuid: UUID, targetUuid: UUID, packet: ActionPacket) -> None:
+    def handle_packet_transfer(sourceUuid: UUID, targetUuid: UUID, packet: Packet) -> None:
         schedule_packet_transfer(sourceUuid, targetUuid, packet)
 
+    def handle_packet_multicast(sourceUuid: UUID, targetUuids: List[UUID], packet: Packet) -> None:
+        schedule_packet_multicast(sourceUuid, targetUuids, packet)
+
     manager.registerStateChangeListener(handle_manager_state_change)
     manager.registerPacketTransferListener(handle_packet_transfer)
+    manager.registerPacketMulticastListener(handle_packet_multicast)
 
     @api.on_event("startup")
     async def capture_event_loop() -> None:
         loopHolder["loop"] = asyncio.get_running_loop()
+        manager.deliveryEngine.start(loopHolder["loop"])
 
     @api.on_event("shutdown")
     async def release_event_loop() -> None:
         loopHolder["loop"] = None
+        manager.deliveryEngine.stop()
+        manager.agentRuntime.shutdown(beforeStop=manager.clientRegistry.closeAsync)
+        manager.clientRegistry.close()
         manager.unregisterStateChangeListener(handle_manager_state_change)
         manager.unregisterPacketTransferListener(handle_packet_transfer)
+        manager.unregisterPacketMulticastListener(handle_packet_multicast)
 
     @api.get("/hubs", response_model=List[RoomHubInfo])
     def listRoomHubs() -> List[RoomHubInfo]:
@@ -232,6 +264,9 @@ def createApp(manager: Manager) -> FastAPI:
                 debug=payload.debug,
                 coolTime=payload.coolTime,
                 timeOut=payload.timeOut,
+                earlyToolDispatch=payload.earlyToolDispatch,
+                requestTimeout=payload.requestTimeout,
+                coalesceWindow=payload.coalesceWindow,
             )
         except Exception as exc:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
@@ -281,6 +316,71 @@ def createApp(manager: Manager) -> FastAPI:
 
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+    @api.get("/idle-budget", response_model=IdleBudgetInfo)
+    def getIdleBudget() -> dict[str, Any]:
+        return manager.idleBudget.stats()
+
+    @api.put("/idle-budget", response_model=IdleBudgetInfo)
+    def updateIdleBudget(payload: UpdateIdleBudgetRequest) -> dict[str, Any]:
+        # Omitted fields keep their current values; agents pick up the change at their next wait.
+        current = manager.idleBudget.config
+        config = IdleConfig(
+            backoff=payload.backoff if payload.backoff is not None else current.backoff,
+            maxInterval=payload.maxInterval if payload.maxInterval is not None else current.maxInterval,
+            turnsPerMinute=payload.turnsPerMinute if payload.turnsPerMinute is not None else current.turnsPerMinute,
+        )
+        try:
+            manager.idleBudget.configure(config)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        return manager.idleBudget.stats()
+
+    @api.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def renderMetrics() -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(manager), media_type="text/plain; version=0.0.4")
+
+    @api.get("/debug/packets", response_model=List[LogRecordInfo])
+    def listRecentPackets(
+        limit: int = 100,
+        subsystem: str | None = None,
+        nodeUuid: UUID | None = None,
+        packetType: str | None = None,
+    ) -> List[dict[str, Any]]:
+        return ringBuffer.query(
+            limit=limit,
+            subsystem=subsystem,
+            nodeUuid=str(nodeUuid) if nodeUuid else None,
+            packetType=packetType,
+        )
+
+    @api.get("/debug/llm-clients", response_model=List[LLMClientStats])
+    def listLLMClients() -> List[dict[str, Any]]:
+        return manager.clientRegistry.stats()
+
+    @api.get("/debug/prompt-cache", response_model=List[PromptCacheStats])
+    def listPromptCacheStats() -> List[dict[str, Any]]:
+        return [
+            {
+                "deviceUuid": device.node.uuid,
+                "name": device.name,
+                "cacheKey": device.promptPrefix.cacheKey,
+                **device.promptCacheStats.toDict(),
+            }
+            for device in manager.devices.values()
+        ]
+
+    @api.get("/debug/log-levels", response_model=dict[str, str])
+    def listLogLevels() -> dict[str, str]:
+        return getLogLevels()
+
+    @api.put("/debug/log-levels", response_model=dict[str, str])
+    def updateLogLevels(payload: LogLevelsRequest) -> dict[str, str]:
+        try:
+            setLogLevels(payload.levels)
+        except ValueError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        return getLogLevels()
+
     webRoot = Path(__file__).resolve().parent.parent.parent / "web"
     if webRoot.exists():
         api.mount("/web", StaticFiles(directory=webRoot, html=True), name="web")
@@ -324,12 +424,12 @@ def createApp(manager: Manager) -> FastAPI:
         loop = asyncio.get_running_loop()
         queue: asyncio.Queue[dict] = asyncio.Queue()
 
-        def listener(packet: ActionPacket) -> None:
+        def listener(packet: Packet) -> None:
             event = {
                 "hubUuid": str(hubUuid),
                 "receivedAt": datetime.utcnow().isoformat() + "Z",
                 # Use JSON mode to convert UUIDs and enums into serialisable primitives
-                "packet": packet.model_dump(mode="json"),
+                "packet": packet.toActionPacket().model_dump(mode="json"),
             }
             loop.call_soon_threadsafe(queue.put_nowait, event)
 
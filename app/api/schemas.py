@@ -1,8 +1,10 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
 
+from app.models.action_packet import ActionPacket
+
 
 class RoomHubInfo(BaseModel):
     uuid: UUID
@@ -24,6 +26,9 @@ class DeviceInfo(BaseModel):
     situation: str
     runAI: bool
     isStreaming: bool = False
+    earlyToolDispatch: bool = False
+    requestTimeout: float = 0.0
+    coalesceWindow: float = 0.0
 
 
 class CreateRoomHubRequest(BaseModel):
@@ -43,8 +48,63 @@ class CreateDeviceRequest(BaseModel):
     debug: bool = False
     coolTime: float = 0.2
     timeOut: float = 10
+    earlyToolDispatch: bool = False
+    requestTimeout: float = 0.0
+    coalesceWindow: float = 0.0
     hubUuid: UUID
 
 
 class UpdateDeviceHubRequest(BaseModel):
     hubUuid: UUID
+
+
+class LogRecordInfo(BaseModel):
+    timestamp: float
+    subsystem: str
+    level: str
+    message: str
+    nodeUuid: Optional[UUID] = None
+    packet: Optional[ActionPacket] = None
+
+
+class LogLevelsRequest(BaseModel):
+    levels: Dict[str, str]
+
+
+class IdleBudgetInfo(BaseModel):
+    backoff: float
+    maxInterval: float
+    turnsPerMinute: int
+    turnsLastMinute: int
+    skipped: int
+
+
+class UpdateIdleBudgetRequest(BaseModel):
+    backoff: Optional[float] = None
+    maxInterval: Optional[float] = None
+    turnsPerMinute: Optional[int] = None
+
+
+class LLMClientStats(BaseModel):
+    baseUrl: Optional[str] = None
+    isAsync: bool
+    http2Enabled: bool
+    devices: int
+    requests: int
+    http2Requests: int
+    connectionsOpened: int
+    tlsHandshakes: int
+    connectionReuseRate: Optional[float] = None
+    poolWaitMeanMs: Optional[float] = None
+    poolWaitMaxMs: float = 0.0
+
+
+class PromptCacheStats(BaseModel):
+    deviceUuid: UUID
+    name: str
+    cacheKey: str
+    requests: int
+    promptTokens: int
+    cachedTokens: int
+    completionTokens: int
+    hitRate: Optional[float] = None
@@ -0,0 +1,7 @@
+from enum import IntEnum
+
+class RequestPriority(IntEnum):
+    # Lower values are served first.
+    DIRECT = 0
+    NORMAL = 1
+    IDLE = 2
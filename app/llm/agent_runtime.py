@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional, TYPE_CHECKING
+from uuid import UUID
+
+from app.tracing import getLogger
+
+if TYPE_CHECKING:
+    from app.network.devices.ai_device import AIDevice
+
+logger = getLogger("device")
+
+
+class AgentRuntime:
+    """
+    Runs the agent loop of AI devices created with runAI=True.
+    """
+
+    # Whether devices need an AsyncOpenAI-style client rather than a blocking one.
+    usesAsyncClient = False
+
+    def start(self, device: "AIDevice") -> None:
+        raise NotImplementedError
+
+    def stop(self, device: "AIDevice") -> None:
+        pass
+
+    def shutdown(self, beforeStop: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        """
+        Stop every agent. Runtimes with their own event loop run beforeStop on it after the agents have unwound,
+        for cleanup such as closing async clients whose connections belong to that loop.
+        """
+        pass
+
+
+class ThreadAgentRuntime(AgentRuntime):
+    """
+    One daemon thread per device running the blocking AIDevice.run loop. Threads cannot be stopped.
+    """
+
+    def start(self, device: "AIDevice") -> None:
+        threading.Thread(target=device.run, name=f"agent-{device.node.uuid}", daemon=True).start()
+
+
+class AsyncioAgentRuntime(AgentRuntime):
+    """
+    Runs every device as a coroutine on one shared event loop, owned by a dedicated daemon thread.
+
+    Idle agents cost a suspended task rather than a thread, so one process can host thousands of them.
+    """
+
+    usesAsyncClient = True
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._tasks: Dict[UUID, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def runningCount(self) -> int:
+        with self._lock:
+            return sum(1 for task in self._tasks.values() if not task.done())
+
+    def start(self, device: "AIDevice") -> None:
+        loop = self._ensureLoop()
+        task = asyncio.run_coroutine_threadsafe(self._runDevice(device), loop)
+        with self._lock:
+            self._tasks[device.node.uuid] = task
+
+    def stop(self, device: "AIDevice") -> None:
+        with self._lock:
+            task = self._tasks.pop(device.node.uuid, None)
+        if task is not None:
+            task.cancel()
+
+    def shutdown(self, beforeStop: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        with self._lock:
+            tasks = list(self._tasks.values())
+            self._tasks.clear()
+            loop = self._loop
+            thread = self._thread
+            self._loop = None
+            self._thread = None
+        for task in tasks:
+            task.cancel()
+        if loop is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancelRemaining(), loop).result(timeout=1.0)
+            except Exception:
+                pass
+            if beforeStop is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(beforeStop(), loop).result(timeout=5.0)
+                except Exception:
+                    logger.exception("Agent runtime cleanup failed")
+            loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+
+    def _ensureLoop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="agent-runtime",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    @staticmethod
+    async def _cancelRemaining() -> None:
+        # Let cancelled agents unwind on the loop before it stops, so no task is left pending.
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _runDevice(self, device: "AIDevice") -> None:
+        try:
+            await device.runAsync()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s agent loop stopped", device.name)
+
+
+def createAgentRuntime(kind: str) -> AgentRuntime:
+    if kind == "thread":
+        return ThreadAgentRuntime()
+    if kind == "asyncio":
+        return AsyncioAgentRuntime()
+    raise ValueError(f"Unknown agent runtime: {kind}")
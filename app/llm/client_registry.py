@@ -0,0 +1,248 @@
+import asyncio
+import importlib.util
+import threading
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.tracing import getLogger
+
+logger = getLogger("device")
+
+# First httpcore trace events a request sees once the pool has handed it a connection, new or reused.
+POOL_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "connection.connect_unix_socket.started",
+    "http11.send_request_headers.started",
+    "http2.send_connection_init.started",
+    "http2.send_request_headers.started",
+)
+
+
+class ClientPoolConfig:
+    """
+    Connection pool settings applied to every client the registry builds.
+
+    Every device with the same endpoint and key shares one pool, so a connection limit caps concurrent completion
+    streams for the whole process. Both limits are off (None) unless configured; 0 in a spec also means no limit.
+    """
+
+    def __init__(
+        self,
+        maxConnections: Optional[int] = None,
+        maxKeepaliveConnections: Optional[int] = None,
+        keepaliveExpiry: float = 30.0,
+        http2: bool = True,
+    ) -> None:
+        self.maxConnections = maxConnections
+        self.maxKeepaliveConnections = maxKeepaliveConnections
+        self.keepaliveExpiry = keepaliveExpiry
+        self.http2 = http2
+
+    @classmethod
+    def fromSpec(cls, spec: str) -> "ClientPoolConfig":
+        """
+        Build a config from "key=value" pairs separated by commas, e.g. "maxConnections=200,http2=false".
+        """
+        config = cls()
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key in ("maxConnections", "maxKeepaliveConnections"):
+                setattr(config, key, int(value) or None)
+            elif key == "keepaliveExpiry":
+                config.keepaliveExpiry = float(value)
+            elif key == "http2":
+                config.http2 = value.lower() in ("1", "true", "yes", "on")
+            else:
+                raise ValueError(f"Unknown client pool option: {key}")
+        return config
+
+
+class ClientUsage:
+    """
+    Connection reuse counters for one pooled client, fed by httpcore trace events.
+    """
+
+    def __init__(self, baseUrl: Optional[str], asyncClient: bool, http2: bool) -> None:
+        self.baseUrl = baseUrl
+        self.asyncClient = asyncClient
+        self.http2 = http2
+        self.devices = 0
+        self.requests = 0
+        self.http2Requests = 0
+        self.connectionsOpened = 0
+        self.tlsHandshakes = 0
+        # Time requests spent waiting for a connection from the pool, up to their first connection event.
+        self.poolWaits = 0
+        self.poolWaitTotal = 0.0
+        self.poolWaitMax = 0.0
+        self._lock = threading.Lock()
+
+    def tracer(self) -> Callable[[str, Dict[str, Any]], None]:
+        """
+        Build the trace callback for one request, timing its wait for a pooled connection from now.
+        """
+        startedAt = perf_counter()
+        waiting = True
+
+        def onTrace(name: str, info: Dict[str, Any]) -> None:
+            nonlocal waiting
+            if waiting and name in POOL_ACQUIRED_EVENTS:
+                waiting = False
+                self.recordPoolWait(perf_counter() - startedAt)
+            self.onTrace(name, info)
+
+        return onTrace
+
+    def tracerAsync(self) -> Callable[[str, Dict[str, Any]], Awaitable[None]]:
+        onTrace = self.tracer()
+
+        async def onTraceAsync(name: str, info: Dict[str, Any]) -> None:
+            onTrace(name, info)
+
+        return onTraceAsync
+
+    def recordPoolWait(self, seconds: float) -> None:
+        with self._lock:
+            self.poolWaits += 1
+            self.poolWaitTotal += seconds
+            self.poolWaitMax = max(self.poolWaitMax, seconds)
+
+    def onTrace(self, name: str, info: Dict[str, Any]) -> None:
+        if name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connectionsOpened += 1
+        elif name == "connection.start_tls.complete":
+            with self._lock:
+                self.tlsHandshakes += 1
+        elif name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+            with self._lock:
+                self.requests += 1
+                if name.startswith("http2."):
+                    self.http2Requests += 1
+
+    def toDict(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.requests
+            opened = self.connectionsOpened
+            return {
+                "baseUrl": self.baseUrl,
+                "isAsync": self.asyncClient,
+                "http2Enabled": self.http2,
+                "devices": self.devices,
+                "requests": requests,
+                "http2Requests": self.http2Requests,
+                "connectionsOpened": opened,
+                "tlsHandshakes": self.tlsHandshakes,
+                "connectionReuseRate": round(1 - opened / requests, 4) if requests else None,
+                "poolWaitMeanMs": round(self.poolWaitTotal / self.poolWaits * 1e3, 3) if self.poolWaits else None,
+                "poolWaitMaxMs": round(self.poolWaitMax * 1e3, 3),
+            }
+
+
+class ClientRegistry:
+    """
+    Hands out one shared OpenAI client per (base_url, api_key, sync or async), so devices share a connection pool.
+    """
+
+    def __init__(self, config: Optional[ClientPoolConfig] = None) -> None:
+        self.config = config or ClientPoolConfig()
+        # HTTP/2 needs the optional h2 package; without it httpx only speaks HTTP/1.1.
+        self.http2 = self.config.http2 and importlib.util.find_spec("h2") is not None
+        if self.config.http2 and not self.http2:
+            logger.info("h2 is not installed; OpenAI clients will use HTTP/1.1")
+        self._clients: Dict[Tuple[Optional[str], Optional[str], bool], Tuple[Any, ClientUsage]] = {}
+        self._lock = threading.Lock()
+
+    def getClient(self, baseUrl: Optional[str] = None, apiKey: Optional[str] = None, asyncClient: bool = False) -> Any:
+        key = (baseUrl, apiKey, asyncClient)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = self._clients[key] = self._createClient(baseUrl, apiKey, asyncClient)
+            client, usage = entry
+            usage.devices += 1
+        return client
+
+    def releaseClient(self, client: Any) -> None:
+        """
+        Note that a device using client went away. Clients the registry did not hand out are ignored.
+        """
+        with self._lock:
+            for registered, usage in self._clients.values():
+                if registered is client:
+                    usage.devices = max(0, usage.devices - 1)
+                    return
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._clients.values())
+        return [usage.toDict() for _, usage in entries]
+
+    def close(self) -> None:
+        """
+        Close every client still registered. Async clients should be closed first with closeAsync() on the loop
+        that used them; any left here never opened a connection there and are closed on a loop of their own.
+        """
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for client, usage in entries:
+            if not usage.asyncClient:
+                client.close()
+                continue
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                asyncio.run(client.close())
+            else:
+                loop.create_task(client.close())
+
+    async def closeAsync(self) -> None:
+        """
+        Close the async clients, on the event loop their connections belong to.
+        """
+        with self._lock:
+            entries = [(key, entry) for key, entry in self._clients.items() if entry[1].asyncClient]
+            for key, _ in entries:
+                del self._clients[key]
+        for _, (client, _) in entries:
+            await client.close()
+
+    def _createClient(
+        self,
+        baseUrl: Optional[str],
+        apiKey: Optional[str],
+        asyncClient: bool,
+    ) -> Tuple[Any, ClientUsage]:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+        usage = ClientUsage(baseUrl, asyncClient, self.http2)
+        limits = httpx.Limits(
+            max_connections=self.config.maxConnections,
+            max_keepalive_connections=self.config.maxKeepaliveConnections,
+            keepalive_expiry=self.config.keepaliveExpiry,
+        )
+        clientConfig: Dict[str, Any] = {}
+        if apiKey:
+            clientConfig["api_key"] = apiKey
+        if baseUrl:
+            clientConfig["base_url"] = baseUrl
+        if asyncClient:
+            async def attachTraceAsync(request: httpx.Request) -> None:
+                request.extensions["trace"] = usage.tracerAsync()
+
+            httpClient = DefaultAsyncHttpxClient(
+                limits=limits,
+                http2=self.http2,
+                event_hooks={"request": [attachTraceAsync]},
+            )
+            return AsyncOpenAI(http_client=httpClient, **clientConfig), usage
+
+        def attachTrace(request: httpx.Request) -> None:
+            request.extensions["trace"] = usage.tracer()
+
+        httpClient = DefaultHttpxClient(limits=limits, http2=self.http2, event_hooks={"request": [attachTrace]})
+        return OpenAI(http_client=httpClient, **clientConfig), usage
@@ -0,0 +1,198 @@
+from collections import deque
+from time import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletionMessageParam, ChatCompletionSystemMessageParam
+
+from app.llm.scheduler import estimateTokens
+from app.metrics import contextMessagesEvicted
+
+SUMMARY_HEADER = "Summary of the earlier conversation, which is no longer shown in full:\n"
+
+
+class TimestampedMessage:
+    __slots__ = ("message", "timestamp", "isSystemMessage", "tokens")
+
+    def __init__(self, message: ChatCompletionMessageParam, timestamp: float, isSystemMessage: bool = False):
+        self.message = message
+        self.timestamp = timestamp
+        self.isSystemMessage = isSystemMessage
+        # Counted once here so the window total never has to re-scan the history.
+        self.tokens = estimateTokens((message,))
+
+
+class ContextWindowConfig:
+    """
+    Limits on the history an agent sends with each completion. A maxTokens of 0 disables the token budget.
+
+    Once the history passes maxTokens, the oldest messages are evicted until it fits in targetTokens. Messages older
+    than maxAge seconds trigger the same eviction, down to those younger than keepAge. With summarize on, evicted
+    messages are folded into a running summary by a background completion instead of being dropped outright.
+    """
+
+    def __init__(
+        self,
+        maxTokens: int = 24000,
+        targetTokens: int = 16000,
+        maxAge: float = 7200.0,
+        keepAge: float = 3600.0,
+        summarize: bool = False,
+    ) -> None:
+        self.maxTokens = maxTokens
+        self.targetTokens = targetTokens
+        self.maxAge = maxAge
+        self.keepAge = keepAge
+        self.summarize = summarize
+
+    @classmethod
+    def fromSpec(cls, spec: str) -> "ContextWindowConfig":
+        """
+        Build a config from "key=value" pairs separated by commas, e.g. "maxTokens=32000,summarize=true".
+        """
+        config = cls()
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key in ("maxTokens", "targetTokens"):
+                setattr(config, key, int(value))
+            elif key in ("maxAge", "keepAge"):
+                setattr(config, key, float(value))
+            elif key == "summarize":
+                config.summarize = value.lower() in ("1", "true", "yes", "on")
+            else:
+                raise ValueError(f"Unknown context window option: {key}")
+        if config.maxTokens > 0 and not 0 < config.targetTokens <= config.maxTokens:
+            raise ValueError("targetTokens must be between 1 and maxTokens")
+        return config
+
+
+class ConversationWindow:
+    """
+    One agent's conversation history with a running token count.
+
+    Iterating yields the system prompt, then the summary of evicted messages if there is one, then the kept
+    messages in order. Eviction always takes an assistant message together with the tool results that answer it,
+    so the history never starts with an orphaned tool message.
+    """
+
+    def __init__(self, systemPrompt: ChatCompletionSystemMessageParam, config: Optional[ContextWindowConfig] = None):
+        self.config = config or ContextWindowConfig()
+        self.systemMessage = TimestampedMessage(systemPrompt, time(), isSystemMessage=True)
+        self.summaryMessage: Optional[TimestampedMessage] = None
+        self._messages: Deque[TimestampedMessage] = deque()
+        self.tokens = self.systemMessage.tokens
+        # Evicted messages waiting to be folded into the summary, and whether a summary completion is running.
+        self._unsummarized: List[TimestampedMessage] = []
+        self._summarizing = False
+        # Written by the background summarizer, applied by the agent loop in trim().
+        self._finishedSummary: Optional[str] = None
+
+    def __iter__(self) -> Iterator[TimestampedMessage]:
+        yield self.systemMessage
+        if self.summaryMessage is not None:
+            yield self.summaryMessage
+        yield from self._messages
+
+    def __len__(self) -> int:
+        return len(self._messages) + (2 if self.summaryMessage is not None else 1)
+
+    def append(self, message: TimestampedMessage) -> None:
+        self._messages.append(message)
+        self.tokens += message.tokens
+
+    def params(self) -> List[ChatCompletionMessageParam]:
+        return [message.message for message in self]
+
+    def trim(self, now: Optional[float] = None) -> List[TimestampedMessage]:
+        """
+        Apply a finished summary, then evict old messages over the age or token limits. Return what was evicted.
+        """
+        if self._finishedSummary is not None:
+            self._applySummary()
+        config = self.config
+        now = time() if now is None else now
+        evicted: List[TimestampedMessage] = []
+        # Messages are appended in time order, so only the oldest one needs checking.
+        if self._messages and now - self._messages[0].timestamp >= config.maxAge:
+            while self._messages and now - self._messages[0].timestamp >= config.keepAge:
+                self._evictOldest(evicted)
+        if config.maxTokens > 0 and self.tokens > config.maxTokens:
+            # Keep at least the newest turn, which is the input the next completion has to answer.
+            while self.tokens > config.targetTokens and self._oldestGroupSize() < len(self._messages):
+                self._evictOldest(evicted)
+        if evicted:
+            contextMessagesEvicted.inc(len(evicted))
+            if config.summarize:
+                self._unsummarized.extend(evicted)
+        return evicted
+
+    def takeSummaryJob(self) -> Optional[Tuple[Optional[str], List[TimestampedMessage]]]:
+        """
+        Claim the evicted messages for a summary completion, or return None if there are none or one is running.
+
+        Returns the current summary text, to be extended, and the messages to fold into it.
+        """
+        if self._summarizing or not self._unsummarized:
+            return None
+        self._summarizing = True
+        messages = self._unsummarized
+        self._unsummarized = []
+        previous = self.summaryMessage.message["content"] if self.summaryMessage is not None else None
+        if isinstance(previous, str):
+            previous = previous[len(SUMMARY_HEADER):]
+        return previous, messages
+
+    def finishSummary(self, summary: Optional[str]) -> None:
+        """
+        Called from the summarizer with the new summary text, or None if the completion failed and the evicted
+        messages are simply dropped.
+        """
+        if summary:
+            self._finishedSummary = summary
+        self._summarizing = False
+
+    def _applySummary(self) -> None:
+        summary = self._finishedSummary
+        self._finishedSummary = None
+        if self.summaryMessage is not None:
+            self.tokens -= self.summaryMessage.tokens
+        self.summaryMessage = TimestampedMessage(
+            ChatCompletionSystemMessageParam(role="system", content=SUMMARY_HEADER + summary),
+            time(),
+            isSystemMessage=True,
+        )
+        self.tokens += self.summaryMessage.tokens
+
+    def _oldestGroupSize(self) -> int:
+        size = 1
+        while size < len(self._messages) and self._messages[size].message.get("role") == "tool":
+            size += 1
+        return size
+
+    def _evictOldest(self, evicted: List[TimestampedMessage]) -> None:
+        message = self._messages.popleft()
+        self.tokens -= message.tokens
+        evicted.append(message)
+        # Tool results cannot be sent without the assistant message that called them.
+        while self._messages and self._messages[0].message.get("role") == "tool":
+            result = self._messages.popleft()
+            self.tokens -= result.tokens
+            evicted.append(result)
+
+
+def summaryTranscript(messages: List[TimestampedMessage]) -> str:
+    """
+    Render evicted messages as plain text for the summarizer, one line per message or tool call.
+    """
+    lines: List[str] = []
+    for entry in messages:
+        message: Dict[str, Any] = entry.message  # type: ignore[assignment]
+        role = message.get("role", "unknown")
+        content = message.get("content")
+        if isinstance(content, str) and content:
+            lines.append(f"{role}: {content}")
+        for toolCall in message.get("tool_calls") or ():
+            function = toolCall["function"]
+            lines.append(f"{role} called {function['name']}({function['arguments']})")
+    return "\n".join(lines)
@@ -0,0 +1,435 @@
+"""
+A stand-in for the OpenAI chat completions API, for load-testing agents without spending API quota.
+
+FakeOpenAI and FakeAsyncOpenAI can replace OpenAI and AsyncOpenAI in-process. The same fake can also be served over
+HTTP, so real OpenAI clients can point at it with OPENAI_BASE_URL:
+
+    python -m app.llm.fake_openai --port 8001 --spec "tokensPerSecond=80,timeToFirstToken=0.3"
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import (
+    Choice,
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+)
+from openai.types.completion_usage import PromptTokensDetails
+
+RANDOM_TOOLS = ("talk", "whisper", "moveToRoom", "ping")
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+SPEAKER_PATTERN = re.compile(r"^(?:TALK|WHISPER|TEXT): (.+?) -> ", re.MULTILINE)
+ARGUMENT_PIECE_SIZE = 8
+# Prompt caching as the OpenAI API documents it: prompts of 1024 tokens or more, cached in 128-token blocks.
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CACHE_MAX_BLOCKS = 65536
+
+
+class FakeCompletionConfig:
+    """
+    Timing and behaviour of the fake backend.
+
+    When script is set, turns are replayed from it in order and wrap around. Each turn is a dict like
+    {"content": "...", "toolCalls": [{"name": "talk", "arguments": {...}}]}. Without a script, every turn writes a
+    short thought, and with probability toolCallRate it then calls one of tools at random.
+    """
+
+    def __init__(
+        self,
+        tokensPerSecond: float = 50.0,
+        timeToFirstToken: float = 0.2,
+        toolCallRate: float = 0.5,
+        tools: Iterable[str] = RANDOM_TOOLS,
+        script: Optional[List[Dict[str, Any]]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.tokensPerSecond = tokensPerSecond
+        self.timeToFirstToken = timeToFirstToken
+        self.toolCallRate = toolCallRate
+        self.tools = tuple(tools)
+        self.script = script
+        self.seed = seed
+
+    @classmethod
+    def fromSpec(cls, spec: str) -> "FakeCompletionConfig":
+        """
+        Build a config from "key=value" pairs separated by commas. Use script=<path> to load a JSON script, and
+        separate tool names with "|".
+        """
+        config = cls()
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key in ("tokensPerSecond", "timeToFirstToken", "toolCallRate"):
+                setattr(config, key, float(value))
+            elif key == "seed":
+                config.seed = int(value)
+            elif key == "tools":
+                config.tools = tuple(name for name in value.split("|") if name)
+            elif key == "script":
+                with open(value, encoding="utf-8") as file:
+                    config.script = json.load(file)
+            else:
+                raise ValueError(f"Unknown fake backend option: {key}")
+        return config
+
+
+class FakeTurn:
+    __slots__ = ("content", "toolCalls")
+
+    def __init__(self, content: str, toolCalls: List[Tuple[str, str]]) -> None:
+        self.content = content
+        # (function name, JSON arguments)
+        self.toolCalls = toolCalls
+
+
+class FakeTurnPlanner:
+    """
+    Decides what each completion says. One planner is shared by every stream created from the same client.
+    """
+
+    def __init__(self, config: FakeCompletionConfig) -> None:
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._scriptIndex = 0
+        self._lock = threading.Lock()
+
+    def plan(self, messages: List[Dict[str, Any]]) -> FakeTurn:
+        with self._lock:
+            if self.config.script:
+                step = self.config.script[self._scriptIndex % len(self.config.script)]
+                self._scriptIndex += 1
+                return FakeTurn(
+                    step.get("content", ""),
+                    [
+                        (call["name"], json.dumps(call.get("arguments", {}), ensure_ascii=False))
+                        for call in step.get("toolCalls", [])
+                    ],
+                )
+            return self._planRandom(messages)
+
+    def _planRandom(self, messages: List[Dict[str, Any]]) -> FakeTurn:
+        # The agent rejects tool calls that come without a written reason, so always think out loud first.
+        content = self._rng.choice((
+            "I'll respond to what just happened.",
+            "Let me check on the others in the room.",
+            "Nothing needs my attention right now.",
+        ))
+        if not self.config.tools or self._rng.random() >= self.config.toolCallRate:
+            return FakeTurn(content, [])
+        transcript = "\n".join(
+            message["content"] for message in messages
+            if message.get("role") == "user" and isinstance(message.get("content"), str)
+        )
+        name = self._rng.choice(self.config.tools)
+        if name == "whisper":
+            speakers = SPEAKER_PATTERN.findall(transcript)
+            if speakers:
+                return FakeTurn(content, [(name, json.dumps({"target": speakers[-1], "context": "Got it."}))])
+            name = "talk"
+        if name == "moveToRoom":
+            roomUuids = UUID_PATTERN.findall(transcript)
+            if roomUuids:
+                return FakeTurn(content, [(name, json.dumps({"roomUuid": self._rng.choice(roomUuids)}))])
+            name = "ping"
+        if name == "talk":
+            return FakeTurn(content, [(name, json.dumps({"target": "everyone", "context": "Hello, everyone."}))])
+        return FakeTurn(content, [(name, "{}")])
+
+
+class FakePromptCache:
+    """
+    Simulates provider-side prompt caching: a prompt hits for as many leading blocks as an earlier prompt shared.
+
+    Prompts are measured in characters, at four per token, over the JSON of the tools followed by the messages.
+    """
+
+    def __init__(self) -> None:
+        # Hashes of every block-aligned prefix seen so far, oldest first.
+        self._prefixes: OrderedDict[bytes, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, tools: Optional[Iterable[Any]], messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Return (prompt tokens, cached tokens) for a prompt, and remember its prefixes for later prompts.
+        """
+        prompt = json.dumps([list(tools or ()), messages], ensure_ascii=False, default=str)
+        promptTokens = len(prompt) // 4 + 1
+        blockSize = CACHE_BLOCK_TOKENS * 4
+        digest = hashlib.sha1()
+        cachedBlocks = 0
+        missed = False
+        with self._lock:
+            for start in range(0, len(prompt) - blockSize + 1, blockSize):
+                digest.update(prompt[start:start + blockSize].encode("utf-8"))
+                key = digest.digest()
+                if not missed and key in self._prefixes:
+                    cachedBlocks += 1
+                    self._prefixes.move_to_end(key)
+                else:
+                    missed = True
+                    self._prefixes[key] = None
+            while len(self._prefixes) > CACHE_MAX_BLOCKS:
+                self._prefixes.popitem(last=False)
+        if promptTokens < CACHE_MIN_TOKENS:
+            return promptTokens, 0
+        return promptTokens, cachedBlocks * CACHE_BLOCK_TOKENS
+
+
+def fakeUsage(turn: FakeTurn, promptTokens: int, cachedTokens: int) -> CompletionUsage:
+    completionText = turn.content + "".join(name + arguments for name, arguments in turn.toolCalls)
+    completionTokens = len(completionText) // 4 + 1
+    return CompletionUsage(
+        prompt_tokens=promptTokens,
+        completion_tokens=completionTokens,
+        total_tokens=promptTokens + completionTokens,
+        prompt_tokens_details=PromptTokensDetails(cached_tokens=cachedTokens),
+    )
+
+
+def iterChunks(
+    turn: FakeTurn,
+    model: str,
+    config: FakeCompletionConfig,
+    usage: Optional[CompletionUsage] = None,
+) -> Iterator[Tuple[float, ChatCompletionChunk]]:
+    """
+    Yield (delay before sending, chunk) pairs for one completion. With usage, a final chunk reports it, as the API
+    does when stream_options={"include_usage": True}.
+    """
+    completionId = f"chatcmpl-fake-{uuid4().hex}"
+    created = int(time())
+    tokenDelay = 1.0 / config.tokensPerSecond if config.tokensPerSecond > 0 else 0.0
+
+    def makeChunk(delta: ChoiceDelta, finishReason: Optional[str] = None) -> ChatCompletionChunk:
+        return ChatCompletionChunk(
+            id=completionId,
+            choices=[Choice(index=0, delta=delta, finish_reason=finishReason)],
+            created=created,
+            model=model,
+            object="chat.completion.chunk",
+        )
+
+    yield config.timeToFirstToken, makeChunk(ChoiceDelta(role="assistant"))
+    for word in re.findall(r"\S+\s*", turn.content):
+        yield tokenDelay, makeChunk(ChoiceDelta(content=word))
+    for index, (name, arguments) in enumerate(turn.toolCalls):
+        yield tokenDelay, makeChunk(ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+            index=index,
+            id=f"call_{uuid4().hex[:24]}",
+            type="function",
+            function=ChoiceDeltaToolCallFunction(name=name, arguments=""),
+        )]))
+        for start in range(0, len(arguments), ARGUMENT_PIECE_SIZE):
+            yield tokenDelay, makeChunk(ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+                index=index,
+                function=ChoiceDeltaToolCallFunction(arguments=arguments[start:start + ARGUMENT_PIECE_SIZE]),
+            )]))
+    yield 0.0, makeChunk(ChoiceDelta(), "tool_calls" if turn.toolCalls else "stop")
+    if usage is not None:
+        yield 0.0, ChatCompletionChunk(
+            id=completionId,
+            choices=[],
+            created=created,
+            model=model,
+            object="chat.completion.chunk",
+            usage=usage,
+        )
+
+
+class FakeStream:
+    """
+    Mirrors openai.Stream: iterate for chunks, close() to stop early.
+    """
+
+    def __init__(self, chunks: Iterator[Tuple[float, ChatCompletionChunk]]) -> None:
+        self._chunks = chunks
+        self._closed = threading.Event()
+
+    def __iter__(self) -> Iterator[ChatCompletionChunk]:
+        for delay, chunk in self._chunks:
+            # Waiting on the event lets close() from another thread cut a slow stream short.
+            if delay > 0 and self._closed.wait(delay):
+                return
+            if self._closed.is_set():
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def __enter__(self) -> "FakeStream":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class FakeAsyncStream:
+    """
+    Mirrors openai.AsyncStream: iterate with async for, await close() to stop early.
+    """
+
+    def __init__(self, chunks: Iterator[Tuple[float, ChatCompletionChunk]]) -> None:
+        self._chunks = chunks
+        self._closed = False
+
+    def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[ChatCompletionChunk]:
+        for delay, chunk in self._chunks:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._closed:
+                return
+            yield chunk
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class FakeChatCompletions:
+    def __init__(self, client: "FakeOpenAI") -> None:
+        self._client = client
+
+    def create(
+        self,
+        *,
+        model: str,
+        messages: Iterable[Dict[str, Any]],
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> FakeStream:
+        return FakeStream(self._client.startCompletion(model, messages, stream, **kwargs))
+
+
+class FakeAsyncChatCompletions(FakeChatCompletions):
+    async def create(
+        self,
+        *,
+        model: str,
+        messages: Iterable[Dict[str, Any]],
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> FakeAsyncStream:
+        return FakeAsyncStream(self._client.startCompletion(model, messages, stream, **kwargs))
+
+
+class FakeChat:
+    def __init__(self, completions: FakeChatCompletions) -> None:
+        self.completions = completions
+
+
+class FakeOpenAI:
+    """
+    In-process replacement for openai.OpenAI that covers chat.completions.create(stream=True).
+    """
+
+    def __init__(self, config: Optional[FakeCompletionConfig] = None) -> None:
+        self.config = config or FakeCompletionConfig()
+        self.planner = FakeTurnPlanner(self.config)
+        self.promptCache = FakePromptCache()
+        self.completionCount = 0
+        self._countLock = threading.Lock()
+        self.chat = FakeChat(self._createCompletions())
+
+    def _createCompletions(self) -> FakeChatCompletions:
+        return FakeChatCompletions(self)
+
+    def startCompletion(
+        self,
+        model: str,
+        messages: Iterable[Dict[str, Any]],
+        stream: bool,
+        tools: Optional[Iterable[Any]] = None,
+        stream_options: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Iterator[Tuple[float, ChatCompletionChunk]]:
+        if not stream:
+            raise ValueError("The fake backend only supports streaming completions")
+        messages = list(messages)
+        turn = self.planner.plan(messages)
+        with self._countLock:
+            self.completionCount += 1
+        usage = None
+        if stream_options and stream_options.get("include_usage"):
+            usage = fakeUsage(turn, *self.promptCache.lookup(tools, messages))
+        return iterChunks(turn, model, self.config, usage)
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """
+    In-process replacement for openai.AsyncOpenAI.
+    """
+
+    def _createCompletions(self) -> FakeChatCompletions:
+        return FakeAsyncChatCompletions(self)
+
+
+def createFakeOpenAIApp(config: Optional[FakeCompletionConfig] = None) -> Any:
+    """
+    Serve the fake backend at /v1/chat/completions using server-sent events, as the real API does.
+    """
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import StreamingResponse
+
+    config = config or FakeCompletionConfig()
+    planner = FakeTurnPlanner(config)
+    promptCache = FakePromptCache()
+    api = FastAPI(title="Fake OpenAI backend")
+
+    @api.get("/v1/models")
+    def listModels() -> Dict[str, Any]:
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "aihub"}]}
+
+    @api.post("/v1/chat/completions")
+    async def createChatCompletion(request: Request) -> StreamingResponse:
+        body = await request.json()
+        if not body.get("stream"):
+            raise HTTPException(status_code=400, detail="The fake backend only supports streaming completions")
+        messages = body.get("messages", [])
+        turn = planner.plan(messages)
+        usage = None
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = fakeUsage(turn, *promptCache.lookup(body.get("tools"), messages))
+
+        async def events():
+            for delay, chunk in iterChunks(turn, body.get("model", "fake"), config, usage):
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield f"data: {chunk.model_dump_json(exclude_none=True)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return api
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the fake OpenAI chat completions backend over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--spec", default="", help='options such as "tokensPerSecond=80,toolCallRate=0.3"')
+    args = parser.parse_args()
+    uvicorn.run(createFakeOpenAIApp(FakeCompletionConfig.fromSpec(args.spec)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
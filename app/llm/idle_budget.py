@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, Optional
+
+from app.metrics import idleTurnsSkipped, idleTurnsStarted
+
+RATE_WINDOW = 60.0
+# Keeps backoff ** idleTurns finite however long an agent has been idle.
+MAX_BACKOFF_STEPS = 32
+
+
+class IdleConfig:
+    """
+    How often agents take a turn when nothing happens around them.
+
+    After each consecutive idle turn an agent waits backoff times longer, starting from its own timeOut and up to
+    maxInterval seconds; any input resets it. A backoff of 1 keeps the interval fixed. turnsPerMinute caps idle
+    completions across every agent of a manager; 0 removes the cap.
+    """
+
+    def __init__(self, backoff: float = 2.0, maxInterval: float = 300.0, turnsPerMinute: int = 0) -> None:
+        self.backoff = backoff
+        self.maxInterval = maxInterval
+        self.turnsPerMinute = turnsPerMinute
+
+    @classmethod
+    def fromSpec(cls, spec: str) -> "IdleConfig":
+        """
+        Build a config from "key=value" pairs separated by commas, e.g. "backoff=2,maxInterval=600,turnsPerMinute=30".
+        """
+        config = cls()
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key in ("backoff", "maxInterval"):
+                setattr(config, key, float(value))
+            elif key == "turnsPerMinute":
+                config.turnsPerMinute = int(value)
+            else:
+                raise ValueError(f"Unknown idle turn option: {key}")
+        config.validate()
+        return config
+
+    def validate(self) -> None:
+        if self.backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        if self.maxInterval <= 0:
+            raise ValueError("maxInterval must be positive")
+        if self.turnsPerMinute < 0:
+            raise ValueError("turnsPerMinute must not be negative")
+
+    def toDict(self) -> Dict[str, Any]:
+        return {"backoff": self.backoff, "maxInterval": self.maxInterval, "turnsPerMinute": self.turnsPerMinute}
+
+
+class IdleBudget:
+    """
+    Paces idle turns: the per-agent backoff interval, and a sliding one-minute budget shared by every agent.
+
+    An agent whose idle turn finds the budget spent skips that turn and keeps waiting, so idle load stays bounded
+    however many agents are running.
+    """
+
+    def __init__(self, config: Optional[IdleConfig] = None) -> None:
+        self.config = config or IdleConfig()
+        self.skipped = 0
+        self._starts: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def configure(self, config: IdleConfig) -> None:
+        config.validate()
+        with self._lock:
+            self.config = config
+
+    def interval(self, timeOut: float, idleTurns: int) -> float:
+        """
+        Seconds an agent with this timeOut waits for input after idleTurns consecutive idle turns.
+        """
+        config = self.config
+        if idleTurns <= 0 or config.backoff == 1:
+            return timeOut
+        return min(timeOut * config.backoff ** min(idleTurns, MAX_BACKOFF_STEPS), max(timeOut, config.maxInterval))
+
+    def tryAcquire(self) -> bool:
+        """
+        Take one idle turn from the shared budget. Return False if the agent should skip this idle turn.
+        """
+        with self._lock:
+            now = monotonic()
+            self._trimWindow(now)
+            limit = self.config.turnsPerMinute
+            if limit > 0 and len(self._starts) >= limit:
+                self.skipped += 1
+                idleTurnsSkipped.inc()
+                return False
+            self._starts.append(now)
+        idleTurnsStarted.inc()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trimWindow(monotonic())
+            return {
+                **self.config.toDict(),
+                "turnsLastMinute": len(self._starts),
+                "skipped": self.skipped,
+            }
+
+    def _trimWindow(self, now: float) -> None:
+        while self._starts and now - self._starts[0] >= RATE_WINDOW:
+            self._starts.popleft()
@@ -0,0 +1,64 @@
+from typing import Optional
+
+# Weight of the newest inter-arrival gap in the running average.
+GAP_SMOOTHING = 0.3
+# How many typical gaps of silence end a burst.
+QUIET_GAPS = 2.0
+# Holdoff after the first interrupted stream; each further interruption doubles it.
+MIN_HOLDOFF = 0.05
+
+
+class InputCoalescer:
+    """
+    Decides how long an agent keeps collecting input after the first packet arrives, before it calls the model.
+
+    Two signals set the silence that ends a burst. A running average of the gaps between arriving packets makes the
+    agent wait a couple of typical gaps while input comes in bursts; gaps longer than maxWindow mean a quiet room.
+    On top of that, each stream abandoned for new input doubles a holdoff and each completed stream halves it, so
+    agents in a busy room wait longer. The whole wait never exceeds maxWindow, and a maxWindow of 0 turns
+    coalescing off.
+
+    observe() and quietGap() must be serialized by the caller; AIDevice holds its input condition for both.
+    """
+    __slots__ = ("maxWindow", "averageGap", "lastArrival", "holdoff")
+
+    def __init__(self, maxWindow: float = 0.0) -> None:
+        self.maxWindow = maxWindow
+        self.averageGap: Optional[float] = None
+        self.lastArrival: Optional[float] = None
+        self.holdoff = 0.0
+
+    def observe(self, now: float) -> None:
+        """
+        Record that a packet arrived at now.
+        """
+        if self.lastArrival is not None and self.maxWindow > 0:
+            # Long silences only need to read as quiet; capping them lets the next burst register within a few packets.
+            gap = min(now - self.lastArrival, 2 * self.maxWindow)
+            if self.averageGap is None:
+                self.averageGap = gap
+            else:
+                self.averageGap += GAP_SMOOTHING * (gap - self.averageGap)
+        self.lastArrival = now
+
+    def onStreamEnd(self, interrupted: bool) -> None:
+        if interrupted:
+            self.holdoff = min(self.maxWindow, max(2 * self.holdoff, MIN_HOLDOFF))
+        else:
+            self.holdoff /= 2
+
+    def quietGap(self) -> float:
+        """
+        Silence that ends the current burst, in seconds. 0 means start the completion now.
+        """
+        if self.maxWindow <= 0:
+            return 0.0
+        if self.averageGap is None or self.averageGap >= self.maxWindow:
+            return self.holdoff
+        return min(self.maxWindow, max(self.holdoff, QUIET_GAPS * self.averageGap))
+
+    def wakeAt(self, startedAt: float) -> float:
+        """
+        When a wait that began at startedAt should end if no further input arrives.
+        """
+        return min((self.lastArrival or startedAt) + self.quietGap(), startedAt + self.maxWindow)
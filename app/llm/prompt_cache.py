@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletionToolParam
+
+from app import metrics
+
+
+class PromptPrefix:
+    """
+    The static start of every completion request for one device configuration: system prompt text and tool schema.
+
+    Requests put these first and never vary them, so provider-side prompt caching can reuse them across turns and
+    across devices. cacheKey is sent as prompt_cache_key to route requests with the same prefix together.
+    """
+    __slots__ = ("systemText", "tools", "cacheKey", "tokens")
+
+    def __init__(self, model: str, systemText: str, tools: List[ChatCompletionToolParam]) -> None:
+        self.systemText = systemText
+        self.tools = tools
+        serialized = json.dumps([systemText, tools], ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(f"{model}\n{serialized}".encode("utf-8")).hexdigest()
+        self.cacheKey = f"aihub-{digest[:16]}"
+        self.tokens = len(serialized) // 4 + 1
+
+
+class PromptPrefixRegistry:
+    """
+    Builds each prefix once and hands the same object to every device that asks with the same key.
+    """
+
+    def __init__(self) -> None:
+        self._prefixes: Dict[Hashable, PromptPrefix] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, model: str, build: Callable[[], Tuple[str, List[ChatCompletionToolParam]]]) -> PromptPrefix:
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            with self._lock:
+                prefix = self._prefixes.get(key)
+                if prefix is None:
+                    systemText, tools = build()
+                    prefix = self._prefixes[key] = PromptPrefix(model, systemText, tools)
+        return prefix
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+
+class PromptCacheStats:
+    """
+    Token usage one device's completions reported, and how much of the prompt the provider served from its cache.
+    """
+
+    def __init__(self, deviceUuid: str) -> None:
+        self.requests = 0
+        self.promptTokens = 0
+        self.cachedTokens = 0
+        self.completionTokens = 0
+        self._promptCounter = metrics.llmPromptTokens.labels(deviceUuid)
+        self._cachedCounter = metrics.llmCachedPromptTokens.labels(deviceUuid)
+
+    @property
+    def hitRate(self) -> Optional[float]:
+        return self.cachedTokens / self.promptTokens if self.promptTokens else None
+
+    def record(self, usage: Any) -> int:
+        """
+        Add a CompletionUsage and return its total token count.
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        self.requests += 1
+        self.promptTokens += usage.prompt_tokens
+        self.cachedTokens += cached
+        self.completionTokens += usage.completion_tokens
+        self._promptCounter.inc(usage.prompt_tokens)
+        self._cachedCounter.inc(cached)
+        return usage.total_tokens
+
+    def toDict(self) -> Dict[str, Any]:
+        hitRate = self.hitRate
+        return {
+            "requests": self.requests,
+            "promptTokens": self.promptTokens,
+            "cachedTokens": self.cachedTokens,
+            "completionTokens": self.completionTokens,
+            "hitRate": round(hitRate, 4) if hitRate is not None else None,
+        }
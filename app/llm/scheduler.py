@@ -0,0 +1,271 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from math import inf
+from time import monotonic
+from typing import Any, Deque, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from app.enums.request_priority import RequestPriority
+from app.metrics import llmSchedulerWaitByPriority
+
+RATE_WINDOW = 60.0
+
+
+def estimateTokens(messages: Iterable[Any]) -> int:
+    """
+    Rough prompt size in tokens, at about four characters per token.
+    """
+    return sum(len(json.dumps(message, ensure_ascii=False, default=str)) for message in messages) // 4 + 1
+
+
+class SchedulerConfig:
+    """
+    Limits enforced by LLMScheduler. A limit of 0 disables it, and every limit is off unless configured, so
+    requests are only throttled once a deployment opts in.
+    """
+
+    def __init__(self, maxInFlight: int = 0, requestsPerMinute: int = 0, tokensPerMinute: int = 0) -> None:
+        self.maxInFlight = maxInFlight
+        self.requestsPerMinute = requestsPerMinute
+        self.tokensPerMinute = tokensPerMinute
+
+    @classmethod
+    def fromSpec(cls, spec: str) -> "SchedulerConfig":
+        """
+        Build a config from "key=value" pairs separated by commas, e.g. "maxInFlight=8,tokensPerMinute=200000".
+        """
+        config = cls()
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            key, value = (part.strip() for part in item.split("=", 1))
+            if key in ("maxInFlight", "requestsPerMinute", "tokensPerMinute"):
+                setattr(config, key, int(value))
+            else:
+                raise ValueError(f"Unknown LLM scheduler option: {key}")
+        return config
+
+
+class SchedulerTicket:
+    """
+    One completion request, from the moment it queues until it releases its slot.
+    """
+    __slots__ = ("deviceUuid", "priority", "tokens", "enqueuedAt", "grantedAt", "window", "_event", "_loop")
+
+    def __init__(self, deviceUuid: UUID, priority: RequestPriority, tokens: int) -> None:
+        self.deviceUuid = deviceUuid
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueuedAt = monotonic()
+        self.grantedAt: Optional[float] = None
+        # [start time, tokens] entry in the scheduler's rate window, corrected on release.
+        self.window: Optional[List[float]] = None
+        self._event: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def granted(self) -> bool:
+        return self.grantedAt is not None
+
+
+class LLMScheduler:
+    """
+    Admits completion requests from every device under shared concurrency and rate budgets.
+
+    Waiting requests are served by priority class first. Within a class, devices take turns round-robin, so one
+    chatty device cannot starve the others. Rate budgets use a sliding one-minute window of started requests.
+    """
+
+    def __init__(self, config: Optional[SchedulerConfig] = None) -> None:
+        self.config = config or SchedulerConfig()
+        self.inFlight = 0
+        self.grantedCount = 0
+        # priority -> device UUID -> that device's waiting tickets, oldest first.
+        self._queues: Dict[RequestPriority, Dict[UUID, Deque[SchedulerTicket]]] = {
+            priority: {} for priority in RequestPriority
+        }
+        # priority -> devices with waiting tickets, in round-robin order.
+        self._ready: Dict[RequestPriority, Deque[UUID]] = {priority: deque() for priority in RequestPriority}
+        self._window: Deque[List[float]] = deque()
+        self._windowTokens = 0.0
+        # Fires when a rate budget frees up while requests are still waiting.
+        self._retryTimer: Optional[threading.Timer] = None
+        self._retryAt = inf
+        self._lock = threading.Lock()
+
+    def acquire(self, deviceUuid: UUID, priority: RequestPriority, tokens: int = 0) -> SchedulerTicket:
+        """
+        Block until the request may start and return the ticket to pass to release().
+        """
+        ticket = SchedulerTicket(deviceUuid, priority, tokens)
+        ticket._event = threading.Event()
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        ticket._event.wait()
+        return ticket
+
+    async def acquireAsync(self, deviceUuid: UUID, priority: RequestPriority, tokens: int = 0) -> SchedulerTicket:
+        ticket = SchedulerTicket(deviceUuid, priority, tokens)
+        ticket._event = asyncio.Event()
+        ticket._loop = asyncio.get_running_loop()
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        try:
+            await ticket._event.wait()
+        except asyncio.CancelledError:
+            with self._lock:
+                if ticket.granted:
+                    self._releaseLocked(ticket, None)
+                    self._dispatch()
+                else:
+                    self._dequeue(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: SchedulerTicket, usedTokens: Optional[int] = None) -> None:
+        """
+        Free the ticket's slot. usedTokens, when known, replaces the estimate counted against the token budget.
+        """
+        with self._lock:
+            self._releaseLocked(ticket, usedTokens)
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trimWindow(monotonic())
+            return {
+                "inFlight": self.inFlight,
+                "granted": self.grantedCount,
+                "queued": {
+                    priority.name.lower(): sum(len(tickets) for tickets in self._queues[priority].values())
+                    for priority in RequestPriority
+                },
+                "requestsLastMinute": len(self._window),
+                "tokensLastMinute": int(self._windowTokens),
+            }
+
+    def _enqueue(self, ticket: SchedulerTicket) -> None:
+        queues = self._queues[ticket.priority]
+        tickets = queues.get(ticket.deviceUuid)
+        if tickets is None:
+            tickets = queues[ticket.deviceUuid] = deque()
+            self._ready[ticket.priority].append(ticket.deviceUuid)
+        tickets.append(ticket)
+
+    def _dequeue(self, ticket: SchedulerTicket) -> None:
+        queues = self._queues[ticket.priority]
+        tickets = queues.get(ticket.deviceUuid)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            del queues[ticket.deviceUuid]
+            self._ready[ticket.priority].remove(ticket.deviceUuid)
+
+    def _releaseLocked(self, ticket: SchedulerTicket, usedTokens: Optional[int]) -> None:
+        if ticket.grantedAt is None:
+            return
+        self.inFlight -= 1
+        if usedTokens is not None and ticket.window is not None:
+            self._windowTokens += usedTokens - ticket.window[1]
+            ticket.window[1] = usedTokens
+        # Guard against releasing the same ticket twice.
+        ticket.grantedAt = None
+        ticket.window = None
+
+    def _dispatch(self) -> None:
+        """
+        Grant as many waiting tickets as the budgets allow, and arm the retry timer if a rate budget blocks the rest.
+        """
+        config = self.config
+        now = monotonic()
+        while config.maxInFlight <= 0 or self.inFlight < config.maxInFlight:
+            ticket = self._peek()
+            if ticket is None:
+                return
+            retryIn = self._budgetDelay(ticket, now)
+            if retryIn > 0:
+                self._scheduleRetry(now + retryIn)
+                return
+            self._pop(ticket)
+            self._grant(ticket, now)
+
+    def _scheduleRetry(self, retryAt: float) -> None:
+        if self._retryTimer is not None and self._retryAt <= retryAt:
+            return
+        if self._retryTimer is not None:
+            self._retryTimer.cancel()
+        self._retryAt = retryAt
+        self._retryTimer = threading.Timer(max(retryAt - monotonic(), 0.0), self._onRetry)
+        self._retryTimer.daemon = True
+        self._retryTimer.start()
+
+    def _onRetry(self) -> None:
+        with self._lock:
+            self._retryTimer = None
+            self._retryAt = inf
+            self._dispatch()
+
+    def _peek(self) -> Optional[SchedulerTicket]:
+        for priority in RequestPriority:
+            ready = self._ready[priority]
+            if ready:
+                return self._queues[priority][ready[0]][0]
+        return None
+
+    def _pop(self, ticket: SchedulerTicket) -> None:
+        ready = self._ready[ticket.priority]
+        queues = self._queues[ticket.priority]
+        deviceUuid = ready.popleft()
+        tickets = queues[deviceUuid]
+        tickets.popleft()
+        if tickets:
+            # Back of the line, so other devices in the same class go first.
+            ready.append(deviceUuid)
+        else:
+            del queues[deviceUuid]
+
+    def _grant(self, ticket: SchedulerTicket, now: float) -> None:
+        self.inFlight += 1
+        self.grantedCount += 1
+        ticket.grantedAt = now
+        ticket.window = [now, float(ticket.tokens)]
+        self._window.append(ticket.window)
+        self._windowTokens += ticket.tokens
+        llmSchedulerWaitByPriority[ticket.priority].observe(now - ticket.enqueuedAt)
+        if ticket._loop is not None:
+            try:
+                ticket._loop.call_soon_threadsafe(ticket._event.set)
+            except RuntimeError:
+                pass
+        else:
+            ticket._event.set()
+
+    def _trimWindow(self, now: float) -> None:
+        while self._window and self._window[0][0] <= now - RATE_WINDOW:
+            _, tokens = self._window.popleft()
+            self._windowTokens -= tokens
+
+    def _budgetDelay(self, ticket: SchedulerTicket, now: float) -> float:
+        config = self.config
+        self._trimWindow(now)
+        if not self._window:
+            # An empty window always admits one request, even one larger than the whole token budget.
+            return 0.0
+        delay = 0.0
+        if config.requestsPerMinute > 0 and len(self._window) >= config.requestsPerMinute:
+            delay = self._window[len(self._window) - config.requestsPerMinute][0] + RATE_WINDOW - now
+        if config.tokensPerMinute > 0 and self._windowTokens + ticket.tokens > config.tokensPerMinute:
+            # Wait until enough of the oldest requests age out of the window.
+            excess = self._windowTokens + ticket.tokens - config.tokensPerMinute
+            for startedAt, tokens in self._window:
+                excess -= tokens
+                if excess <= 0:
+                    delay = max(delay, startedAt + RATE_WINDOW - now)
+                    break
+        # A small floor avoids spinning on float rounding at the window edge.
+        return max(delay, 0.001) if delay > 0 else 0.0
@@ -0,0 +1,47 @@
+class JsonCompletenessTracker:
+    """
+    Tells whether a JSON document fed one piece at a time has closed, without re-reading earlier pieces.
+
+    Only structure is tracked: string and escape state plus container depth. A closed document can still be invalid
+    JSON, so callers that need the value must still parse it once at the end.
+    """
+    __slots__ = ("depth", "inString", "escaped", "started")
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.inString = False
+        self.escaped = False
+        self.started = False
+
+    @property
+    def complete(self) -> bool:
+        return self.started and self.depth == 0 and not self.inString
+
+    def feed(self, text: str) -> None:
+        depth = self.depth
+        inString = self.inString
+        escaped = self.escaped
+        started = self.started
+        for char in text:
+            if inString:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    inString = False
+            elif char == '"':
+                inString = True
+                started = True
+            elif char == "{" or char == "[":
+                depth += 1
+                started = True
+            elif char == "}" or char == "]":
+                depth -= 1
+            elif not started and not char.isspace():
+                # A bare number or literal at the top level counts as complete as soon as it starts.
+                started = True
+        self.depth = depth
+        self.inString = inString
+        self.escaped = escaped
+        self.started = started
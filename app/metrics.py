@@ -0,0 +1,336 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from app.enums.action_type import ActionType
+from app.enums.request_priority import RequestPriority
+
+if TYPE_CHECKING:
+    from app.network.manager import Manager
+
+# Metrics are plain counters updated without locks so they can stay enabled on the packet path. Increments from
+# concurrent threads may very rarely be lost, which is acceptable for monitoring.
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class CounterFamily:
+    """
+    Counters sharing a name and one label. Call labels() once and keep the returned Counter on the hot path.
+    """
+
+    def __init__(self, name: str, help: str, labelName: str, labelValues: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelName = labelName
+        self.children: Dict[str, Counter] = {value: Counter() for value in labelValues}
+
+    def labels(self, value: str) -> Counter:
+        counter = self.children.get(value)
+        if counter is None:
+            counter = self.children.setdefault(value, Counter())
+        return counter
+
+    def remove(self, value: str) -> None:
+        self.children.pop(value, None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for value, counter in list(self.children.items()):
+            lines.append(f'{self.name}{{{self.labelName}="{value}"}} {formatValue(counter.value)}')
+        return lines
+
+
+class SimpleCounter(Counter):
+    __slots__ = ("name", "help")
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__()
+        self.name = name
+        self.help = help
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {formatValue(self.value)}"]
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # One slot per bucket plus the implicit +Inf bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"] + self.renderSamples()
+
+    def renderSamples(self, label: str = "") -> List[str]:
+        """
+        Render the bucket, sum and count lines. label is an extra 'key="value"' pair added to every sample.
+        """
+        lines = []
+        bucketPrefix = f"{label}," if label else ""
+        suffix = f"{{{label}}}" if label else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{bucketPrefix}le="{formatValue(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{{bucketPrefix}le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum{suffix} {formatValue(self.sum)}")
+        lines.append(f"{self.name}_count{suffix} {self.count}")
+        return lines
+
+
+class HistogramFamily:
+    """
+    Histograms sharing a name, buckets and one label.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelName: str,
+        labelValues: Iterable[str],
+        buckets: Sequence[float],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelName = labelName
+        self.children: Dict[str, Histogram] = {value: Histogram(name, help, buckets) for value in labelValues}
+
+    def labels(self, value: str) -> Histogram:
+        return self.children[value]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, histogram in self.children.items():
+            lines.extend(histogram.renderSamples(f'{self.labelName}="{value}"'))
+        return lines
+
+
+def formatValue(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def renderSamples(
+    name: str,
+    help: str,
+    metricType: str,
+    labelName: str,
+    samples: Iterable[Tuple[Optional[str], float]],
+) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {metricType}"]
+    for labelValue, value in samples:
+        if labelValue is None:
+            lines.append(f"{name} {formatValue(value)}")
+        else:
+            lines.append(f'{name}{{{labelName}="{labelValue}"}} {formatValue(value)}')
+    return lines
+
+
+packetsForwarded = CounterFamily(
+    "aihub_packets_forwarded_total",
+    "Packets handed across a connection, per action type.",
+    "type",
+    [actionType.value for actionType in ActionType],
+)
+# Pre-bound per ActionType so the packet path only does a dict lookup.
+packetsForwardedByType: Dict[ActionType, Counter] = {
+    actionType: packetsForwarded.labels(actionType.value) for actionType in ActionType
+}
+ttlExhaustedDrops = SimpleCounter(
+    "aihub_ttl_exhausted_drops_total",
+    "Packets dropped by Node.sendPacket or Node.multicastPacket because their TTL reached zero.",
+)
+hubPacketsReceived = CounterFamily(
+    "aihub_hub_packets_received_total",
+    "Packets received per room hub.",
+    "hub",
+)
+routeLookupHits = SimpleCounter(
+    "aihub_route_lookup_hits_total",
+    "RoomHub.findRoute calls answered from a neighbour, the route table or the topology cache.",
+)
+discoveryRequests = SimpleCounter(
+    "aihub_discovery_requests_total",
+    "Route discoveries flooded by RoomHub.findRoute, including retries.",
+)
+discoverySuppressed = SimpleCounter(
+    "aihub_discovery_suppressed_total",
+    "Duplicate DISCOVERY_REQUEST packets dropped by the per-hub seen cache.",
+)
+discoveryWaitersDropped = SimpleCounter(
+    "aihub_discovery_waiters_dropped_total",
+    "Packets waiting on a route discovery that were dropped: the discovery expired or was abandoned, or too many "
+    "packets were already waiting.",
+)
+hopLatency = Histogram(
+    "aihub_hop_delivery_latency_seconds",
+    "Time a packet waited in a delivery inbox before its node received it. Only queued delivery engines "
+    "(thread, asyncio) observe it; the sync engine has no inbox and leaves it empty.",
+    (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+contextMessagesEvicted = SimpleCounter(
+    "aihub_context_messages_evicted_total",
+    "Messages dropped from agent histories by the context window's age or token limits.",
+)
+contextSummaries = SimpleCounter(
+    "aihub_context_summaries_total",
+    "Background completions that folded evicted messages into an agent's running summary.",
+)
+promptTokens = Histogram(
+    "aihub_llm_request_prompt_tokens",
+    "Estimated prompt size of each agent completion request, in tokens.",
+    (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+timeToFirstAction = Histogram(
+    "aihub_llm_time_to_first_action_seconds",
+    "Time from the start of a completion to its first tool call being executed.",
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+inputCoalesceWait = Histogram(
+    "aihub_agent_input_coalesce_seconds",
+    "Time an agent kept collecting input after the first packet arrived, before it started a completion.",
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+turnInputPackets = Histogram(
+    "aihub_agent_turn_input_packets",
+    "Packets folded into each agent turn that had input.",
+    (1, 2, 3, 5, 8, 13, 21, 50),
+)
+idleTurnsStarted = SimpleCounter(
+    "aihub_agent_idle_turns_total",
+    "Agent turns started because nothing happened for the agent's idle interval.",
+)
+idleTurnsSkipped = SimpleCounter(
+    "aihub_agent_idle_turns_skipped_total",
+    "Idle turns skipped because the shared idle budget for the last minute was spent.",
+)
+llmStreamsInterrupted = SimpleCounter(
+    "aihub_llm_streams_interrupted_total",
+    "Agent completions abandoned mid-stream because new input arrived.",
+)
+llmWastedTokens = CounterFamily(
+    "aihub_llm_wasted_tokens_total",
+    "Estimated tokens spent on abandoned completions: their prompt, and what they streamed before being cut off.",
+    "kind",
+    ["prompt", "completion"],
+)
+llmWastedPromptTokens = llmWastedTokens.labels("prompt")
+llmWastedCompletionTokens = llmWastedTokens.labels("completion")
+llmPromptTokens = CounterFamily(
+    "aihub_llm_prompt_tokens_total",
+    "Prompt tokens reported by the provider, per device.",
+    "device",
+)
+llmCachedPromptTokens = CounterFamily(
+    "aihub_llm_cached_prompt_tokens_total",
+    "Prompt tokens the provider served from its prompt cache, per device.",
+    "device",
+)
+llmSchedulerWait = HistogramFamily(
+    "aihub_llm_scheduler_wait_seconds",
+    "Time a completion request waited in the LLM scheduler before it was allowed to start.",
+    "priority",
+    [priority.name.lower() for priority in RequestPriority],
+    (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0),
+)
+# Pre-bound per RequestPriority like packetsForwardedByType.
+llmSchedulerWaitByPriority: Dict[RequestPriority, Histogram] = {
+    priority: llmSchedulerWait.labels(priority.name.lower()) for priority in RequestPriority
+}
+
+
+def render(manager: Optional["Manager"] = None) -> str:
+    lines: List[str] = []
+    for metric in (
+        packetsForwarded,
+        ttlExhaustedDrops,
+        hubPacketsReceived,
+        routeLookupHits,
+        discoveryRequests,
+        discoverySuppressed,
+        discoveryWaitersDropped,
+        hopLatency,
+        llmSchedulerWait,
+        contextMessagesEvicted,
+        contextSummaries,
+        promptTokens,
+        timeToFirstAction,
+        inputCoalesceWait,
+        turnInputPackets,
+        idleTurnsStarted,
+        idleTurnsSkipped,
+        llmStreamsInterrupted,
+        llmWastedTokens,
+        llmPromptTokens,
+        llmCachedPromptTokens,
+    ):
+        lines.extend(metric.render())
+    if manager is not None:
+        hubs = manager.getRoomHubs()
+        lines.extend(renderSamples(
+            "aihub_route_table_entries",
+            "Learned routes currently held per room hub.",
+            "gauge",
+            "hub",
+            [(str(hub.node.uuid), len(hub.routeTable)) for hub in hubs],
+        ))
+        lines.extend(renderSamples(
+            "aihub_pending_discoveries",
+            "Route discoveries currently in flight per room hub.",
+            "gauge",
+            "hub",
+            [(str(hub.node.uuid), len(hub.pendingDiscoveries)) for hub in hubs],
+        ))
+        pendingCount = getattr(manager.deliveryEngine, "pendingCount", None)
+        if pendingCount is not None:
+            lines.extend(renderSamples(
+                "aihub_delivery_queue_depth",
+                "Packets waiting in delivery inboxes.",
+                "gauge",
+                "",
+                [(None, pendingCount())],
+            ))
+            lines.extend(renderSamples(
+                "aihub_delivery_dropped_packets_total",
+                "Packets dropped because a delivery inbox stayed full.",
+                "counter",
+                "",
+                [(None, manager.deliveryEngine.droppedCount)],
+            ))
+        schedulerStats = manager.llmScheduler.stats()
+        lines.extend(renderSamples(
+            "aihub_llm_requests_in_flight",
+            "Completion requests currently holding an LLM scheduler slot.",
+            "gauge",
+            "",
+            [(None, schedulerStats["inFlight"])],
+        ))
+        lines.extend(renderSamples(
+            "aihub_llm_requests_queued",
+            "Completion requests waiting in the LLM scheduler, per priority.",
+            "gauge",
+            "priority",
+            list(schedulerStats["queued"].items()),
+        ))
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,19 @@
 from typing import Optional
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from app.enums.action_type import ActionType
 
 class ActionPacket(BaseModel):
+    """
+    Validated packet schema used at the API/WebSocket boundary. The network layer uses app.network.packet.Packet.
+    """
+    model_config = ConfigDict(frozen=True)
+
     type: ActionType
     sender: UUID
     recipient: Optional[UUID] = None
     context: Optional[str] = None
     ttl: int = 128
     originalTtl: int = 128
+    requestId: Optional[UUID] = None
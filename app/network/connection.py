@@ -2,7 +2,8 @@ from typing import Optional, TYPE_CHECKING
 from uuid import UUID
 
 from app.network.node import Node
-from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
+from app.metrics import packetsForwardedByType
 
 if TYPE_CHECKING:
     from app.network.manager import Manager
@@ -18,22 +19,33 @@ class Connection:
         self.node1 = node1
         self.node2 = node2
         self.manager = manager or getattr(node1, "manager", None) or getattr(node2, "manager", None)
-        self.node1.connections.append(self)
-        self.node2.connections.append(self)
+        self.node1.addConnection(self)
+        self.node2.addConnection(self)
 
     def hasNode(self, uuid: UUID) -> bool:
         return self.node1.uuid == uuid or self.node2.uuid == uuid
 
-    def transferPacket(self, sender: Node, packet: ActionPacket) -> None:
-        packetCopy = packet.model_copy(deep=True)
+    def transferPacket(self, sender: Node, packet: Packet) -> None:
         if sender == self.node1:
             target = self.node2
         elif sender == self.node2:
             target = self.node1
         else:
             raise ValueError("Sender is not connected to this connection")
-        self._notifyPacketTransfer(sender, target, packetCopy)
-        target.receivePacket(packetCopy)
+        packetsForwardedByType[packet.type].inc()
+        self._notifyPacketTransfer(sender, target, packet)
+        if self.manager:
+            self.manager.deliveryEngine.deliver(target, packet)
+        else:
+            target.receivePacket(packet)
+
+    def getPeer(self, node: Node) -> Node:
+        if node == self.node1:
+            return self.node2
+        elif node == self.node2:
+            return self.node1
+        else:
+            raise ValueError("Node is not connected to this connection")
 
     def getPeerUuid(self, node: Node) -> UUID:
         if node == self.node1:
@@ -47,7 +59,7 @@ class Connection:
         self.node1.removeConnection(self)
         self.node2.removeConnection(self)
 
-    def _notifyPacketTransfer(self, source: Node, target: Node, packet: ActionPacket) -> None:
+    def _notifyPacketTransfer(self, source: Node, target: Node, packet: Packet) -> None:
         manager = self.manager or getattr(source, "manager", None) or getattr(target, "manager", None)
         if not manager:
             return
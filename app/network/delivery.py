@@ -0,0 +1,232 @@
+import asyncio
+import threading
+from collections import deque
+from time import perf_counter
+from typing import Deque, Dict, Optional, Tuple, TYPE_CHECKING
+from uuid import UUID
+
+from app.network.packet import Packet
+from app.tracing import getLogger
+from app.metrics import hopLatency
+
+if TYPE_CHECKING:
+    from app.network.node import Node
+
+logger = getLogger("delivery")
+
+
+class DeliveryEngine:
+    """
+    Hands packets that crossed a Connection to the receiving node.
+    """
+
+    def deliver(self, target: "Node", packet: Packet) -> None:
+        raise NotImplementedError
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class SynchronousDeliveryEngine(DeliveryEngine):
+    """
+    Delivers on the sender's call stack. Forwarding recurses once per hop.
+    """
+
+    def deliver(self, target: "Node", packet: Packet) -> None:
+        target.receivePacket(packet)
+
+
+class QueuedDeliveryEngine(DeliveryEngine):
+    """
+    Buffers packets in bounded per-node inboxes that a scheduler drains round-robin.
+
+    Each inbox is FIFO, so packets on a link arrive in the order they were sent. When an inbox is full, an outside
+    thread blocks for up to putTimeout seconds. A scheduler thread never blocks, because it is the only one that
+    can free space, so it drops the packet instead.
+    """
+
+    def __init__(self, maxInboxSize: int = 1024, putTimeout: float = 1.0) -> None:
+        self.maxInboxSize = maxInboxSize
+        self.putTimeout = putTimeout
+        self.deliveredCount = 0
+        self.droppedCount = 0
+        self._inboxes: Dict[UUID, Deque[Tuple["Node", Packet, float]]] = {}
+        self._ready: Deque[UUID] = deque()
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def deliver(self, target: "Node", packet: Packet) -> None:
+        with self._condition:
+            inbox = self._inboxes.get(target.uuid)
+            if inbox is None:
+                inbox = self._inboxes[target.uuid] = deque()
+            if len(inbox) >= self.maxInboxSize:
+                if not self._canBlock() or not self._condition.wait_for(
+                    lambda: len(inbox) < self.maxInboxSize,
+                    timeout=self.putTimeout,
+                ):
+                    self.droppedCount += 1
+                    return
+            if not inbox:
+                self._ready.append(target.uuid)
+            inbox.append((target, packet, perf_counter()))
+            self._condition.notify_all()
+        self._onWork()
+
+    def pendingCount(self) -> int:
+        with self._condition:
+            return sum(len(inbox) for inbox in self._inboxes.values())
+
+    def drain(self, limit: Optional[int] = None) -> int:
+        """
+        Deliver up to limit queued packets (all of them when limit is None) and return how many were delivered.
+        """
+        delivered = 0
+        self._local.draining = True
+        try:
+            while limit is None or delivered < limit:
+                with self._condition:
+                    if not self._ready:
+                        break
+                    nodeUuid = self._ready.popleft()
+                    inbox = self._inboxes[nodeUuid]
+                    target, packet, enqueuedAt = inbox.popleft()
+                    if inbox:
+                        self._ready.append(nodeUuid)
+                    else:
+                        del self._inboxes[nodeUuid]
+                    self._condition.notify_all()
+                hopLatency.observe(perf_counter() - enqueuedAt)
+                try:
+                    target.receivePacket(packet)
+                except Exception:
+                    logger.exception("Packet delivery to %s failed", target.uuid)
+                delivered += 1
+        finally:
+            self._local.draining = False
+        with self._condition:
+            self.deliveredCount += delivered
+        return delivered
+
+    def _canBlock(self) -> bool:
+        return not getattr(self._local, "draining", False)
+
+    def _onWork(self) -> None:
+        pass
+
+
+class ThreadedDeliveryEngine(QueuedDeliveryEngine):
+    """
+    Drains inboxes on a dedicated daemon worker thread, started lazily on the first delivery.
+    """
+
+    def __init__(self, maxInboxSize: int = 1024, putTimeout: float = 1.0) -> None:
+        super().__init__(maxInboxSize=maxInboxSize, putTimeout=putTimeout)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        with self._condition:
+            self._stopped = False
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="packet-delivery", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.putTimeout)
+
+    def _onWork(self) -> None:
+        if self._thread is None and not self._stopped:
+            self.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stopped or bool(self._ready))
+                if self._stopped:
+                    return
+            self.drain(limit=self.maxInboxSize)
+
+
+class AsyncioDeliveryEngine(QueuedDeliveryEngine):
+    """
+    Drains inboxes from a task on an asyncio event loop, yielding to the loop between batches.
+
+    Packets queued before start() is called are delivered once the task is running.
+    """
+
+    def __init__(self, maxInboxSize: int = 1024, putTimeout: float = 1.0, batchSize: int = 64) -> None:
+        super().__init__(maxInboxSize=maxInboxSize, putTimeout=putTimeout)
+        self.batchSize = batchSize
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        if self._task is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self._wakeup = None
+        self._loop = None
+
+    def _canBlock(self) -> bool:
+        # Blocking the loop thread would prevent the drain task from ever freeing space.
+        if not super()._canBlock():
+            return False
+        try:
+            return asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            return True
+
+    def _onWork(self) -> None:
+        loop = self._loop
+        wakeup = self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            if asyncio.get_running_loop() is loop:
+                wakeup.set()
+                return
+        except RuntimeError:
+            pass
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        wakeup = self._wakeup
+        while True:
+            wakeup.clear()
+            if self.drain(limit=self.batchSize) == 0:
+                await wakeup.wait()
+            else:
+                await asyncio.sleep(0)
+
+
+def createDeliveryEngine(kind: str, maxInboxSize: int = 1024) -> DeliveryEngine:
+    if kind == "sync":
+        return SynchronousDeliveryEngine()
+    if kind == "thread":
+        return ThreadedDeliveryEngine(maxInboxSize=maxInboxSize)
+    if kind == "asyncio":
+        return AsyncioDeliveryEngine(maxInboxSize=maxInboxSize)
+    raise ValueError(f"Unknown delivery engine: {kind}")
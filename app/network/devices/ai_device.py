@@ -1,32 +1,136 @@
 import os
 import json
+import asyncio
+import logging
 import threading
-import traceback
 from datetime import datetime
 from uuid import UUID
-from typing import Any, Dict, Iterable, List, Optional, Callable, TYPE_CHECKING
-from time import time, sleep
+from typing import Any, Dict, Iterable, List, Optional, Callable, TYPE_CHECKING, Tuple
+from time import time
 
-from openai import OpenAI, Stream
+from openai import AsyncStream, OpenAI, Stream
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletionSystemMessageParam, ChatCompletionAssistantMessageParam, ChatCompletionUserMessageParam, ChatCompletionMessageToolCallParam, ChatCompletionToolParam, ChatCompletionChunk, ChatCompletionToolMessageParam
 from openai.types.chat.chat_completion_message_tool_call_param import Function
 from openai.types.shared_params import FunctionDefinition
 
 from app.network.manager import Manager
-from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
+from app.network.pending_requests import PendingRequests
 from app.enums.action_type import ActionType
+from app.enums.request_priority import RequestPriority
+from app.llm.input_coalescing import InputCoalescer
+from app.llm.prompt_cache import PromptCacheStats, PromptPrefix
+from app.llm.streaming_json import JsonCompletenessTracker
+from app.llm.context_window import ContextWindowConfig, ConversationWindow, TimestampedMessage, summaryTranscript
+from app.llm.scheduler import estimateTokens
+from app.metrics import (
+    contextSummaries,
+    inputCoalesceWait,
+    llmStreamsInterrupted,
+    llmWastedCompletionTokens,
+    llmWastedPromptTokens,
+    promptTokens,
+    timeToFirstAction,
+    turnInputPackets,
+)
+from app.tracing import getLogger
 
 if TYPE_CHECKING:
     from app.network.devices.room_hub import RoomHub
 
-class TimestampedMessage:
-    def __init__(self, message: ChatCompletionMessageParam, timestamp: float, isSystemMessage: bool = False):
-        self.message = message
-        self.timestamp = timestamp
-        self.isSystemMessage = isSystemMessage
+logger = getLogger("device")
+
+# Tools that send a request packet and can wait for the matching response when requestTimeout is set.
+REQUEST_TOOLS = ("getAdjacentRooms", "getCurrentRoomName", "moveToRoom", "ping")
+
+class AgentTurnState:
+    """
+    Conversation and control flags carried from one agent turn to the next.
+    """
+    __slots__ = (
+        "messages", "skipCheck", "needsThinking", "needsCallFunction", "lastTriedFunctions", "priority", "summaryTask",
+        "idleTurns",
+    )
+
+    def __init__(
+        self,
+        systemPrompt: ChatCompletionSystemMessageParam,
+        contextConfig: Optional[ContextWindowConfig] = None,
+    ) -> None:
+        self.messages = ConversationWindow(systemPrompt, contextConfig)
+        self.skipCheck = False
+        self.needsThinking = False
+        self.needsCallFunction = False
+        self.lastTriedFunctions = False
+        # Scheduler priority of the next completion request.
+        self.priority = RequestPriority.NORMAL
+        # Keeps the asyncio runtime's background summary task referenced while it runs.
+        self.summaryTask: Optional[asyncio.Task] = None
+        # Consecutive turns taken with nothing happening; drives the idle backoff.
+        self.idleTurns = 0
+
+class StreamedTurn:
+    """
+    Accumulates one streamed completion.
+
+    Content and argument deltas are collected in lists and joined once, and argument completeness is tracked
+    incrementally, so each chunk costs the same however long the output grows.
+    """
+    __slots__ = (
+        "logChunks", "messageParts", "functionId", "functionNameCache", "argumentParts", "argumentsTracker",
+        "functionsCache", "completionStartTime", "responseId", "responseCreated", "finishReason", "streamInterrupted",
+        "usage", "dispatchedResults", "earlyEvents", "firstActionAt", "promptTokens",
+    )
+
+    def __init__(self, logChunks: bool = False, promptTokens: int = 0) -> None:
+        self.logChunks = logChunks
+        # Estimated prompt size of the request, counted as wasted if the stream is abandoned.
+        self.promptTokens = promptTokens
+        self.messageParts: List[str] = []
+        self.functionId: Optional[str] = None
+        self.functionNameCache = ""
+        self.argumentParts: List[str] = []
+        self.argumentsTracker = JsonCompletenessTracker()
+        self.functionsCache: dict[str, tuple[str, str]] = {}
+        self.completionStartTime = time()
+        self.responseId: Optional[str] = None
+        self.responseCreated: Optional[int] = None
+        self.finishReason: Optional[str] = None
+        self.streamInterrupted = False
+        # CompletionUsage from the final chunk, when the stream ran to the end.
+        self.usage: Optional[Any] = None
+        # Replies of tool calls already run while the stream was still going, by tool call id.
+        self.dispatchedResults: dict[str, str] = {}
+        # Events of those tool calls, held back until the assistant message they belong to has been emitted.
+        self.earlyEvents: dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self.firstActionAt: Optional[float] = None
+
+    def startFunction(self, functionId: str) -> None:
+        self.flushFunction()
+        self.functionId = functionId
+        self.functionNameCache = ""
+        self.argumentParts = []
+        self.argumentsTracker = JsonCompletenessTracker()
+
+    def flushFunction(self) -> None:
+        if self.functionId is not None:
+            self.functionsCache[self.functionId] = (self.functionNameCache, "".join(self.argumentParts))
+
+    def joinMessage(self) -> Optional[str]:
+        return "".join(self.messageParts) or None
+
+    def streamedTokens(self) -> int:
+        """
+        Rough count of the tokens streamed so far, at about four characters per token.
+        """
+        chars = sum(len(part) for part in self.messageParts)
+        chars += sum(len(name) + len(arguments) for name, arguments in self.functionsCache.values())
+        if self.functionId is not None and self.functionId not in self.functionsCache:
+            chars += len(self.functionNameCache) + sum(len(part) for part in self.argumentParts)
+        return chars // 4
 
 class AIDevice:
-    def __init__(self, name: str, manager: Manager, client: OpenAI, situation: str = "", runAI: bool = True, model: str = "gpt-4o", isReasoning: bool = False, debug: bool = False, coolTime: float = 0.2, timeOut: float = 10) -> None:
+    def __init__(self, name: str, manager: Manager, client: OpenAI, situation: str = "", runAI: bool = True, model: str = "gpt-4o", isReasoning: bool = False, debug: bool = False, coolTime: float = 0.2, timeOut: float = 10, earlyToolDispatch: bool = False, requestTimeout: float = 0.0, coalesceWindow: float = 0.0, openaiExtensions: bool = True) -> None:
         self.name = name
         self.manager = manager
         self.node = self.manager.createNode(self.onPacketReceived)
@@ -38,19 +142,41 @@ class AIDevice:
         self.coolTime = coolTime
         self.timeOut = timeOut
         self.runAI = runAI
-        self.cachePackets: List[ActionPacket] = []
+        # Run each tool call as soon as its arguments are complete instead of after the whole stream.
+        self.earlyToolDispatch = earlyToolDispatch
+        # With a positive timeout, request/response tools wait this long for the answer and return it directly.
+        self.requestTimeout = requestTimeout
+        self.pendingRequests = PendingRequests()
+        # Longest time to keep collecting a burst of input before calling the model; 0 starts at the first packet.
+        self.coalesceWindow = coalesceWindow
+        self.inputCoalescer = InputCoalescer(coalesceWindow)
+        # System prompt text and tool schema, built once and shared by every device of this class and model.
+        self.promptPrefix: PromptPrefix = self.manager.promptPrefixes.get(
+            (type(self), model),
+            model,
+            lambda: (self.generateStaticSystemPrompt(), self.buildTools()),
+        )
+        self.promptCacheStats = PromptCacheStats(str(self.node.uuid))
+        # prompt_cache_key and stream_options are OpenAI extensions that other compatible servers may reject.
+        self.openaiExtensions = openaiExtensions
+        self.cachePackets: List[Packet] = []
+        # Signalled whenever a packet lands in cachePackets so the run loop can sleep until there is input.
+        self._inputCondition = threading.Condition()
+        # Set by waitForInputAsync while a coroutine agent is waiting on its event loop.
+        self._inputLoop: Optional[asyncio.AbstractEventLoop] = None
+        self._inputEvent: Optional[asyncio.Event] = None
         self.hubUuid: Optional[UUID] = None
         self.isStreaming = False
 
         self.wellKnownNames: dict[str, UUID] = {}
-        self.connectionCallbacks: dict[UUID, Callable[[ActionPacket], None]] = {}
+        self.connectionCallbacks: dict[UUID, Callable[[Packet], None]] = {}
         self._eventListeners: List[Callable[[dict[str, Any]], None]] = []
         self._eventListenersLock = threading.Lock()
         self.moveHubRequestResult: Optional[bool] = None
         self.privacyMode = False
         self.manager.registerDevice(self)
         if runAI:
-            threading.Thread(target=self.run, daemon=True).start()
+            self.manager.agentRuntime.start(self)
 
     def registerEventListener(self, listener: Callable[[dict[str, Any]], None]) -> None:
         addedListener = False
@@ -80,7 +206,7 @@ class AIDevice:
                 listener(event)
             except Exception:
                 if self.debug:
-                    print(traceback.format_exc())
+                    logger.exception("%s event listener failed", self.name)
 
     def _serializeReasoning(self, reasoning: Any) -> Any:
         if reasoning is None:
@@ -133,439 +259,757 @@ class AIDevice:
             pass
 
     def run(self) -> None:
-        messages: List[TimestampedMessage] = [
-            TimestampedMessage(self.generateSystemPrompt(), time(), isSystemMessage=True)
-        ]
-        skipCheck = False
-        needsThinking = False
-        needsCallFunction = False
-        lastTriedFunctions = False
+        state = AgentTurnState(self.generateSystemPrompt(), self.manager.contextConfig)
         while True:
-            currentTime = time()
-            # Check if any non-excluded message is older than 2 hours
-            if any(currentTime - msg.timestamp >= 7200 and not msg.isSystemMessage for msg in messages):
-                removedMessages = []
-                newMessages = []
-                for msg in messages:
-                    if msg.isSystemMessage or currentTime - msg.timestamp < 3600:
-                        newMessages.append(msg)
-                    else:
-                        removedMessages.append(msg)
-                messages = newMessages
-                # Process removed messages here
-                # For example, log them or handle them as needed
-
-            checkStartTime = currentTime
-            while len(self.cachePackets) == 0 and not skipCheck:
-                if time() - checkStartTime > self.timeOut:
-                    break
-                sleep(0.1)
-            userMessage = ""
-            for packet in self.cachePackets:
-                sender: UUID | str = packet.sender
-                recipient: Optional[UUID | str] = packet.recipient
-                senderName = self.findNameFromUuid(sender)
-                if senderName:
-                    sender = senderName
+            summaryJob = self._trimHistory(state)
+            if summaryJob is not None:
+                threading.Thread(
+                    target=self._summarize,
+                    args=(state.messages, *summaryJob),
+                    name=f"summary-{self.node.uuid}",
+                    daemon=True,
+                ).start()
+            if not state.skipCheck and self._waitForTurn(state):
+                self.coalesceInput()
+            self._beginTurn(state, self.takePackets())
+            request = self._completionRequest(state)
+            turn: Optional[StreamedTurn] = None
+            scheduler = self.manager.llmScheduler
+            ticket = scheduler.acquire(self.node.uuid, state.priority, self._promptTokens(state))
+            try:
+                try:
+                    completion: Stream[ChatCompletionChunk] = self.client.chat.completions.create(**request)
+                except Exception as e:
+                    self._logFailedRequest(state)
+                    raise e
+                turn = StreamedTurn(logChunks=self.debug and logger.isEnabledFor(logging.DEBUG), promptTokens=ticket.tokens)
+                self._setStreaming(True)
+                try:
+                    for chunk in completion:
+                        if not self._consumeChunk(state, turn, chunk):
+                            break
+                finally:
+                    self._setStreaming(False)
+                completion.close()
+            finally:
+                scheduler.release(ticket, self._recordUsage(turn))
+            self._finishTurn(state, turn)
+
+    async def runAsync(self) -> None:
+        """
+        Coroutine version of run() for the asyncio agent runtime; self.client must be an AsyncOpenAI-style client.
+        """
+        state = AgentTurnState(self.generateSystemPrompt(), self.manager.contextConfig)
+        while True:
+            summaryJob = self._trimHistory(state)
+            if summaryJob is not None:
+                state.summaryTask = asyncio.create_task(self._summarizeAsync(state.messages, *summaryJob))
+            if not state.skipCheck:
+                if await self._waitForTurnAsync(state):
+                    await self.coalesceInputAsync()
+            else:
+                # Follow-up turns skip the wait; still yield so one busy agent cannot starve the shared loop.
+                await asyncio.sleep(0)
+            self._beginTurn(state, self.takePackets())
+            request = self._completionRequest(state)
+            turn = None
+            scheduler = self.manager.llmScheduler
+            ticket = await scheduler.acquireAsync(self.node.uuid, state.priority, self._promptTokens(state))
+            try:
+                try:
+                    completion: AsyncStream[ChatCompletionChunk] = await self.client.chat.completions.create(**request)
+                except Exception as e:
+                    self._logFailedRequest(state)
+                    raise e
+                turn = StreamedTurn(logChunks=self.debug and logger.isEnabledFor(logging.DEBUG), promptTokens=ticket.tokens)
+                self._setStreaming(True)
+                try:
+                    async for chunk in completion:
+                        if not self._consumeChunk(state, turn, chunk):
+                            break
+                finally:
+                    self._setStreaming(False)
+                await completion.close()
+            finally:
+                scheduler.release(ticket, self._recordUsage(turn))
+            if self._hasRequestTools(turn):
+                # These tools block while they wait for answers, so run them off the shared event loop.
+                await asyncio.to_thread(self._finishTurn, state, turn)
+            else:
+                self._finishTurn(state, turn)
+
+    def _waitForTurn(self, state: "AgentTurnState") -> bool:
+        """
+        Wait for input, or until an idle turn is due and the shared idle budget allows it. Return whether input
+        arrived.
+        """
+        idleBudget = self.manager.idleBudget
+        while not self.waitForInput(idleBudget.interval(self.timeOut, state.idleTurns)):
+            if idleBudget.tryAcquire():
+                return False
+            # The idle turn was skipped, which still counts towards the backoff.
+            state.idleTurns += 1
+        return True
+
+    async def _waitForTurnAsync(self, state: "AgentTurnState") -> bool:
+        idleBudget = self.manager.idleBudget
+        while not await self.waitForInputAsync(idleBudget.interval(self.timeOut, state.idleTurns)):
+            if idleBudget.tryAcquire():
+                return False
+            state.idleTurns += 1
+        return True
+
+    def _trimHistory(self, state: "AgentTurnState") -> Optional[Tuple[Optional[str], List[TimestampedMessage]]]:
+        """
+        Keep the history within the context window. Return a summary job to run in the background, if one is due.
+        """
+        evicted = state.messages.trim()
+        if evicted and self.debug:
+            logger.debug("%s evicted %d messages from its context", self.name, len(evicted))
+        if not state.messages.config.summarize:
+            return None
+        return state.messages.takeSummaryJob()
+
+    def _recordUsage(self, turn: Optional["StreamedTurn"]) -> Optional[int]:
+        """
+        Add the turn's reported usage to promptCacheStats and return its total tokens. Without reported usage, return
+        the estimated prompt plus what was streamed, or None if the request never started.
+        """
+        if turn is None:
+            return None
+        if turn.usage is None:
+            return turn.promptTokens + turn.streamedTokens()
+        return self.promptCacheStats.record(turn.usage)
+
+    def _promptTokens(self, state: "AgentTurnState") -> int:
+        tokens = state.messages.tokens
+        promptTokens.observe(tokens)
+        return tokens
+
+    def _summaryRequest(self, previousSummary: Optional[str], messages: List[TimestampedMessage]) -> Dict[str, Any]:
+        transcript = summaryTranscript(messages)
+        if previousSummary:
+            transcript = f"Summary so far:\n{previousSummary}\n\nLater conversation:\n{transcript}"
+        return {
+            "model": self.model,
+            "messages": [
+                ChatCompletionSystemMessageParam(
+                    role="system",
+                    content=f"You maintain the memory of {self.name}, an agent in a chat network. Summarize the "
+                            "conversation below in at most 200 words, from that agent's point of view. Keep names, "
+                            "UUIDs, rooms, promises and open questions; drop small talk.",
+                ),
+                ChatCompletionUserMessageParam(role="user", content=transcript),
+            ],
+            "stream": True,
+        }
+
+    def _summarize(
+        self,
+        window: ConversationWindow,
+        previousSummary: Optional[str],
+        messages: List[TimestampedMessage],
+    ) -> None:
+        """
+        Fold evicted messages into the window's summary. Runs on its own thread; the agent loop applies the result.
+        """
+        request = self._summaryRequest(previousSummary, messages)
+        scheduler = self.manager.llmScheduler
+        summary: Optional[str] = None
+        ticket = scheduler.acquire(self.node.uuid, RequestPriority.IDLE, estimateTokens(request["messages"]))
+        try:
+            completion: Stream[ChatCompletionChunk] = self.client.chat.completions.create(**request)
+            parts = [chunk.choices[0].delta.content or "" for chunk in completion if chunk.choices]
+            completion.close()
+            summary = "".join(parts).strip()
+            contextSummaries.inc()
+        except Exception:
+            logger.exception("%s could not summarize %d evicted messages; dropping them", self.name, len(messages))
+        finally:
+            scheduler.release(ticket)
+            window.finishSummary(summary)
+
+    async def _summarizeAsync(
+        self,
+        window: ConversationWindow,
+        previousSummary: Optional[str],
+        messages: List[TimestampedMessage],
+    ) -> None:
+        request = self._summaryRequest(previousSummary, messages)
+        scheduler = self.manager.llmScheduler
+        summary: Optional[str] = None
+        try:
+            ticket = await scheduler.acquireAsync(
+                self.node.uuid, RequestPriority.IDLE, estimateTokens(request["messages"])
+            )
+            try:
+                completion: AsyncStream[ChatCompletionChunk] = await self.client.chat.completions.create(**request)
+                parts = [chunk.choices[0].delta.content or "" async for chunk in completion if chunk.choices]
+                await completion.close()
+                summary = "".join(parts).strip()
+                contextSummaries.inc()
+            except Exception:
+                logger.exception("%s could not summarize %d evicted messages; dropping them", self.name, len(messages))
+            finally:
+                scheduler.release(ticket)
+        finally:
+            window.finishSummary(summary)
+
+    def _beginTurn(self, state: "AgentTurnState", packets: List[Packet]) -> None:
+        """
+        Turn the packets received since the last turn into the next user message.
+        """
+        userMessage = ""
+        state.priority = RequestPriority.NORMAL
+        if packets:
+            turnInputPackets.observe(len(packets))
+            state.idleTurns = 0
+        for packet in packets:
+            if packet.recipient == self.node.uuid and packet.sender != self.node.uuid:
+                # Someone is waiting on this agent specifically; answer ahead of ambient chatter.
+                state.priority = RequestPriority.DIRECT
+            sender: UUID | str = packet.sender
+            recipient: Optional[UUID | str] = packet.recipient
+            senderName = self.findNameFromUuid(sender)
+            if senderName:
+                sender = senderName
+            else:
+                sender = f"Unknown ({sender})"
+            recipientName = self.findNameFromUuid(recipient) if recipient else None
+            if recipientName:
+                recipient = recipientName
+            if packet.type == ActionType.TALK:
+                if recipient:
+                    userMessage += f"TALK: {sender} -> You: {packet.context}\n"
                 else:
-                    sender = f"Unknown ({sender})"
-                recipientName = self.findNameFromUuid(recipient) if recipient else None
-                if recipientName:
-                    recipient = recipientName
-                if packet.type == ActionType.TALK:
+                    userMessage += f"TALK: {sender} -> Everyone: {packet.context}\n"
+            elif packet.type == ActionType.ADJACENT_HUBS_RESPONSE:
+                userMessage += f"ASYNC: Response arrived. Adjacent rooms: {json.loads(packet.context)['hubs']}\n"
+            elif packet.type == ActionType.HUB_NAME_RESPONSE:
+                userMessage += f"ASYNC: Response arrived. Current room name: {packet.context}\n"
+            if not self.privacyMode or (self.privacyMode and packet.recipient == self.node.uuid):
+                if packet.type == ActionType.WHISPER:
                     if recipient:
-                        userMessage += f"TALK: {sender} -> You: {packet.context}\n"
+                        userMessage += f"WHISPER: {sender} -> You: {packet.context}\n"
                     else:
-                        userMessage += f"TALK: {sender} -> Everyone: {packet.context}\n"
-                elif packet.type == ActionType.ADJACENT_HUBS_RESPONSE:
-                    userMessage += f"ASYNC: Response arrived. Adjacent rooms: {json.loads(packet.context)['hubs']}\n"
-                elif packet.type == ActionType.HUB_NAME_RESPONSE:
-                    userMessage += f"ASYNC: Response arrived. Current room name: {packet.context}\n"
-                if not self.privacyMode or (self.privacyMode and packet.recipient == self.node.uuid):
-                    if packet.type == ActionType.WHISPER:
-                        if recipient:
-                            userMessage += f"WHISPER: {sender} -> You: {packet.context}\n"
-                        else:
-                            userMessage += f"WHISPER: {sender} is whispering to someone\n"
-                    if packet.type == ActionType.TEXT:
-                        if recipient:
-                            userMessage += f"TEXT: {sender} -> You: {packet.context}\n"
-                        else:
-                            userMessage += f"TEXT: {sender} is sending a message to someone\n"
-                if not self.privacyMode:
-                    if packet.type == ActionType.POINT:
-                        userMessage += f"POINT: {sender} -> {recipient}\n"
-                    elif packet.type == ActionType.RAISE_HAND:
-                        userMessage += f"RAISE_HAND: {sender} raised their hand\n"
-                    elif packet.type == ActionType.PING:
-                        if packet.recipient:
-                            userMessage += f"PING: Ping response arrived from {sender}\n"
-                            print(f"PONG: {sender} -> {recipient}")
-                        else:
-                            if packet.sender != self.node.uuid:
-                                userMessage += f"PING: {sender} pinged everyone\n"
-                    elif packet.type == ActionType.JOIN:
-                        userMessage += f"JOIN: {sender} joined the room\n"
-                    elif packet.type == ActionType.LEAVE:
-                        userMessage += f"LEAVE: {sender} left the room\n"
-            if self.moveHubRequestResult is not None:
-                if not self.moveHubRequestResult:
-                    userMessage += "ASYNC: Request failed. The target room is not adjacent to the current room\n"
-            if len(self.cachePackets) == 0 and not skipCheck:
-                userMessage += "NOTIFY: Nothing happened for a while.\nIt's up to you whether you take action or not.\n"
-            self.cachePackets.clear()
-            skipCheck = False
-            if userMessage != "":
-                needsThinking = True
-                lastTriedFunctions = False
-                needsCallFunction = False
-                self._emitEvent("user.message", {
-                    "message": {
-                        "role": "user",
-                        "content": userMessage
-                    }
-                })
-                messages.append(TimestampedMessage(ChatCompletionUserMessageParam(
-                    content=userMessage,
+                        userMessage += f"WHISPER: {sender} is whispering to someone\n"
+                if packet.type == ActionType.TEXT:
+                    if recipient:
+                        userMessage += f"TEXT: {sender} -> You: {packet.context}\n"
+                    else:
+                        userMessage += f"TEXT: {sender} is sending a message to someone\n"
+            if not self.privacyMode:
+                if packet.type == ActionType.POINT:
+                    userMessage += f"POINT: {sender} -> {recipient}\n"
+                elif packet.type == ActionType.RAISE_HAND:
+                    userMessage += f"RAISE_HAND: {sender} raised their hand\n"
+                elif packet.type == ActionType.PING:
+                    if packet.recipient:
+                        userMessage += f"PING: Ping response arrived from {sender}\n"
+                        logger.debug("PONG: %s -> %s", sender, recipient)
+                    else:
+                        if packet.sender != self.node.uuid:
+                            userMessage += f"PING: {sender} pinged everyone\n"
+                elif packet.type == ActionType.JOIN:
+                    userMessage += f"JOIN: {sender} joined the room\n"
+                elif packet.type == ActionType.LEAVE:
+                    userMessage += f"LEAVE: {sender} left the room\n"
+        if self.moveHubRequestResult is not None:
+            if not self.moveHubRequestResult:
+                userMessage += "ASYNC: Request failed. The target room is not adjacent to the current room\n"
+        if len(packets) == 0 and not state.skipCheck:
+            state.priority = RequestPriority.IDLE
+            state.idleTurns += 1
+            userMessage += "NOTIFY: Nothing happened for a while.\nIt's up to you whether you take action or not.\n"
+        state.skipCheck = False
+        if userMessage != "":
+            state.needsThinking = True
+            state.lastTriedFunctions = False
+            state.needsCallFunction = False
+            self._emitEvent("user.message", {
+                "message": {
+                    "role": "user",
+                    "content": userMessage
+                }
+            })
+            state.messages.append(TimestampedMessage(ChatCompletionUserMessageParam(
+                content=userMessage,
+                role="user"
+            ), time()))
+        else:
+            if state.needsCallFunction:
+                state.messages.append(TimestampedMessage(ChatCompletionUserMessageParam(
+                    content="SYSTEM: You can call functions now",
                     role="user"
                 ), time()))
-            else:
-                if needsCallFunction:
-                    messages.append(TimestampedMessage(ChatCompletionUserMessageParam(
-                        content="SYSTEM: You can call functions now",
-                        role="user"
-                    ), time()))
-            try:
-                completion: Stream[ChatCompletionChunk] = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[msg.message for msg in messages],
-                    tools=self.getTools(),
-                    tool_choice="auto",
-                    stream=True
-                )
-            except Exception as e:
-                print(json.dumps([msg.message for msg in messages], ensure_ascii=False))
-                raise e
-            messageCache: Optional[str] = None
-            functionId: Optional[str] = None
-            functionNameCache = ""
-            functionArgumentsStringCache = ""
-            functionsCache: dict[str, tuple[str, str]] = {}
-            completionStartTime = time()
-            responseId: Optional[str] = None
-            responseCreated: Optional[int] = None
-            finishReason: Optional[str] = None
-            streamInterrupted = False
-            self._setStreaming(True)
-            try:
-                for chunk in completion:
-                    if self.debug:
-                        print(chunk)
-                    choice = chunk.choices[0]
-                    delta = choice.delta
-                    if responseId is None and getattr(chunk, "id", None) is not None:
-                        responseId = chunk.id
-                    if responseCreated is None and getattr(chunk, "created", None) is not None:
-                        responseCreated = chunk.created
-                    jsonParseResult = True
-                    try:
-                        if functionId is not None:
-                            json.loads(functionArgumentsStringCache)
-                    except json.JSONDecodeError:
-                        jsonParseResult = False
-                    if len(self.cachePackets) > 0 and time() - completionStartTime > self.coolTime and jsonParseResult:
-                        streamInterrupted = True
-                        break
-                    if choice.finish_reason is not None:
-                        finishReason = choice.finish_reason
-                        if choice.finish_reason != "stop":
-                            skipCheck = True
-                    deltaPayload: Dict[str, Any] = {}
-                    if delta.role is not None:
-                        deltaPayload["role"] = delta.role
-                    if delta.content is not None:
-                        if messageCache is None:
-                            messageCache = ""
-                        messageCache += delta.content
-                        deltaPayload["content"] = delta.content
-                    reasoningPayload = getattr(delta, "reasoning", None)
-                    if reasoningPayload is not None:
-                        serializedReasoning = self._serializeReasoning(reasoningPayload)
-                        deltaPayload["reasoning"] = serializedReasoning
-                    if delta.tool_calls is not None:
-                        toolCall = delta.tool_calls[0]
-                        if toolCall.id is not None and functionId != toolCall.id:
-                            if functionId is not None:
-                                functionsCache[functionId] = (functionNameCache, functionArgumentsStringCache)
-                            functionId = toolCall.id
-                            functionNameCache = ""
-                            functionArgumentsStringCache = ""
-                        if toolCall.function.name is not None:
-                            functionNameCache += toolCall.function.name
-                        if toolCall.function.arguments is not None:
-                            functionArgumentsStringCache += toolCall.function.arguments
-                    if deltaPayload:
-                        eventPayload: Dict[str, Any] = {
-                            "delta": deltaPayload,
-                            "index": choice.index,
-                            "responseId": responseId,
-                        }
-                        if responseCreated is not None:
-                            eventPayload["created"] = responseCreated
-                        if chunk.model is not None:
-                            eventPayload["model"] = chunk.model
-                        if finishReason is not None:
-                            eventPayload["finishReason"] = finishReason
-                        self._emitEvent("assistant.delta", eventPayload)
-            finally:
-                self._setStreaming(False)
-            completion.close()
-            if streamInterrupted:
-                self._emitEvent("assistant.interrupted", {
-                    "reason": "new_input",
+
+    def _completionRequest(self, state: "AgentTurnState") -> Dict[str, Any]:
+        # The static prefix (tools, then the system prompt) leads every request unchanged, so the provider can
+        # serve it from its prompt cache; prompt_cache_key groups requests that share it.
+        request: Dict[str, Any] = {
+            "model": self.model,
+            "tools": self.getTools(),
+            "tool_choice": "auto",
+            "messages": state.messages.params(),
+        }
+        if self.openaiExtensions:
+            request["prompt_cache_key"] = self.promptPrefix.cacheKey
+        request["stream"] = True
+        if self.openaiExtensions:
+            request["stream_options"] = {"include_usage": True}
+        return request
+
+    def _logFailedRequest(self, state: "AgentTurnState") -> None:
+        logger.error(
+            "%s completion request failed: %s",
+            self.name,
+            json.dumps(state.messages.params(), ensure_ascii=False),
+        )
+
+    def _consumeChunk(self, state: "AgentTurnState", turn: "StreamedTurn", chunk: ChatCompletionChunk) -> bool:
+        """
+        Apply one streamed chunk to the turn. Return False when the stream should be abandoned for new input.
+        """
+        if turn.logChunks:
+            logger.debug("%s chunk: %r", self.name, chunk, extra={"nodeUuid": self.node.uuid})
+        if getattr(chunk, "usage", None) is not None:
+            turn.usage = chunk.usage
+        if not chunk.choices:
+            # The usage chunk that ends a stream carries no choices.
+            return True
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if turn.responseId is None and getattr(chunk, "id", None) is not None:
+            turn.responseId = chunk.id
+        if turn.responseCreated is None and getattr(chunk, "created", None) is not None:
+            turn.responseCreated = chunk.created
+        # Never abandon the stream halfway through a tool call's arguments.
+        jsonParseResult = turn.functionId is None or turn.argumentsTracker.complete
+        if len(self.cachePackets) > 0 and time() - turn.completionStartTime > self.coolTime and jsonParseResult:
+            turn.streamInterrupted = True
+            return False
+        if choice.finish_reason is not None:
+            turn.finishReason = choice.finish_reason
+            if choice.finish_reason != "stop":
+                state.skipCheck = True
+        deltaPayload: Dict[str, Any] = {}
+        if delta.role is not None:
+            deltaPayload["role"] = delta.role
+        if delta.content is not None:
+            turn.messageParts.append(delta.content)
+            deltaPayload["content"] = delta.content
+        reasoningPayload = getattr(delta, "reasoning", None)
+        if reasoningPayload is not None:
+            serializedReasoning = self._serializeReasoning(reasoningPayload)
+            deltaPayload["reasoning"] = serializedReasoning
+        if delta.tool_calls is not None:
+            toolCall = delta.tool_calls[0]
+            if toolCall.id is not None and turn.functionId != toolCall.id:
+                turn.startFunction(toolCall.id)
+            if toolCall.function.name is not None:
+                turn.functionNameCache += toolCall.function.name
+            if toolCall.function.arguments is not None:
+                turn.argumentParts.append(toolCall.function.arguments)
+                turn.argumentsTracker.feed(toolCall.function.arguments)
+                if self.earlyToolDispatch and turn.argumentsTracker.complete:
+                    self._dispatchEarly(state, turn)
+        if deltaPayload:
+            eventPayload: Dict[str, Any] = {
+                "delta": deltaPayload,
+                "index": choice.index,
+                "responseId": turn.responseId,
+            }
+            if turn.responseCreated is not None:
+                eventPayload["created"] = turn.responseCreated
+            if chunk.model is not None:
+                eventPayload["model"] = chunk.model
+            if turn.finishReason is not None:
+                eventPayload["finishReason"] = turn.finishReason
+            self._emitEvent("assistant.delta", eventPayload)
+        return True
+
+    def _dispatchEarly(self, state: "AgentTurnState", turn: "StreamedTurn") -> None:
+        """
+        Run the tool call being streamed now that its arguments are complete. Anything _finishTurn would reject is
+        left for it to handle.
+        """
+        functionId = turn.functionId
+        if functionId is None or functionId in turn.dispatchedResults:
+            return
+        # _finishTurn clears needsThinking only if this turn wrote something, so require text before the call.
+        if state.needsThinking and not self.isReasoning and not any(turn.messageParts):
+            return
+        if turn.functionNameCache in REQUEST_TOOLS and self.requestTimeout > 0 and not self._awaitsResponses():
+            # Waiting for the answer would block the event loop; _finishTurn runs these off it.
+            return
+        try:
+            parsedArgs = json.loads("".join(turn.argumentParts))
+        except json.JSONDecodeError:
+            return
+        events = turn.earlyEvents[functionId] = [("assistant.tool_call", {
+            "toolCallId": functionId,
+            "name": turn.functionNameCache,
+            "arguments": parsedArgs,
+            "argumentsIsJson": True,
+            "responseId": turn.responseId
+        })]
+        turn.dispatchedResults[functionId] = self._executeToolCall(
+            turn, functionId, turn.functionNameCache, parsedArgs, events
+        )
+
+    def _hasRequestTools(self, turn: "StreamedTurn") -> bool:
+        if self.requestTimeout <= 0:
+            return False
+        turn.flushFunction()
+        return any(
+            functionName in REQUEST_TOOLS and functionId not in turn.dispatchedResults
+            for functionId, (functionName, _) in turn.functionsCache.items()
+        )
+
+    def _executeToolCall(
+        self,
+        turn: "StreamedTurn",
+        functionId: str,
+        functionName: str,
+        parsedArgs: Any,
+        deferredEvents: Optional[List[Tuple[str, Dict[str, Any]]]] = None,
+    ) -> str:
+        """
+        Run a tool call with valid arguments, emit its tool.result event and return the reply for the model.
+
+        With deferredEvents, the event is appended there instead of being emitted.
+        """
+        if turn.firstActionAt is None:
+            turn.firstActionAt = time()
+            timeToFirstAction.observe(turn.firstActionAt - turn.completionStartTime)
+        try:
+            replyMessage = self._callTool(functionName, parsedArgs)
+        except Exception:
+            replyMessage = json.dumps({"message": "error: Opps! Something went wrong"})
+            logger.exception("%s tool call %s failed", self.name, functionName)
+        try:
+            resultPayload = json.loads(replyMessage)
+        except json.JSONDecodeError:
+            resultPayload = replyMessage
+        resultEvent = {
+            "toolCallId": functionId,
+            "name": functionName,
+            "result": resultPayload
+        }
+        if deferredEvents is not None:
+            deferredEvents.append(("tool.result", resultEvent))
+        else:
+            self._emitEvent("tool.result", resultEvent)
+        return replyMessage
+
+    def _finishTurn(self, state: "AgentTurnState", turn: "StreamedTurn") -> None:
+        """
+        Record the assistant message and run the tool calls of a finished or interrupted stream.
+        """
+        turn.flushFunction()
+        functionsCache = turn.functionsCache
+        messageCache = turn.joinMessage()
+        self.inputCoalescer.onStreamEnd(turn.streamInterrupted)
+        if turn.streamInterrupted:
+            llmStreamsInterrupted.inc()
+            llmWastedPromptTokens.inc(turn.promptTokens)
+            llmWastedCompletionTokens.inc(turn.streamedTokens())
+            self._emitEvent("assistant.interrupted", {
+                "reason": "new_input",
+                "responseId": turn.responseId
+            })
+        responseId = turn.responseId
+        finishReason = turn.finishReason
+        assistant = ChatCompletionAssistantMessageParam(
+            role="assistant"
+        )
+        if messageCache is not None:
+            if self.debug: logger.debug("%s: %s", self.name, messageCache)
+            assistant["content"] = messageCache
+            state.needsThinking = False
+            if state.lastTriedFunctions:
+                state.lastTriedFunctions = False
+                state.needsCallFunction = True
+            self._emitEvent("assistant.message", {
+                "message": {
+                    "role": "assistant",
+                    "content": messageCache
+                },
+                "responseId": responseId,
+                "finishReason": finishReason
+            })
+        if self.isReasoning:
+            state.needsThinking = False
+        functionCallInputs: dict[str, tuple[str, str, bool, Any]] = {}
+        if len(functionsCache) > 0:
+            assistant["tool_calls"] = [ChatCompletionMessageToolCallParam(
+                id=toolCallId,
+                function=Function(
+                    name=functionName,
+                    arguments=functionArguments
+                ),
+                type="function"
+            ) for toolCallId, (functionName, functionArguments) in functionsCache.items()]
+            for toolCallId, (functionName, functionArguments) in functionsCache.items():
+                parsedArgs: Any = None
+                parsedOk = False
+                try:
+                    parsedArgs = json.loads(functionArguments)
+                    parsedOk = True
+                except json.JSONDecodeError:
+                    pass
+                functionCallInputs[toolCallId] = (functionName, functionArguments, parsedOk, parsedArgs)
+                if toolCallId in turn.dispatchedResults:
+                    # Dispatched mid-stream; its events were held so the UI sees them after the message.
+                    for eventType, payload in turn.earlyEvents.pop(toolCallId, ()):
+                        self._emitEvent(eventType, payload)
+                    continue
+                self._emitEvent("assistant.tool_call", {
+                    "toolCallId": toolCallId,
+                    "name": functionName,
+                    "arguments": parsedArgs if parsedOk else functionArguments,
+                    "argumentsIsJson": parsedOk,
                     "responseId": responseId
                 })
-            if functionId is not None:
-                functionsCache[functionId] = (functionNameCache, functionArgumentsStringCache)
-            assistant = ChatCompletionAssistantMessageParam(
-                role="assistant"
-            )
-            if messageCache is not None:
-                if len(messageCache) == 0:
-                    messageCache = None
-            if messageCache is not None:
-                if self.debug: print(self.name, messageCache)
-                assistant["content"] = messageCache
-                needsThinking = False
-                if lastTriedFunctions:
-                    lastTriedFunctions = False
-                    needsCallFunction = True
-                self._emitEvent("assistant.message", {
-                    "message": {
-                        "role": "assistant",
-                        "content": messageCache
-                    },
-                    "responseId": responseId,
-                    "finishReason": finishReason
-                })
-            if self.isReasoning:
-                needsThinking = False
-            functionCallInputs: dict[str, tuple[str, str, bool, Any]] = {}
-            if len(functionsCache) > 0:
-                assistant["tool_calls"] = [ChatCompletionMessageToolCallParam(
-                    id=toolCallId,
-                    function=Function(
-                        name=functionName,
-                        arguments=functionArguments
-                    ),
-                    type="function"
-                ) for toolCallId, (functionName, functionArguments) in functionsCache.items()]
-                for toolCallId, (functionName, functionArguments) in functionsCache.items():
-                    parsedArgs: Any = None
-                    parsedOk = False
-                    try:
-                        parsedArgs = json.loads(functionArguments)
-                        parsedOk = True
-                    except json.JSONDecodeError:
-                        pass
-                    functionCallInputs[toolCallId] = (functionName, functionArguments, parsedOk, parsedArgs)
-                    self._emitEvent("assistant.tool_call", {
-                        "toolCallId": toolCallId,
-                        "name": functionName,
-                        "arguments": parsedArgs if parsedOk else functionArguments,
-                        "argumentsIsJson": parsedOk,
-                        "responseId": responseId
-                    })
-                skipCheck = True
-                needsCallFunction = False
-            elif messageCache is None:
-                assistant["content"] = ""
-                self._emitEvent("assistant.message", {
-                    "message": {
-                        "role": "assistant",
-                        "content": ""
-                    },
-                    "responseId": responseId,
-                    "finishReason": finishReason
+            state.skipCheck = True
+            state.needsCallFunction = False
+        elif messageCache is None:
+            assistant["content"] = ""
+            self._emitEvent("assistant.message", {
+                "message": {
+                    "role": "assistant",
+                    "content": ""
+                },
+                "responseId": responseId,
+                "finishReason": finishReason
+            })
+        if state.needsCallFunction and len(functionsCache) == 0:
+            state.skipCheck = True
+        state.messages.append(TimestampedMessage(assistant, time()))
+        for functionId, (functionName, functionArgumentsString, parsedOk, parsedArgs) in functionCallInputs.items():
+            if functionId in turn.dispatchedResults:
+                state.messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
+                    content=turn.dispatchedResults[functionId],
+                    role="tool",
+                    tool_call_id=functionId
+                ), time()))
+                continue
+            if state.needsThinking:
+                errorPayload = {"message": "error: Write down the reasons for your actions before you act. Then, please try again."}
+                state.messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
+                    content=json.dumps(errorPayload),
+                    role="tool",
+                    tool_call_id=functionId
+                ), time()))
+                self._emitEvent("tool.result", {
+                    "toolCallId": functionId,
+                    "name": functionName,
+                    "result": errorPayload
                 })
-            if needsCallFunction and len(functionsCache) == 0:
-                skipCheck = True
-            messages.append(TimestampedMessage(assistant, time()))
-            for functionId, (functionName, functionArgumentsString, parsedOk, parsedArgs) in functionCallInputs.items():
-                if needsThinking:
-                    errorPayload = {"message": "error: Write down the reasons for your actions before you act. Then, please try again."}
-                    messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
-                        content=json.dumps(errorPayload),
-                        role="tool",
-                        tool_call_id=functionId
-                    ), time()))
-                    self._emitEvent("tool.result", {
-                        "toolCallId": functionId,
-                        "name": functionName,
-                        "result": errorPayload
-                    })
-                    lastTriedFunctions = True
-                    continue
-                if not parsedOk:
-                    errorPayload = {"message": "error: Invalid JSON"}
-                    messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
-                        content=json.dumps(errorPayload),
-                        role="tool",
-                        tool_call_id=functionId
-                    ), time()))
-                    self._emitEvent("tool.result", {
-                        "toolCallId": functionId,
-                        "name": functionName,
-                        "result": errorPayload
-                    })
-                    continue
-                arguments = parsedArgs
-                replyMessage = json.dumps({"message": "success"})
-                try:
-                    if functionName == "talk":
-                        target: Optional[str] = arguments.get("target")
-                        context: str = arguments.get("context")
-                        if target:
-                            targetUuid = self.getNameUuid(target)
-                            if targetUuid or target.lower() == "everyone":
-                                self.sendPacket(ActionPacket(
-                                    type=ActionType.TALK,
-                                    sender=self.node.uuid,
-                                    recipient=targetUuid,
-                                    context=context
-                                ))
-                            else:
-                                replyMessage = json.dumps({"message": f"error: Target {target} not found"})
-                        else:
-                            self.sendPacket(ActionPacket(
-                                type=ActionType.TALK,
-                                sender=self.node.uuid,
-                                context=context
-                            ))
-                    elif functionName == "whisper":
-                        target: str = arguments.get("target")
-                        context: str = arguments.get("context")
-                        targetUuid = self.getNameUuid(target)
-                        if targetUuid:
-                            self.sendPacket(ActionPacket(
-                                type=ActionType.WHISPER,
-                                sender=self.node.uuid,
-                                recipient=targetUuid,
-                                context=context
-                            ))
-                        else:
-                            replyMessage = json.dumps({"message": f"error: Target {target} not found"})
-                    elif functionName == "text":
-                        target: str = arguments.get("target")
-                        context: str = arguments.get("context")
-                        targetUuid = self.getNameUuid(target)
-                        if targetUuid:
-                            self.sendPacket(ActionPacket(
-                                type=ActionType.TEXT,
-                                sender=self.node.uuid,
-                                recipient=targetUuid,
-                                context=context
-                            ))
-                        else:
-                            replyMessage = json.dumps({"message": f"error: Target {target} not found"})
-                    elif functionName == "point":
-                        target: str = arguments.get("target")
-                        targetUuid = self.getNameUuid(target)
-                        if targetUuid:
-                            self.sendPacket(ActionPacket(
-                                type=ActionType.POINT,
-                                sender=self.node.uuid,
-                                recipient=targetUuid
-                            ))
-                        else:
-                            replyMessage = json.dumps({"message": f"error: Target {target} not found"})
-                    elif functionName == "raiseHand":
-                        self.sendPacket(ActionPacket(
-                            type=ActionType.RAISE_HAND,
-                            sender=self.node.uuid
-                        ))
-                    elif functionName == "registerContact":
-                        name: str = arguments.get("name")
-                        uuid: str = arguments.get("uuid")
-                        try:
-                            uuid = UUID(uuid)
-                        except ValueError:
-                            replyMessage = json.dumps({"message": f"error: Invalid UUID {uuid}"})
-                            continue
-                        if not self.registerName(name, uuid):
-                            replyMessage = json.dumps({"message": f"error: Name {name} already exists"})
-                    elif functionName == "getAdjacentRooms":
-                        if not self.hubUuid:
-                            replyMessage = json.dumps({"message": "error: You don't seem to be in any room"})
-                            continue
-                        self.sendPacket(ActionPacket(
-                            type=ActionType.ADJACENT_HUBS_REQUEST,
-                            sender=self.node.uuid
-                        ))
-                        replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
-                    elif functionName == "moveToRoom":
-                        roomUuid: str = arguments.get("roomUuid")
-                        try:
-                            roomUuid = UUID(roomUuid)
-                        except ValueError:
-                            replyMessage = json.dumps({"message": f"error: Invalid UUID {roomUuid}"})
-                            continue
-                        if not self.hubUuid:
-                            replyMessage = json.dumps({"message": "error: You don't seem to be in any room"})
-                            continue
-                        self.moveHub(roomUuid)
-                        replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
-                    elif functionName == "getCurrentRoomName":
-                        if not self.hubUuid:
-                            replyMessage = json.dumps({"message": "error: You don't seem to be in any room"})
-                            continue
-                        self.sendPacket(ActionPacket(
-                            type=ActionType.HUB_NAME_REQUEST,
-                            sender=self.node.uuid,
-                            recipient=self.hubUuid
-                        ))
-                        replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
-                    elif functionName == "ping":
-                        self.sendPacket(ActionPacket(
-                            type=ActionType.PING,
-                            sender=self.node.uuid
-                        ))
-                        replyMessage = json.dumps({"message": "PING: pinged everyone in the room. Please wait for the response"})
-                except Exception as e:
-                    replyMessage = json.dumps({"message": "error: Opps! Something went wrong"})
-                    print(traceback.format_exc())
-                messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
-                    content=replyMessage,
+                state.lastTriedFunctions = True
+                continue
+            if not parsedOk:
+                errorPayload = {"message": "error: Invalid JSON"}
+                state.messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
+                    content=json.dumps(errorPayload),
                     role="tool",
                     tool_call_id=functionId
                 ), time()))
-                try:
-                    resultPayload = json.loads(replyMessage)
-                except json.JSONDecodeError:
-                    resultPayload = replyMessage
                 self._emitEvent("tool.result", {
                     "toolCallId": functionId,
                     "name": functionName,
-                    "result": resultPayload
+                    "result": errorPayload
                 })
+                continue
+            replyMessage = self._executeToolCall(turn, functionId, functionName, parsedArgs)
+            state.messages.append(TimestampedMessage(ChatCompletionToolMessageParam(
+                content=replyMessage,
+                role="tool",
+                tool_call_id=functionId
+            ), time()))
 
-    def generateSystemPrompt(self) -> ChatCompletionSystemMessageParam:
-        content = f"""
-        You are the mind of the protagonist {self.name} in a story. Your role is to think deeply, analyze situations, and guide {self.name} step by step. Think deeply about the reasons for what you should do given the current situation.
+    def _callTool(self, functionName: str, arguments: Any) -> str:
+        """
+        Run one tool call and return the JSON reply for the model.
+        """
+        replyMessage = json.dumps({"message": "success"})
+        if functionName == "talk":
+            target: Optional[str] = arguments.get("target")
+            context: str = arguments.get("context")
+            if target:
+                targetUuid = self.getNameUuid(target)
+                if targetUuid or target.lower() == "everyone":
+                    self.sendPacket(Packet(
+                        type=ActionType.TALK,
+                        sender=self.node.uuid,
+                        recipient=targetUuid,
+                        context=context
+                    ))
+                else:
+                    replyMessage = json.dumps({"message": f"error: Target {target} not found"})
+            else:
+                self.sendPacket(Packet(
+                    type=ActionType.TALK,
+                    sender=self.node.uuid,
+                    context=context
+                ))
+        elif functionName == "whisper":
+            target: str = arguments.get("target")
+            context: str = arguments.get("context")
+            targetUuid = self.getNameUuid(target)
+            if targetUuid:
+                self.sendPacket(Packet(
+                    type=ActionType.WHISPER,
+                    sender=self.node.uuid,
+                    recipient=targetUuid,
+                    context=context
+                ))
+            else:
+                replyMessage = json.dumps({"message": f"error: Target {target} not found"})
+        elif functionName == "text":
+            target: str = arguments.get("target")
+            context: str = arguments.get("context")
+            targetUuid = self.getNameUuid(target)
+            if targetUuid:
+                self.sendPacket(Packet(
+                    type=ActionType.TEXT,
+                    sender=self.node.uuid,
+                    recipient=targetUuid,
+                    context=context
+                ))
+            else:
+                replyMessage = json.dumps({"message": f"error: Target {target} not found"})
+        elif functionName == "point":
+            target: str = arguments.get("target")
+            targetUuid = self.getNameUuid(target)
+            if targetUuid:
+                self.sendPacket(Packet(
+                    type=ActionType.POINT,
+                    sender=self.node.uuid,
+                    recipient=targetUuid
+                ))
+            else:
+                replyMessage = json.dumps({"message": f"error: Target {target} not found"})
+        elif functionName == "raiseHand":
+            self.sendPacket(Packet(
+                type=ActionType.RAISE_HAND,
+                sender=self.node.uuid
+            ))
+        elif functionName == "registerContact":
+            name: str = arguments.get("name")
+            uuid: str = arguments.get("uuid")
+            try:
+                uuid = UUID(uuid)
+            except ValueError:
+                return json.dumps({"message": f"error: Invalid UUID {uuid}"})
+            if not self.registerName(name, uuid):
+                replyMessage = json.dumps({"message": f"error: Name {name} already exists"})
+        elif functionName == "getAdjacentRooms":
+            if not self.hubUuid:
+                return json.dumps({"message": "error: You don't seem to be in any room"})
+            responses = self._request(Packet(
+                type=ActionType.ADJACENT_HUBS_REQUEST,
+                sender=self.node.uuid
+            ))
+            if responses:
+                return json.dumps({"message": "success", "adjacentRooms": json.loads(responses[0].context)["hubs"]})
+            replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
+        elif functionName == "moveToRoom":
+            roomUuid: str = arguments.get("roomUuid")
+            try:
+                roomUuid = UUID(roomUuid)
+            except ValueError:
+                return json.dumps({"message": f"error: Invalid UUID {roomUuid}"})
+            if not self.hubUuid:
+                return json.dumps({"message": "error: You don't seem to be in any room"})
+            if self._awaitsResponses():
+                requestId = self.pendingRequests.open()
+                self.moveHub(roomUuid, requestId)
+                responses = self.pendingRequests.wait(requestId, self.requestTimeout)
+                if responses:
+                    # Reported here, so the next turn must not report it again.
+                    self.moveHubRequestResult = None
+                    if responses[0].context == "NOT_OK":
+                        return json.dumps({"message": "error: The target room is not adjacent to the current room"})
+                    return json.dumps({"message": f"success: Moved to room {roomUuid}"})
+            else:
+                self.moveHub(roomUuid)
+            replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
+        elif functionName == "getCurrentRoomName":
+            if not self.hubUuid:
+                return json.dumps({"message": "error: You don't seem to be in any room"})
+            responses = self._request(Packet(
+                type=ActionType.HUB_NAME_REQUEST,
+                sender=self.node.uuid,
+                recipient=self.hubUuid
+            ))
+            if responses:
+                return json.dumps({"message": "success", "roomName": responses[0].context})
+            replyMessage = json.dumps({"message": "ASYNC: Request sent. Please wait for the response"})
+        elif functionName == "ping":
+            responses = self._request(Packet(
+                type=ActionType.PING,
+                sender=self.node.uuid
+            ), collect=True)
+            if responses is not None:
+                responders = [self.findNameFromUuid(packet.sender) or f"Unknown ({packet.sender})" for packet in responses]
+                return json.dumps({"message": "success", "responders": responders})
+            replyMessage = json.dumps({"message": "PING: pinged everyone in the room. Please wait for the response"})
+        return replyMessage
 
-        Your thoughts and reasoning should be in English, but you can communicate in English when using functions like talk. Always organize information, make predictions, and propose specific actions {self.name} should take. Before using any function, plan your actions step by step and explain why each step is important.
+    def _awaitsResponses(self) -> bool:
+        """
+        Whether request/response tools should wait for their answers. Never on an event loop, which must not block.
+        """
+        if self.requestTimeout <= 0:
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        return False
 
-        You cannot decide unconfirmed events on your own, but you can speculate and build hypotheses. All information comes from the system, your only source of reality. Stay focused, trust your ability to think deeply, and remember—clear, calm reasoning will always lead to the best outcomes!
+    def _request(self, packet: Packet, collect: bool = False) -> Optional[List[Packet]]:
+        """
+        Send a request tagged with a fresh requestId and wait up to requestTimeout for the responses.
 
-        Avoid using functions without a clear reason. Always think before you act. If you need to use a function, explain why you need to use it. If you need to talk to someone, explain why you need to talk to them. If you need to move to another room, explain why you need to move there.
-        Avoid looping conversations. Always provide new information or ask questions to keep the conversation going. If you need to repeat information, explain why you need to repeat it.
+        Returns None without waiting when responses are not awaited, and an empty list on timeout; either way the
+        answer then arrives later as ordinary input. With collect, every response within the timeout is returned.
         """
+        if not self._awaitsResponses():
+            self.sendPacket(packet)
+            return None
+        requestId = self.pendingRequests.open(collect)
+        self.sendPacket(packet.derive(requestId=requestId))
+        return self.pendingRequests.wait(requestId, self.requestTimeout)
+
+    def generateSystemPrompt(self) -> ChatCompletionSystemMessageParam:
+        # The name goes last so everything before it is the same for every device and caches as one prefix.
+        content = (
+            f"{self.promptPrefix.systemText}"
+            f"The protagonist is {self.name}; every mention of the protagonist above means {self.name}.\n"
+        )
         return ChatCompletionSystemMessageParam(
             content=content,
             role="system"
         )
 
+    def generateStaticSystemPrompt(self) -> str:
+        return """
+        You are the mind of the protagonist in a story. Your role is to think deeply, analyze situations, and guide the protagonist step by step. Think deeply about the reasons for what you should do given the current situation.
+
+        Your thoughts and reasoning should be in English, but you can communicate in English when using functions like talk. Always organize information, make predictions, and propose specific actions the protagonist should take. Before using any function, plan your actions step by step and explain why each step is important.
+
+        You cannot decide unconfirmed events on your own, but you can speculate and build hypotheses. All information comes from the system, your only source of reality. Stay focused, trust your ability to think deeply, and remember—clear, calm reasoning will always lead to the best outcomes!
+
+        Avoid using functions without a clear reason. Always think before you act. If you need to use a function, explain why you need to use it. If you need to talk to someone, explain why you need to talk to them. If you need to move to another room, explain why you need to move there.
+        Avoid looping conversations. Always provide new information or ask questions to keep the conversation going. If you need to repeat information, explain why you need to repeat it.
+        """
+
     def getTools(self) -> Iterable[ChatCompletionToolParam]:
+        return self.promptPrefix.tools
+
+    def buildTools(self) -> List[ChatCompletionToolParam]:
         return [
             ChatCompletionToolParam(
                 function=FunctionDefinition(
@@ -757,21 +1201,110 @@ class AIDevice:
                 return name
         return None
 
-    def onPacketReceived(self, packet: ActionPacket) -> None:
+    def onPacketReceived(self, packet: Packet) -> None:
         if packet.type == ActionType.PING and packet.recipient is None and packet.sender != self.node.uuid:
-            self.sendPacket(ActionPacket(
+            self.sendPacket(Packet(
                 type=ActionType.PING,
                 sender=self.node.uuid,
-                recipient=packet.sender
+                recipient=packet.sender,
+                requestId=packet.requestId
             ))
         if packet.type == ActionType.CONNECT_CHECK_RESPONSE:
             if packet.sender in self.connectionCallbacks:
                 self.connectionCallbacks[packet.sender](packet)
                 del self.connectionCallbacks[packet.sender]
+            self.pendingRequests.offer(packet)
+            return
+        # Answers a tool call is still waiting for go straight to it instead of becoming input for a later turn.
+        if packet.recipient == self.node.uuid and packet.sender != self.node.uuid and self.pendingRequests.offer(packet):
             return
-        self.cachePackets.append(packet)
+        self.queuePacket(packet)
+
+    def queuePacket(self, packet: Packet) -> None:
+        with self._inputCondition:
+            self.cachePackets.append(packet)
+            self.inputCoalescer.observe(time())
+            self._inputCondition.notify_all()
+            loop = self._inputLoop
+            event = self._inputEvent
+        if loop is not None and event is not None:
+            try:
+                if asyncio.get_running_loop() is loop:
+                    event.set()
+                    return
+            except RuntimeError:
+                pass
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass
+
+    def waitForInput(self, timeout: float) -> bool:
+        """
+        Block until a packet is queued or timeout seconds pass. Return whether input is waiting.
+        """
+        with self._inputCondition:
+            return self._inputCondition.wait_for(lambda: len(self.cachePackets) > 0, timeout=timeout)
+
+    async def waitForInputAsync(self, timeout: float) -> bool:
+        with self._inputCondition:
+            if self.cachePackets:
+                return True
+            if self._inputEvent is None:
+                self._inputLoop = asyncio.get_running_loop()
+                self._inputEvent = asyncio.Event()
+            event = self._inputEvent
+            event.clear()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return len(self.cachePackets) > 0
+
+    def coalesceInput(self) -> None:
+        """
+        Keep collecting input while it is still arriving in a burst, as paced by inputCoalescer.
+        """
+        startedAt = time()
+        with self._inputCondition:
+            while True:
+                remaining = self.inputCoalescer.wakeAt(startedAt) - time()
+                if remaining <= 0:
+                    break
+                self._inputCondition.wait(remaining)
+        if self.coalesceWindow > 0:
+            inputCoalesceWait.observe(time() - startedAt)
+
+    async def coalesceInputAsync(self) -> None:
+        startedAt = time()
+        while True:
+            with self._inputCondition:
+                remaining = self.inputCoalescer.wakeAt(startedAt) - time()
+                if remaining <= 0:
+                    break
+                event = self._inputEvent
+                if event is not None:
+                    event.clear()
+            if event is None:
+                await asyncio.sleep(remaining)
+                continue
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        if self.coalesceWindow > 0:
+            inputCoalesceWait.observe(time() - startedAt)
+
+    def takePackets(self) -> List[Packet]:
+        """
+        Remove and return every queued packet at once, so nothing that arrives meanwhile is lost.
+        """
+        with self._inputCondition:
+            packets = self.cachePackets
+            self.cachePackets = []
+        return packets
 
-    def sendPacket(self, packet: ActionPacket) -> None:
+    def sendPacket(self, packet: Packet) -> None:
         if not self.hubUuid:
             raise ValueError("AI device is not connected to a hub")
         self.node.sendPacket(self.hubUuid, packet)
@@ -781,13 +1314,13 @@ class AIDevice:
             raise ValueError("AI device is already connected to a hub")
         self.manager.createConnectionByUuids(self.node.uuid, hubUuid)
         self.hubUuid = hubUuid
-        packet = ActionPacket(
+        packet = Packet(
             type=ActionType.JOIN,
             sender=self.node.uuid,
             context=f"{hubUuid}"
         )
         self.sendPacket(packet)
-        self.cachePackets.append(packet)
+        self.queuePacket(packet)
         try:
             self.manager.onDeviceJoinedHub(self, hubUuid)
         except AttributeError:
@@ -798,24 +1331,24 @@ class AIDevice:
         if not self.hubUuid:
             raise ValueError("AI device is not connected to a hub")
         currentHubUuid = self.hubUuid
-        packet = ActionPacket(
+        packet = Packet(
             type=ActionType.LEAVE,
             sender=self.node.uuid,
             context=f"{self.hubUuid}"
         )
         self.sendPacket(packet)
-        self.cachePackets.append(packet)
+        self.queuePacket(packet)
         self.hubUuid = None
         try:
             self.manager.onDeviceLeftHub(self, currentHubUuid)
         except AttributeError:
             pass
 
-    def moveHub(self, newHubUuid: UUID) -> None:
+    def moveHub(self, newHubUuid: UUID, requestId: Optional[UUID] = None) -> None:
         if not self.hubUuid:
             raise ValueError("AI device is not connected to a hub")
         self.moveHubRequestResult = None
-        def onReply(packet: ActionPacket) -> None:
+        def onReply(packet: Packet) -> None:
             if packet.context == "NOT_OK":
                 self.moveHubRequestResult = False
                 return
@@ -823,9 +1356,10 @@ class AIDevice:
             self.leaveHub()
             self.joinHub(newHubUuid)
         self.connectionCallbacks[newHubUuid] = onReply
-        packet = ActionPacket(
+        packet = Packet(
             type=ActionType.CONNECT_CHECK_REQUEST,
             sender=self.node.uuid,
-            recipient=newHubUuid
+            recipient=newHubUuid,
+            requestId=requestId
         )
         self.sendPacket(packet)
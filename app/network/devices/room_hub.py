@@ -1,112 +1,319 @@
 import json
+import heapq
+import logging
+import threading
+from collections import OrderedDict, deque
+from math import inf
 from uuid import UUID
-from typing import List, Optional, Callable
-from datetime import datetime, timedelta
-
-from pydantic import BaseModel
+from typing import Deque, Dict, List, Optional, Callable, Tuple
+from time import monotonic
+from uuid6 import uuid7
 
 from app.network.manager import Manager
-from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
 from app.enums.action_type import ActionType
 from app.network.devices.ai_device import AIDevice
+from app.tracing import getLogger
+from app import metrics
+
+logger = getLogger("hub")
+
+class RouteTableItem:
+    __slots__ = ("destination", "nextHop", "cost", "expires")
+
+    def __init__(self, destination: UUID, nextHop: UUID, cost: int, expires: float = inf) -> None:
+        self.destination = destination
+        self.nextHop = nextHop
+        self.cost = cost
+        # Deadline on the time.monotonic() clock; direct neighbours never expire.
+        self.expires = expires
+
+class PendingDiscovery:
+    """
+    One in-flight route discovery shared by every findRoute call for the same destination.
+    """
+    __slots__ = ("destination", "requestId", "waiters", "attempts", "deadline")
 
-class RouteTableItem(BaseModel):
-    destination: UUID
-    nextHop: UUID
-    cost: int
-    expires: datetime = datetime.now() + timedelta(seconds=3)
+    def __init__(self, destination: UUID) -> None:
+        self.destination = destination
+        self.requestId: Optional[UUID] = None
+        self.waiters: Deque[Callable[[RouteTableItem], None]] = deque()
+        self.attempts = 0
+        self.deadline = inf
 
 class RoomHub:
+    routeLifetime: float = 3.0
+    discoveryCacheSize: int = 1024
+    discoveryCacheWindow: float = 30.0
+    discoveryTimeout: float = 2.0
+    maxDiscoveryAttempts: int = 3
+    maxPendingWaiters: int = 64
+    departedMemorySize: int = 1024
+
     def __init__(self, name: str, manager: Manager) -> None:
         self.name = name
         self.manager = manager
         self.node = self.manager.createNode(self.onPacketReceived)
-        self.connectedHubs: List[UUID] = []
-        self.connectedDevices: List[UUID] = []
-        self.routeTable: List[RouteTableItem] = []
-        self.onRouteFoundCallbacks: dict[UUID, Callable[[RouteTableItem], None]] = {}
-        self.packetListeners: List[Callable[[ActionPacket], None]] = []
+        # Used as ordered sets: O(1) membership, and listings and fan-out follow connection order.
+        self.connectedHubs: Dict[UUID, None] = {}
+        self.connectedDevices: Dict[UUID, None] = {}
+        # Members dropped by the manager whose LEAVE may still be queued, oldest first.
+        self._departedDevices: "OrderedDict[UUID, None]" = OrderedDict()
+        self.routeTable: Dict[UUID, RouteTableItem] = {}
+        # Min-heap of (expires, destination) used to evict expired routes lazily; stale entries are skipped.
+        self._routeExpiryHeap: List[Tuple[float, UUID]] = []
+        self.pendingDiscoveries: Dict[UUID, PendingDiscovery] = {}
+        # Min-heap of (deadline, destination, requestId); entries whose requestId no longer matches are stale.
+        self._discoveryDeadlineHeap: List[Tuple[float, UUID, UUID]] = []
+        self.droppedWaiterCount = 0
+        self.expiredDiscoveryCount = 0
+        # Guards the pending discoveries, which the expiry timer also touches. Packets are never sent while it is held.
+        self._discoveryLock = threading.Lock()
+        self._discoveryTimer: Optional[threading.Timer] = None
+        self._discoveryTimerAt = inf
+        # (origin, destination, requestId) -> monotonic time first seen, oldest first.
+        self._seenDiscoveries: "OrderedDict[Tuple[UUID, UUID, UUID], float]" = OrderedDict()
+        self.suppressedDiscoveryCount = 0
+        self._receivedCounter = metrics.hubPacketsReceived.labels(str(self.node.uuid))
+        self.packetListeners: List[Callable[[Packet], None]] = []
         self.manager.registerRoomHub(self)
 
     def lookupRoute(self, destination: UUID) -> Optional[RouteTableItem]:
-        for hubUuid in self.connectedHubs:
-            if hubUuid == destination:
-                return RouteTableItem(
-                    destination=destination,
-                    nextHop=destination,
-                    cost=1
-                )
-        for deviceUuid in self.connectedDevices:
-            if deviceUuid == destination:
-                return RouteTableItem(
-                    destination=destination,
-                    nextHop=destination,
-                    cost=1
-                )
-        for item in self.routeTable:
-            if item.destination == destination:
-                if item.expires.timestamp() > datetime.now().timestamp():
-                    return item
-        return None
+        if destination in self.connectedHubs or destination in self.connectedDevices:
+            return RouteTableItem(
+                destination=destination,
+                nextHop=destination,
+                cost=1
+            )
+        item = self.routeTable.get(destination)
+        if item is None:
+            return None
+        if item.expires <= monotonic():
+            del self.routeTable[destination]
+            return None
+        return item
 
     def addRoute(self, destination: UUID, nextHop: UUID, cost: int) -> None:
+        now = monotonic()
+        self._evictExpiredRoutes(now)
         item = self.lookupRoute(destination)
         if item:
-            if cost < item.cost:
+            if cost < item.cost and self.routeTable.get(destination) is item:
                 item.nextHop = nextHop
                 item.cost = cost
-                item.expires = datetime.now() + timedelta(seconds=3)
+                item.expires = now + self.routeLifetime
+                heapq.heappush(self._routeExpiryHeap, (item.expires, destination))
         else:
-            self.routeTable.append(RouteTableItem(
+            item = RouteTableItem(
                 destination=destination,
                 nextHop=nextHop,
-                cost=cost
-            ))
+                cost=cost,
+                expires=now + self.routeLifetime
+            )
+            self.routeTable[destination] = item
+            heapq.heappush(self._routeExpiryHeap, (item.expires, destination))
+
+    def _evictExpiredRoutes(self, now: float) -> None:
+        heap = self._routeExpiryHeap
+        while heap and heap[0][0] <= now:
+            _, destination = heapq.heappop(heap)
+            item = self.routeTable.get(destination)
+            if item is not None and item.expires <= now:
+                del self.routeTable[destination]
 
     def findRoute(self, destination: UUID, onFound: Callable[[RouteTableItem], None]) -> None:
         if destination == self.node.uuid:
             return
         route = self.lookupRoute(destination)
         if route:
+            metrics.routeLookupHits.inc()
             onFound(route)
+        elif self.manager.topology is not None:
+            # Shortest-path mode: the manager already knows the graph, so no discovery flood is needed.
+            hop = self.manager.topology.nextHop(self.node.uuid, destination)
+            if hop:
+                metrics.routeLookupHits.inc()
+                nextHop, cost = hop
+                onFound(RouteTableItem(destination=destination, nextHop=nextHop, cost=cost))
         else:
-            self.onRouteFoundCallbacks[destination] = onFound
-            self.node.sendPacket(None, ActionPacket(
-                type=ActionType.DISCOVERY_REQUEST,
-                sender=self.node.uuid,
-                recipient=destination,
-                context=f"{self.node.uuid}",
-            ))
+            now = monotonic()
+            self._expirePendingDiscoveries(now)
+            with self._discoveryLock:
+                pending = self.pendingDiscoveries.get(destination)
+                if pending is not None:
+                    # Piggyback on the discovery already in flight instead of flooding again.
+                    if len(pending.waiters) >= self.maxPendingWaiters:
+                        self._dropWaiters(1)
+                        return
+                    pending.waiters.append(onFound)
+                    return
+                pending = PendingDiscovery(destination)
+                pending.waiters.append(onFound)
+                self.pendingDiscoveries[destination] = pending
+                request = self._prepareDiscoveryRequest(pending, now)
+            self._floodDiscoveryRequest(request)
+
+    def _prepareDiscoveryRequest(self, pending: PendingDiscovery, now: float) -> Packet:
+        """
+        Start a new attempt for a pending discovery and return the request to flood. Called with the lock held.
+        """
+        pending.requestId = uuid7()
+        pending.attempts += 1
+        pending.deadline = now + self.discoveryTimeout
+        metrics.discoveryRequests.inc()
+        heapq.heappush(self._discoveryDeadlineHeap, (pending.deadline, pending.destination, pending.requestId))
+        self._scheduleDiscoveryTimer(pending.deadline)
+        request = Packet(
+            type=ActionType.DISCOVERY_REQUEST,
+            sender=self.node.uuid,
+            recipient=pending.destination,
+            context=f"{self.node.uuid}",
+            requestId=pending.requestId,
+        )
+        self._markDiscoverySeen(request)
+        return request
+
+    def _floodDiscoveryRequest(self, request: Packet) -> None:
+        for hub in tuple(self.connectedHubs):
+            self.node.sendPacket(hub, request)
+
+    def _expirePendingDiscoveries(self, now: float) -> None:
+        """
+        Retry discoveries past their deadline, or give up on them once maxDiscoveryAttempts is reached.
+
+        Runs from a timer armed for the earliest deadline, and also whenever the hub receives a packet or looks up a
+        route, so a busy hub does not wait for the timer thread.
+        """
+        retries: List[Packet] = []
+        with self._discoveryLock:
+            heap = self._discoveryDeadlineHeap
+            while heap and heap[0][0] <= now:
+                _, destination, requestId = heapq.heappop(heap)
+                pending = self.pendingDiscoveries.get(destination)
+                if pending is None or pending.requestId != requestId:
+                    continue
+                if pending.attempts < self.maxDiscoveryAttempts:
+                    retries.append(self._prepareDiscoveryRequest(pending, now))
+                else:
+                    del self.pendingDiscoveries[destination]
+                    self.expiredDiscoveryCount += 1
+                    self._dropWaiters(len(pending.waiters))
+        for request in retries:
+            self._floodDiscoveryRequest(request)
 
-    def registerPacketListener(self, listener: Callable[[ActionPacket], None]) -> None:
+    def _scheduleDiscoveryTimer(self, deadline: float) -> None:
+        """
+        Arm the expiry timer for deadline unless it already fires earlier. Called with the lock held.
+        """
+        if self._discoveryTimer is not None and self._discoveryTimerAt <= deadline:
+            return
+        if self._discoveryTimer is not None:
+            self._discoveryTimer.cancel()
+        self._discoveryTimerAt = deadline
+        self._discoveryTimer = threading.Timer(max(deadline - monotonic(), 0.0), self._onDiscoveryTimer)
+        self._discoveryTimer.daemon = True
+        self._discoveryTimer.start()
+
+    def _onDiscoveryTimer(self) -> None:
+        with self._discoveryLock:
+            self._discoveryTimer = None
+            self._discoveryTimerAt = inf
+        self._expirePendingDiscoveries(monotonic())
+        with self._discoveryLock:
+            if self._discoveryDeadlineHeap:
+                self._scheduleDiscoveryTimer(self._discoveryDeadlineHeap[0][0])
+
+    def _dropWaiters(self, count: int) -> None:
+        self.droppedWaiterCount += count
+        metrics.discoveryWaitersDropped.inc(count)
+
+    def _resolvePendingDiscovery(self, route: RouteTableItem) -> None:
+        with self._discoveryLock:
+            pending = self.pendingDiscoveries.pop(route.destination, None)
+        if pending is None:
+            return
+        for waiter in pending.waiters:
+            try:
+                waiter(route)
+            except Exception:
+                continue
+
+    def clearPendingDiscoveries(self) -> None:
+        with self._discoveryLock:
+            for pending in self.pendingDiscoveries.values():
+                self._dropWaiters(len(pending.waiters))
+            self.pendingDiscoveries.clear()
+            self._discoveryDeadlineHeap.clear()
+            if self._discoveryTimer is not None:
+                self._discoveryTimer.cancel()
+                self._discoveryTimer = None
+                self._discoveryTimerAt = inf
+
+    def _markDiscoverySeen(self, packet: Packet) -> bool:
+        """
+        Remember a discovery request and return False if it was already seen within the cache window.
+        """
+        if packet.requestId is None or packet.recipient is None:
+            return True
+        key = (packet.sender, packet.recipient, packet.requestId)
+        now = monotonic()
+        seenAt = self._seenDiscoveries.get(key)
+        if seenAt is not None and now - seenAt < self.discoveryCacheWindow:
+            return False
+        self._seenDiscoveries[key] = now
+        self._seenDiscoveries.move_to_end(key)
+        while len(self._seenDiscoveries) > self.discoveryCacheSize:
+            self._seenDiscoveries.popitem(last=False)
+        return True
+
+    def registerPacketListener(self, listener: Callable[[Packet], None]) -> None:
         if listener not in self.packetListeners:
             self.packetListeners.append(listener)
 
-    def unregisterPacketListener(self, listener: Callable[[ActionPacket], None]) -> None:
+    def unregisterPacketListener(self, listener: Callable[[Packet], None]) -> None:
         if listener in self.packetListeners:
             self.packetListeners.remove(listener)
 
-    def _notifyPacketListeners(self, packet: ActionPacket) -> None:
+    def _notifyPacketListeners(self, packet: Packet) -> None:
         for listener in list(self.packetListeners):
             try:
-                listener(packet.model_copy(deep=True))
+                listener(packet)
             except Exception:
                 continue
 
-    def onPacketReceived(self, packet: ActionPacket) -> None:
-        print(f"{self.name} received packet: {packet}")
+    def onPacketReceived(self, packet: Packet) -> None:
+        self._receivedCounter.inc()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s received packet: %r",
+                self.name,
+                packet,
+                extra={"nodeUuid": self.node.uuid, "packet": packet},
+            )
         self._notifyPacketListeners(packet)
+        if self._discoveryDeadlineHeap:
+            self._expirePendingDiscoveries(monotonic())
         if packet.type == ActionType.DISCOVERY_REQUEST:
             if packet.recipient is None:
                 return
+            if packet.sender == self.node.uuid:
+                # Our own request echoed back around a cycle.
+                self.suppressedDiscoveryCount += 1
+                metrics.discoverySuppressed.inc()
+                return
             route = self.lookupRoute(packet.recipient)
             try:
                 lastHop = UUID(packet.context)
             except ValueError:
                 return
+            # Learn the reverse path from every copy so the cheapest one wins, but only act on the first.
             self.addRoute(packet.sender, lastHop, packet.originalTtl - packet.ttl)
+            if not self._markDiscoverySeen(packet):
+                self.suppressedDiscoveryCount += 1
+                metrics.discoverySuppressed.inc()
+                return
             if route:
-                self.node.sendPacket(lastHop, ActionPacket(
+                self.node.sendPacket(lastHop, Packet(
                     type=ActionType.DISCOVERY_RESPONSE,
                     sender=packet.recipient,
                     recipient=packet.sender,
@@ -114,10 +321,10 @@ class RoomHub:
                     ttl=packet.originalTtl - route.cost
                 ))
             else:
-                packet.context = f"{self.node.uuid}"
-                for hub in self.connectedHubs:
+                forwarded = packet.derive(context=f"{self.node.uuid}")
+                for hub in tuple(self.connectedHubs):
                     if hub != lastHop:
-                        self.node.sendPacket(hub, packet)
+                        self.node.sendPacket(hub, forwarded)
         elif packet.type == ActionType.DISCOVERY_RESPONSE:
             if packet.recipient is None:
                 return
@@ -128,57 +335,58 @@ class RoomHub:
                 return
             self.addRoute(packet.sender, lastHop, packet.originalTtl - packet.ttl)
             if route:
-                packet.context = f"{self.node.uuid}"
-                self.node.sendPacket(route.nextHop, packet)
-            if packet.sender in self.onRouteFoundCallbacks:
-                self.onRouteFoundCallbacks[packet.sender](RouteTableItem(
+                self.node.sendPacket(route.nextHop, packet.derive(context=f"{self.node.uuid}"))
+            if packet.sender in self.pendingDiscoveries:
+                self._resolvePendingDiscovery(RouteTableItem(
                     destination=packet.sender,
                     nextHop=lastHop,
                     cost=packet.originalTtl - packet.ttl
                 ))
-                del self.onRouteFoundCallbacks[packet.sender]
         elif packet.type == ActionType.CONNECT_CHECK_REQUEST:
             if packet.recipient is None:
                 return
             if packet.recipient in self.connectedDevices or packet.recipient in self.connectedHubs:
-                self.node.sendPacket(packet.sender, ActionPacket(
+                self.node.sendPacket(packet.sender, Packet(
                     type=ActionType.CONNECT_CHECK_RESPONSE,
                     sender=packet.recipient,
                     recipient=packet.sender,
-                    context="OK"
+                    context="OK",
+                    requestId=packet.requestId
                 ))
             else:
-                self.node.sendPacket(packet.sender, ActionPacket(
+                self.node.sendPacket(packet.sender, Packet(
                     type=ActionType.CONNECT_CHECK_RESPONSE,
                     sender=packet.recipient,
                     recipient=packet.sender,
-                    context="NOT_OK"
+                    context="NOT_OK",
+                    requestId=packet.requestId
                 ))
         elif packet.type == ActionType.CONNECT_CHECK_RESPONSE:
             return
         elif packet.type == ActionType.ADJACENT_HUBS_REQUEST:
             hubs: list[str] = [str(hub) for hub in self.connectedHubs]
-            self.node.sendPacket(packet.sender, ActionPacket(
+            self.node.sendPacket(packet.sender, Packet(
                 type=ActionType.ADJACENT_HUBS_RESPONSE,
                 sender=self.node.uuid,
                 recipient=packet.sender,
-                context=json.dumps({"hubs": hubs})
+                context=json.dumps({"hubs": hubs}),
+                requestId=packet.requestId
             ))
         elif packet.type == ActionType.ADJACENT_HUBS_RESPONSE:
             return
         elif packet.type == ActionType.HUB_NAME_REQUEST:
-            self.node.sendPacket(packet.sender, ActionPacket(
+            self.node.sendPacket(packet.sender, Packet(
                 type=ActionType.HUB_NAME_RESPONSE,
                 sender=self.node.uuid,
                 recipient=packet.sender,
-                context=self.name
+                context=self.name,
+                requestId=packet.requestId
             ))
         elif packet.type == ActionType.HUB_NAME_RESPONSE:
             return
         elif packet.type == ActionType.PING:
             if packet.recipient is None:
-                for deviceUuid in self.connectedDevices:
-                    self.node.sendPacket(deviceUuid, packet)
+                self.node.multicastPacket(tuple(self.connectedDevices), packet)
             else:
                 if packet.recipient in self.connectedDevices:
                     self.node.sendPacket(packet.recipient, packet)
@@ -187,29 +395,36 @@ class RoomHub:
                 return
             self.findRoute(packet.recipient, lambda route: self.node.sendPacket(route.nextHop, packet))
             if packet.sender in self.connectedDevices:
-                packetCopy = packet.model_copy(deep=True)
-                packetCopy.recipient = None
-                packetCopy.context = None
-                for deviceUuid in self.connectedDevices:
-                    if deviceUuid != packet.sender:
-                        self.node.sendPacket(deviceUuid, packetCopy)
+                self.node.multicastPacket(
+                    [deviceUuid for deviceUuid in tuple(self.connectedDevices) if deviceUuid != packet.sender],
+                    packet.derive(recipient=None, context=None),
+                )
         else:
             if packet.sender not in self.connectedDevices:
                 if packet.type == ActionType.JOIN:
-                    self.connectedDevices.append(packet.sender)
-                else:
+                    self._departedDevices.pop(packet.sender, None)
+                    self.connectedDevices[packet.sender] = None
+                elif packet.type != ActionType.LEAVE or packet.sender not in self._departedDevices:
                     return
+                else:
+                    # With a queued delivery engine, Manager.onDeviceLeftHub has already dropped the sender by the
+                    # time its LEAVE arrives; the other members must still hear about it, once.
+                    del self._departedDevices[packet.sender]
             if packet.recipient is not None and packet.recipient in self.connectedDevices:
                 self.node.sendPacket(packet.recipient, packet)
-            packetCopy = packet.model_copy(deep=True)
+            fanOutPacket = packet
             if packet.type == ActionType.WHISPER:
-                packetCopy.context = None
+                fanOutPacket = packet.derive(context=None)
             elif packet.type == ActionType.LEAVE:
-                if packet.sender in self.connectedDevices:
-                    self.connectedDevices.remove(packet.sender)
-            for deviceUuid in self.connectedDevices:
-                if deviceUuid != packet.sender and deviceUuid != packet.recipient:
-                    self.node.sendPacket(deviceUuid, packetCopy)
+                self.connectedDevices.pop(packet.sender, None)
+            self.node.multicastPacket(
+                [
+                    deviceUuid
+                    for deviceUuid in tuple(self.connectedDevices)
+                    if deviceUuid != packet.sender and deviceUuid != packet.recipient
+                ],
+                fanOutPacket,
+            )
 
     def isHubConnected(self, hubUuid: UUID) -> bool:
         return hubUuid in self.connectedHubs
@@ -221,19 +436,36 @@ class RoomHub:
         if hubNode.uuid in self.connectedHubs:
             return
         self.manager.createConnection(self.node, hubNode)
-        self.connectedHubs.append(hubNode.uuid)
-        if self.node.uuid not in hub.connectedHubs:
-            hub.connectedHubs.append(self.node.uuid)
+        self.connectedHubs[hubNode.uuid] = None
+        hub.connectedHubs[self.node.uuid] = None
 
     def onConnectAI(self, ai: "AIDevice") -> None:
         aiNode = ai.node
-        self.connectedDevices.append(aiNode.uuid)
+        self._departedDevices.pop(aiNode.uuid, None)
+        self.connectedDevices[aiNode.uuid] = None
+
+    def dropDevice(self, deviceUuid: UUID) -> None:
+        """
+        Remove a member, remembering it so that its LEAVE is still announced if it arrives afterwards.
+        """
+        if deviceUuid not in self.connectedDevices:
+            return
+        del self.connectedDevices[deviceUuid]
+        self._departedDevices[deviceUuid] = None
+        if len(self._departedDevices) > self.departedMemorySize:
+            self._departedDevices.popitem(last=False)
+
+    def clearRoutes(self) -> None:
+        self.routeTable.clear()
+        self._routeExpiryHeap.clear()
 
     def removeRoutesFor(self, targetUuid: UUID) -> None:
-        self.routeTable = [
-            item
-            for item in self.routeTable
-            if item.destination != targetUuid and item.nextHop != targetUuid
-        ]
-        if targetUuid in self.onRouteFoundCallbacks:
-            del self.onRouteFoundCallbacks[targetUuid]
+        self.routeTable = {
+            destination: item
+            for destination, item in self.routeTable.items()
+            if destination != targetUuid and item.nextHop != targetUuid
+        }
+        with self._discoveryLock:
+            pending = self.pendingDiscoveries.pop(targetUuid, None)
+            if pending is not None:
+                self._dropWaiters(len(pending.waiters))
@@ -1,33 +1,90 @@
 import os
 
-from typing import Any, List, Optional, Callable, TYPE_CHECKING, Tuple
+from typing import Any, Dict, List, Optional, Callable, Set, TYPE_CHECKING, Tuple
 from uuid import UUID
 
 from app.network.node import Node
 from app.network.connection import Connection
-from app.models.action_packet import ActionPacket
+from app.network.delivery import DeliveryEngine, SynchronousDeliveryEngine
+from app.network.topology import HubTopology
+from app.llm.agent_runtime import AgentRuntime, ThreadAgentRuntime
+from app.llm.client_registry import ClientRegistry
+from app.llm.context_window import ContextWindowConfig
+from app.llm.idle_budget import IdleBudget
+from app.llm.prompt_cache import PromptPrefixRegistry
+from app.llm.scheduler import LLMScheduler
+from app.metrics import hubPacketsReceived, llmCachedPromptTokens, llmPromptTokens
+from app.network.packet import Packet
 
 if TYPE_CHECKING:
     from app.network.devices.room_hub import RoomHub
     from app.network.devices.ai_device import AIDevice
+    from app.llm.fake_openai import FakeCompletionConfig
 
 class Manager:
-    def __init__(self) -> None:
-        self.nodes: List[Node] = []
-        self.connections: List[Connection] = []
-        self.roomHubs: List["RoomHub"] = []
-        self.devices: List["AIDevice"] = []
+    ROUTING_MODES = ("discovery", "shortest_path")
+    LLM_BACKENDS = ("openai", "fake")
+
+    def __init__(
+        self,
+        deliveryEngine: Optional[DeliveryEngine] = None,
+        routingMode: str = "discovery",
+        llmBackend: str = "openai",
+        fakeCompletionConfig: Optional["FakeCompletionConfig"] = None,
+        agentRuntime: Optional[AgentRuntime] = None,
+        clientRegistry: Optional[ClientRegistry] = None,
+        llmScheduler: Optional[LLMScheduler] = None,
+        contextConfig: Optional[ContextWindowConfig] = None,
+        idleBudget: Optional[IdleBudget] = None,
+        openaiExtensions: Optional[bool] = None,
+    ) -> None:
+        if routingMode not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode: {routingMode}")
+        if llmBackend not in self.LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {llmBackend}")
+        self.deliveryEngine = deliveryEngine or SynchronousDeliveryEngine()
+        self.routingMode = routingMode
+        # "fake" gives every new AI device an in-process stand-in client, for load tests that must not hit the API.
+        self.llmBackend = llmBackend
+        self.fakeCompletionConfig = fakeCompletionConfig
+        self._fakeClient: Optional[Any] = None
+        self.agentRuntime = agentRuntime or ThreadAgentRuntime()
+        # Devices with the same endpoint and key share one OpenAI client and its connection pool.
+        self.clientRegistry = clientRegistry or ClientRegistry()
+        # Every device's completion requests queue here for the shared concurrency and rate budgets.
+        self.llmScheduler = llmScheduler or LLMScheduler()
+        # History limits applied by every agent loop this manager starts.
+        self.contextConfig = contextConfig or ContextWindowConfig()
+        # Backoff and shared per-minute cap for the turns agents take when nothing happens.
+        self.idleBudget = idleBudget or IdleBudget()
+        # Whether requests carry OpenAI-only parameters (prompt_cache_key, stream_options). None sends them only to
+        # the fake backend and the default OpenAI endpoint, since other compatible servers may reject them.
+        self.openaiExtensions = openaiExtensions
+        # Static request prefixes shared by devices with the same configuration.
+        self.promptPrefixes = PromptPrefixRegistry()
+        # Only maintained in "shortest_path" mode; hubs flood discovery requests otherwise.
+        self.topology: Optional[HubTopology] = HubTopology() if routingMode == "shortest_path" else None
+        # Registries are keyed by node UUID so lookups stay constant time as the topology grows.
+        self.nodes: Dict[UUID, Node] = {}
+        self.connections: Set[Connection] = set()
+        self.roomHubs: Dict[UUID, "RoomHub"] = {}
+        self.devices: Dict[UUID, "AIDevice"] = {}
+        # Per-node adjacency index: node UUID -> connections touching that node.
+        self.nodeConnections: Dict[UUID, Set[Connection]] = {}
         self._stateChangeListeners: List[Callable[[str, dict[str, Any]], None]] = []
-        self._packetListeners: List[Callable[[UUID, UUID, ActionPacket], None]] = []
+        self._packetListeners: List[Callable[[UUID, UUID, Packet], None]] = []
+        self._packetMulticastListeners: List[Callable[[UUID, List[UUID], Packet], None]] = []
 
-    def createNode(self, onPacketReceived: Optional[Callable[[ActionPacket], None]] = None) -> Node:
+    def createNode(self, onPacketReceived: Optional[Callable[[Packet], None]] = None) -> Node:
         node = Node(onPacketReceived=onPacketReceived, manager=self)
-        self.nodes.append(node)
+        self.nodes[node.uuid] = node
         return node
 
     def createConnection(self, node1: Node, node2: Node) -> Connection:
         connection = Connection(node1, node2, manager=self)
-        self.connections.append(connection)
+        self.connections.add(connection)
+        self.nodeConnections.setdefault(node1.uuid, set()).add(connection)
+        self.nodeConnections.setdefault(node2.uuid, set()).add(connection)
         return connection
 
     def createConnectionByUuids(self, uuid1: UUID, uuid2: UUID) -> Connection:
@@ -38,10 +95,7 @@ class Manager:
         return self.createConnection(node1, node2)
 
     def getNodeByUuid(self, uuid: UUID) -> Optional[Node]:
-        for node in self.nodes:
-            if node.uuid == uuid:
-                return node
-        return None
+        return self.nodes.get(uuid)
 
     def createRoomHub(self, name: str) -> "RoomHub":
         from app.network.devices.room_hub import RoomHub
@@ -49,16 +103,13 @@ class Manager:
         return RoomHub(name=name, manager=self)
 
     def getRoomHubByUuid(self, uuid: UUID) -> Optional["RoomHub"]:
-        for hub in self.roomHubs:
-            if hub.node.uuid == uuid:
-                return hub
-        return None
+        return self.roomHubs.get(uuid)
 
     def getDeviceByUuid(self, uuid: UUID) -> Optional["AIDevice"]:
-        for device in self.devices:
-            if device.node.uuid == uuid:
-                return device
-        return None
+        return self.devices.get(uuid)
+
+    def getConnectionsForNode(self, uuid: UUID) -> List[Connection]:
+        return list(self.nodeConnections.get(uuid, ()))
 
     def resolveNodeInfo(self, uuid: UUID) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -83,21 +134,32 @@ class Manager:
         debug: bool = False,
         coolTime: float = 0.2,
         timeOut: float = 10,
+        earlyToolDispatch: bool = False,
+        requestTimeout: float = 0.0,
+        coalesceWindow: float = 0.0,
     ) -> "AIDevice":
-        from openai import OpenAI
         from app.network.devices.ai_device import AIDevice
 
-        # Allow optional environment overrides for OpenAI client configuration.
-        clientConfig = {}
-        apiKey = os.getenv("OPENAI_API_KEY")
-        if apiKey:
-            clientConfig["api_key"] = apiKey
-
-        baseUrl = os.getenv("OPENAI_BASE_URL")
-        if baseUrl:
-            clientConfig["base_url"] = baseUrl
-
-        client = OpenAI(**clientConfig)
+        useAsyncClient = self.agentRuntime.usesAsyncClient
+        baseUrl = os.getenv("OPENAI_BASE_URL") or None
+        openaiExtensions = self.openaiExtensions
+        if openaiExtensions is None:
+            openaiExtensions = self.llmBackend == "fake" or baseUrl is None
+        if self.llmBackend == "fake":
+            from app.llm.fake_openai import FakeAsyncOpenAI, FakeOpenAI
+
+            # One shared fake keeps seeded runs reproducible and counts completions across every device.
+            if self._fakeClient is None:
+                fakeClass = FakeAsyncOpenAI if useAsyncClient else FakeOpenAI
+                self._fakeClient = fakeClass(self.fakeCompletionConfig)
+            client = self._fakeClient
+        else:
+            # Allow optional environment overrides for OpenAI client configuration.
+            client = self.clientRegistry.getClient(
+                baseUrl=baseUrl,
+                apiKey=os.getenv("OPENAI_API_KEY") or None,
+                asyncClient=useAsyncClient,
+            )
         return AIDevice(
             name=name,
             manager=self,
@@ -109,6 +171,10 @@ class Manager:
             debug=debug,
             coolTime=coolTime,
             timeOut=timeOut,
+            earlyToolDispatch=earlyToolDispatch,
+            requestTimeout=requestTimeout,
+            coalesceWindow=coalesceWindow,
+            openaiExtensions=openaiExtensions,
         )
 
     def setDeviceHub(self, deviceUuid: UUID, hubUuid: UUID) -> None:
@@ -144,12 +210,14 @@ class Manager:
             except ValueError:
                 pass
 
+        self.agentRuntime.stop(device)
+        self.clientRegistry.releaseClient(device.client)
         self._removeConnectionsForNode(device.node)
 
-        if device in self.devices:
-            self.devices.remove(device)
-        if device.node in self.nodes:
-            self.nodes.remove(device.node)
+        self.devices.pop(device.node.uuid, None)
+        self.nodes.pop(device.node.uuid, None)
+        llmPromptTokens.remove(str(uuid))
+        llmCachedPromptTokens.remove(str(uuid))
         self._notifyStateChange("device.deleted", {"deviceUuid": str(uuid)})
 
     def connectRoomHubs(self, uuid1: UUID, uuid2: UUID) -> None:
@@ -166,6 +234,8 @@ class Manager:
             raise ValueError("Hubs are already connected")
 
         hub1.connectHub(hub2)
+        if self.topology:
+            self.topology.addLink(uuid1, uuid2)
         self._notifyStateChange(
             "hub.connection.created",
             {"sourceHubUuid": str(hub1.node.uuid), "targetHubUuid": str(hub2.node.uuid)},
@@ -173,13 +243,18 @@ class Manager:
 
     def _removeConnection(self, connection: Connection) -> None:
         connection.disconnect()
-        if connection in self.connections:
-            self.connections.remove(connection)
+        self.connections.discard(connection)
+        for node in (connection.node1, connection.node2):
+            adjacent = self.nodeConnections.get(node.uuid)
+            if adjacent is None:
+                continue
+            adjacent.discard(connection)
+            if not adjacent:
+                del self.nodeConnections[node.uuid]
 
     def _removeConnectionsForNode(self, node: Node) -> None:
-        for connection in list(self.connections):
-            if connection.node1 == node or connection.node2 == node:
-                self._removeConnection(connection)
+        for connection in self.getConnectionsForNode(node.uuid):
+            self._removeConnection(connection)
 
     def removeConnectionByUuids(self, uuid1: UUID, uuid2: UUID) -> None:
         node1 = self.getNodeByUuid(uuid1)
@@ -189,7 +264,7 @@ class Manager:
             raise ValueError("Node not found")
 
         removed = False
-        for connection in list(self.connections):
+        for connection in self.getConnectionsForNode(node1.uuid):
             if (
                 (connection.node1 == node1 and connection.node2 == node2)
                 or (connection.node1 == node2 and connection.node2 == node1)
@@ -212,13 +287,13 @@ class Manager:
 
         self.removeConnectionByUuids(hub1.node.uuid, hub2.node.uuid)
 
-        if uuid2 in hub1.connectedHubs:
-            hub1.connectedHubs.remove(uuid2)
-        if uuid1 in hub2.connectedHubs:
-            hub2.connectedHubs.remove(uuid1)
+        hub1.connectedHubs.pop(uuid2, None)
+        hub2.connectedHubs.pop(uuid1, None)
 
         hub1.removeRoutesFor(uuid2)
         hub2.removeRoutesFor(uuid1)
+        if self.topology:
+            self.topology.removeLink(uuid1, uuid2)
         self._notifyStateChange(
             "hub.connection.removed",
             {"sourceHubUuid": str(uuid1), "targetHubUuid": str(uuid2)},
@@ -242,60 +317,85 @@ class Manager:
                 self.onDeviceLeftHub(device, hub.node.uuid)
                 device.hubUuid = None
 
-        for otherHub in self.roomHubs:
+        for otherHub in self.roomHubs.values():
             if otherHub.node.uuid != uuid:
                 otherHub.removeRoutesFor(uuid)
-                if uuid in otherHub.connectedHubs:
-                    otherHub.connectedHubs.remove(uuid)
+                otherHub.connectedHubs.pop(uuid, None)
 
         self._removeConnectionsForNode(hub.node)
 
-        if hub in self.roomHubs:
-            self.roomHubs.remove(hub)
-        if hub.node in self.nodes:
-            self.nodes.remove(hub.node)
+        self.roomHubs.pop(uuid, None)
+        self.nodes.pop(uuid, None)
+        hubPacketsReceived.remove(str(uuid))
+        if self.topology:
+            self.topology.removeHub(uuid)
 
         hub.connectedDevices.clear()
         hub.connectedHubs.clear()
-        hub.routeTable.clear()
-        hub.onRouteFoundCallbacks.clear()
+        hub.clearRoutes()
+        hub.clearPendingDiscoveries()
         self._notifyStateChange("hub.deleted", {"hubUuid": str(uuid)})
 
     def registerRoomHub(self, hub: "RoomHub") -> None:
-        if hub not in self.roomHubs:
-            self.roomHubs.append(hub)
+        if hub.node.uuid not in self.roomHubs:
+            self.roomHubs[hub.node.uuid] = hub
+            if self.topology:
+                self.topology.addHub(hub.node.uuid)
             self._notifyStateChange("hub.created", {"hubUuid": str(hub.node.uuid)})
 
     def registerDevice(self, device: "AIDevice") -> None:
-        if device not in self.devices:
-            self.devices.append(device)
+        if device.node.uuid not in self.devices:
+            self.devices[device.node.uuid] = device
             self._notifyStateChange("device.created", {"deviceUuid": str(device.node.uuid)})
 
     def getRoomHubs(self) -> List["RoomHub"]:
-        return list(self.roomHubs)
+        return list(self.roomHubs.values())
 
     def getDevices(self) -> List["AIDevice"]:
-        return list(self.devices)
+        return list(self.devices.values())
 
     def registerPacketTransferListener(
         self,
-        listener: Callable[[UUID, UUID, ActionPacket], None],
+        listener: Callable[[UUID, UUID, Packet], None],
     ) -> None:
         if listener not in self._packetListeners:
             self._packetListeners.append(listener)
 
     def unregisterPacketTransferListener(
         self,
-        listener: Callable[[UUID, UUID, ActionPacket], None],
+        listener: Callable[[UUID, UUID, Packet], None],
     ) -> None:
         if listener in self._packetListeners:
             self._packetListeners.remove(listener)
 
-    def notifyPacketTransfer(self, source: Node, target: Node, packet: ActionPacket) -> None:
-        packetCopy = packet.model_copy(deep=True)
+    def notifyPacketTransfer(self, source: Node, target: Node, packet: Packet) -> None:
         for listener in list(self._packetListeners):
             try:
-                listener(source.uuid, target.uuid, packetCopy)
+                listener(source.uuid, target.uuid, packet)
+            except Exception:
+                continue
+
+    def registerPacketMulticastListener(
+        self,
+        listener: Callable[[UUID, List[UUID], Packet], None],
+    ) -> None:
+        if listener not in self._packetMulticastListeners:
+            self._packetMulticastListeners.append(listener)
+
+    def unregisterPacketMulticastListener(
+        self,
+        listener: Callable[[UUID, List[UUID], Packet], None],
+    ) -> None:
+        if listener in self._packetMulticastListeners:
+            self._packetMulticastListeners.remove(listener)
+
+    def notifyPacketMulticast(self, source: Node, targets: List[Node], packet: Packet) -> None:
+        if not self._packetMulticastListeners:
+            return
+        targetUuids = [target.uuid for target in targets]
+        for listener in list(self._packetMulticastListeners):
+            try:
+                listener(source.uuid, targetUuids, packet)
             except Exception:
                 continue
 
@@ -311,8 +411,9 @@ class Manager:
         hub = self.getRoomHubByUuid(hubUuid)
         if not hub:
             return
-        if device.node.uuid not in hub.connectedDevices:
-            hub.connectedDevices.append(device.node.uuid)
+        hub.onConnectAI(device)
+        if self.topology:
+            self.topology.setDeviceHub(device.node.uuid, hubUuid)
         self._notifyStateChange(
             "device.moved",
             {"deviceUuid": str(device.node.uuid), "hubUuid": str(hubUuid)},
@@ -322,8 +423,10 @@ class Manager:
         if not hubUuid:
             return
         hub = self.getRoomHubByUuid(hubUuid)
-        if hub and device.node.uuid in hub.connectedDevices:
-            hub.connectedDevices.remove(device.node.uuid)
+        if hub:
+            hub.dropDevice(device.node.uuid)
+        if self.topology:
+            self.topology.setDeviceHub(device.node.uuid, None)
         try:
             self.removeConnectionByUuids(device.node.uuid, hubUuid)
         except ValueError:
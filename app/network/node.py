@@ -1,8 +1,9 @@
-from typing import Callable, Optional, List, TYPE_CHECKING
+from typing import Callable, Dict, Iterable, Optional, List, TYPE_CHECKING
 from uuid import UUID
 from uuid6 import uuid7
 
-from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
+from app.metrics import packetsForwardedByType, ttlExhaustedDrops
 
 if TYPE_CHECKING:
     from app.network.connection import Connection
@@ -12,35 +13,79 @@ class Node:
     def __init__(
         self,
         uuid: Optional[UUID] = None,
-        onPacketReceived: Optional[Callable[[ActionPacket], None]] = None,
+        onPacketReceived: Optional[Callable[[Packet], None]] = None,
         manager: Optional["Manager"] = None,
     ) -> None:
         self.uuid = uuid or uuid7()
         self.connections: List["Connection"] = []
+        # Peer UUID -> connection, so unicast forwarding does not scan every connection.
+        self.peers: Dict[UUID, "Connection"] = {}
         self.onPacketReceived = onPacketReceived
         self.manager = manager
 
     def addConnection(self, connection: "Connection") -> None:
         self.connections.append(connection)
+        self.peers[connection.getPeerUuid(self)] = connection
 
     def removeConnection(self, connection: "Connection") -> None:
-        if connection in self.connections:
-            self.connections.remove(connection)
+        if connection not in self.connections:
+            return
+        self.connections.remove(connection)
+        peerUuid = connection.getPeerUuid(self)
+        if self.peers.get(peerUuid) is connection:
+            del self.peers[peerUuid]
+            # Fall back to any remaining parallel connection to the same peer.
+            for remaining in self.connections:
+                if remaining.hasNode(peerUuid):
+                    self.peers[peerUuid] = remaining
+                    break
 
-    def sendPacket(self, recipient: Optional[UUID], packet: ActionPacket) -> None:
+    def sendPacket(self, recipient: Optional[UUID], packet: Packet) -> None:
         if packet.ttl <= 0:
+            ttlExhaustedDrops.inc()
             return
-        packet.ttl -= 1
+        packet = packet.withTtl(packet.ttl - 1)
         if recipient:
-            for connection in self.connections:
-                if connection.hasNode(recipient):
-                    connection.transferPacket(self, packet)
-                    return
-            raise ValueError("Recipient is not connected to this node")
+            connection = self.peers.get(recipient)
+            if connection is None:
+                raise ValueError("Recipient is not connected to this node")
+            connection.transferPacket(self, packet)
         else:
             for connection in self.connections:
                 connection.transferPacket(self, packet)
 
-    def receivePacket(self, packet: ActionPacket) -> None:
+    def multicastPacket(self, recipients: Iterable[UUID], packet: Packet) -> None:
+        """
+        Deliver one shared packet to several directly connected peers in a single pass.
+
+        TTL is decremented once and the manager receives a single aggregated notification. Recipients that are no
+        longer connected are skipped rather than aborting the fan-out.
+        """
+        if packet.ttl <= 0:
+            ttlExhaustedDrops.inc()
+            return
+        targets: List["Node"] = []
+        for recipient in recipients:
+            connection = self.peers.get(recipient)
+            if connection is not None:
+                targets.append(connection.getPeer(self))
+        if not targets:
+            return
+        packet = packet.withTtl(packet.ttl - 1)
+        packetsForwardedByType[packet.type].inc(len(targets))
+        if not self.manager:
+            for target in targets:
+                target.receivePacket(packet)
+            return
+        try:
+            self.manager.notifyPacketMulticast(self, targets, packet)
+        except Exception:
+            # Ignore notification failures so packets still flow.
+            pass
+        deliver = self.manager.deliveryEngine.deliver
+        for target in targets:
+            deliver(target, packet)
+
+    def receivePacket(self, packet: Packet) -> None:
         if self.onPacketReceived:
             self.onPacketReceived(packet)
@@ -0,0 +1,90 @@
+from typing import Any, Optional
+from uuid import UUID
+
+from app.enums.action_type import ActionType
+from app.models.action_packet import ActionPacket
+
+
+class Packet:
+    """
+    Slotted packet used on the internal Node/Connection/RoomHub path.
+
+    Instances are shared between hops and listeners and must be treated as immutable; use derive() to obtain a
+    changed view. Pydantic validation only happens when converting to or from ActionPacket at the API boundary.
+    """
+
+    __slots__ = ("type", "sender", "recipient", "context", "ttl", "originalTtl", "requestId")
+
+    def __init__(
+        self,
+        type: ActionType,
+        sender: UUID,
+        recipient: Optional[UUID] = None,
+        context: Optional[str] = None,
+        ttl: int = 128,
+        originalTtl: int = 128,
+        requestId: Optional[UUID] = None,
+    ) -> None:
+        self.type = type
+        self.sender = sender
+        self.recipient = recipient
+        self.context = context
+        self.ttl = ttl
+        self.originalTtl = originalTtl
+        self.requestId = requestId
+
+    def derive(self, **changes: Any) -> "Packet":
+        packet = Packet(
+            self.type, self.sender, self.recipient, self.context, self.ttl, self.originalTtl, self.requestId
+        )
+        for name, value in changes.items():
+            setattr(packet, name, value)
+        return packet
+
+    def withTtl(self, ttl: int) -> "Packet":
+        return Packet(self.type, self.sender, self.recipient, self.context, ttl, self.originalTtl, self.requestId)
+
+    @classmethod
+    def fromActionPacket(cls, packet: ActionPacket) -> "Packet":
+        return cls(
+            packet.type,
+            packet.sender,
+            packet.recipient,
+            packet.context,
+            packet.ttl,
+            packet.originalTtl,
+            packet.requestId,
+        )
+
+    def toActionPacket(self) -> ActionPacket:
+        return ActionPacket(
+            type=self.type,
+            sender=self.sender,
+            recipient=self.recipient,
+            context=self.context,
+            ttl=self.ttl,
+            originalTtl=self.originalTtl,
+            requestId=self.requestId,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Packet):
+            return NotImplemented
+        return (
+            self.type == other.type
+            and self.sender == other.sender
+            and self.recipient == other.recipient
+            and self.context == other.context
+            and self.ttl == other.ttl
+            and self.originalTtl == other.originalTtl
+            and self.requestId == other.requestId
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return (
+            f"Packet(type={self.type!r}, sender={self.sender!r}, recipient={self.recipient!r}, "
+            f"context={self.context!r}, ttl={self.ttl}, originalTtl={self.originalTtl}, "
+            f"requestId={self.requestId!r})"
+        )
@@ -0,0 +1,64 @@
+import threading
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from uuid6 import uuid7
+
+from app.network.packet import Packet
+
+
+class PendingRequest:
+    __slots__ = ("responses", "event", "collect")
+
+    def __init__(self, collect: bool) -> None:
+        self.responses: List[Packet] = []
+        self.event = threading.Event()
+        # Broadcast requests keep collecting until the wait ends; others finish at the first response.
+        self.collect = collect
+
+
+class PendingRequests:
+    """
+    Correlates response packets with the request that asked for them, by Packet.requestId.
+
+    A caller opens a request, sends a packet carrying its id and waits a bounded time. Responses offered after the
+    wait has ended are refused, so the receiver can handle them as ordinary late input.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[UUID, PendingRequest] = {}
+        self._lock = threading.Lock()
+
+    def open(self, collect: bool = False) -> UUID:
+        requestId = uuid7()
+        with self._lock:
+            self._pending[requestId] = PendingRequest(collect)
+        return requestId
+
+    def offer(self, packet: Packet) -> bool:
+        """
+        Hand a response to its waiting request. Return False if nobody is waiting for it.
+        """
+        if packet.requestId is None:
+            return False
+        with self._lock:
+            request = self._pending.get(packet.requestId)
+            if request is None:
+                return False
+            request.responses.append(packet)
+            if not request.collect:
+                request.event.set()
+        return True
+
+    def wait(self, requestId: UUID, timeout: float) -> List[Packet]:
+        """
+        Wait for the responses to a request, then close it. An empty list means the wait timed out.
+        """
+        with self._lock:
+            request: Optional[PendingRequest] = self._pending.get(requestId)
+        if request is None:
+            return []
+        request.event.wait(timeout)
+        with self._lock:
+            self._pending.pop(requestId, None)
+            return list(request.responses)
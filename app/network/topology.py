@@ -0,0 +1,112 @@
+import threading
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+from uuid import UUID
+
+
+class HubTopology:
+    """
+    Hub graph maintained from Manager topology events, with cached shortest-path next hops.
+
+    A breadth-first tree is computed lazily per source hub and reused until a link change can affect it. Device
+    moves only update the device -> hub map and never invalidate the trees.
+    """
+
+    def __init__(self) -> None:
+        self.links: Dict[UUID, Set[UUID]] = {}
+        self.deviceHubs: Dict[UUID, UUID] = {}
+        # Source hub -> destination hub -> (first hop, hop count, parent on the tree).
+        self._trees: Dict[UUID, Dict[UUID, Tuple[UUID, int, UUID]]] = {}
+        self._lock = threading.Lock()
+
+    def addHub(self, hubUuid: UUID) -> None:
+        with self._lock:
+            self.links.setdefault(hubUuid, set())
+
+    def removeHub(self, hubUuid: UUID) -> None:
+        with self._lock:
+            for peerUuid in self.links.pop(hubUuid, set()):
+                self.links[peerUuid].discard(hubUuid)
+            self.deviceHubs = {
+                deviceUuid: deviceHubUuid
+                for deviceUuid, deviceHubUuid in self.deviceHubs.items()
+                if deviceHubUuid != hubUuid
+            }
+            self._trees = {
+                sourceUuid: tree
+                for sourceUuid, tree in self._trees.items()
+                if sourceUuid != hubUuid and hubUuid not in tree
+            }
+
+    def addLink(self, hubUuid1: UUID, hubUuid2: UUID) -> None:
+        with self._lock:
+            self.links.setdefault(hubUuid1, set()).add(hubUuid2)
+            self.links.setdefault(hubUuid2, set()).add(hubUuid1)
+            # A new link can shorten any path, so every cached tree is stale.
+            self._trees.clear()
+
+    def removeLink(self, hubUuid1: UUID, hubUuid2: UUID) -> None:
+        with self._lock:
+            self.links.get(hubUuid1, set()).discard(hubUuid2)
+            self.links.get(hubUuid2, set()).discard(hubUuid1)
+            # Only trees that actually route over the removed link need recomputing.
+            self._trees = {
+                sourceUuid: tree
+                for sourceUuid, tree in self._trees.items()
+                if not self._treeUsesLink(sourceUuid, tree, hubUuid1, hubUuid2)
+            }
+
+    def setDeviceHub(self, deviceUuid: UUID, hubUuid: Optional[UUID]) -> None:
+        with self._lock:
+            if hubUuid is None:
+                self.deviceHubs.pop(deviceUuid, None)
+            else:
+                self.deviceHubs[deviceUuid] = hubUuid
+
+    def nextHop(self, sourceHubUuid: UUID, destination: UUID) -> Optional[Tuple[UUID, int]]:
+        """
+        Return (next hop, cost) from a hub towards a hub or device, or None when it is unreachable.
+        """
+        with self._lock:
+            destinationHubUuid = self.deviceHubs.get(destination)
+            extraCost = 1
+            if destinationHubUuid is None:
+                destinationHubUuid = destination
+                extraCost = 0
+            if destinationHubUuid == sourceHubUuid:
+                return (destination, 1) if extraCost else None
+            tree = self._trees.get(sourceHubUuid)
+            if tree is None:
+                tree = self._trees[sourceHubUuid] = self._buildTree(sourceHubUuid)
+            entry = tree.get(destinationHubUuid)
+            if entry is None:
+                return None
+            firstHop, cost, _ = entry
+            return firstHop, cost + extraCost
+
+    def _buildTree(self, sourceHubUuid: UUID) -> Dict[UUID, Tuple[UUID, int, UUID]]:
+        tree: Dict[UUID, Tuple[UUID, int, UUID]] = {}
+        queue = deque()
+        for peerUuid in self.links.get(sourceHubUuid, ()):
+            tree[peerUuid] = (peerUuid, 1, sourceHubUuid)
+            queue.append(peerUuid)
+        while queue:
+            hubUuid = queue.popleft()
+            firstHop, cost, _ = tree[hubUuid]
+            for peerUuid in self.links.get(hubUuid, ()):
+                if peerUuid == sourceHubUuid or peerUuid in tree:
+                    continue
+                tree[peerUuid] = (firstHop, cost + 1, hubUuid)
+                queue.append(peerUuid)
+        return tree
+
+    @staticmethod
+    def _treeUsesLink(
+        sourceUuid: UUID,
+        tree: Dict[UUID, Tuple[UUID, int, UUID]],
+        hubUuid1: UUID,
+        hubUuid2: UUID,
+    ) -> bool:
+        entry1 = tree.get(hubUuid1)
+        entry2 = tree.get(hubUuid2)
+        return (entry1 is not None and entry1[2] == hubUuid2) or (entry2 is not None and entry2[2] == hubUuid1)
@@ -1,4 +1,46 @@
+import os
+
 from app.network.manager import Manager
+from app.network.delivery import createDeliveryEngine
+from app.tracing import configureLogging
+from app.llm.fake_openai import FakeCompletionConfig
+from app.llm.agent_runtime import createAgentRuntime
+from app.llm.client_registry import ClientPoolConfig, ClientRegistry
+from app.llm.scheduler import LLMScheduler, SchedulerConfig
+from app.llm.context_window import ContextWindowConfig
+from app.llm.idle_budget import IdleBudget, IdleConfig
+
+# AIHUB_LOG_LEVELS sets per-subsystem levels, e.g. "hub=DEBUG,device=INFO"; hub packet tracing is off by default.
+configureLogging(os.getenv("AIHUB_LOG_LEVELS", ""))
 
 # Shared manager instance used across the application and the API layer.
-manager = Manager()
+# AIHUB_DELIVERY_ENGINE selects how packets are handed between nodes: "sync" (default), "thread" or "asyncio".
+# AIHUB_ROUTING_MODE selects how hubs find routes for TEXT: "discovery" (default) or "shortest_path".
+# AIHUB_LLM_BACKEND selects the completion backend for AI devices: "openai" (default) or "fake"; the fake backend is
+# tuned with AIHUB_FAKE_LLM, e.g. "tokensPerSecond=80,timeToFirstToken=0.3,toolCallRate=0.5".
+# AIHUB_AGENT_RUNTIME selects how agent loops run: "thread" (default, one thread per device) or "asyncio" (coroutines
+# on one shared event loop with the async OpenAI client).
+# AIHUB_OPENAI_POOL sets the connection pool shared by OpenAI clients, e.g. "maxConnections=100,http2=false"; the
+# pool is unbounded unless a limit is set.
+# AIHUB_LLM_SCHEDULER sets the limits shared by all completion requests, e.g. "maxInFlight=16,tokensPerMinute=200000";
+# unset, requests are not limited.
+# AIHUB_CONTEXT_WINDOW bounds each agent's history, e.g. "maxTokens=24000,targetTokens=16000,summarize=true".
+# AIHUB_OPENAI_EXTENSIONS forces OpenAI-only request parameters (prompt_cache_key, stream_options) on ("true") or off
+# ("false"); by default they are only sent when OPENAI_BASE_URL is unset, as compatible servers may reject them.
+# AIHUB_IDLE_TURNS paces turns taken when nothing happens, e.g. "backoff=2,maxInterval=300,turnsPerMinute=60".
+manager = Manager(
+    deliveryEngine=createDeliveryEngine(os.getenv("AIHUB_DELIVERY_ENGINE", "sync")),
+    routingMode=os.getenv("AIHUB_ROUTING_MODE", "discovery"),
+    llmBackend=os.getenv("AIHUB_LLM_BACKEND", "openai"),
+    fakeCompletionConfig=FakeCompletionConfig.fromSpec(os.getenv("AIHUB_FAKE_LLM", "")),
+    agentRuntime=createAgentRuntime(os.getenv("AIHUB_AGENT_RUNTIME", "thread")),
+    clientRegistry=ClientRegistry(ClientPoolConfig.fromSpec(os.getenv("AIHUB_OPENAI_POOL", ""))),
+    llmScheduler=LLMScheduler(SchedulerConfig.fromSpec(os.getenv("AIHUB_LLM_SCHEDULER", ""))),
+    contextConfig=ContextWindowConfig.fromSpec(os.getenv("AIHUB_CONTEXT_WINDOW", "")),
+    idleBudget=IdleBudget(IdleConfig.fromSpec(os.getenv("AIHUB_IDLE_TURNS", ""))),
+    openaiExtensions=(
+        os.getenv("AIHUB_OPENAI_EXTENSIONS").lower() in ("1", "true", "yes", "on")
+        if os.getenv("AIHUB_OPENAI_EXTENSIONS")
+        else None
+    ),
+)
@@ -0,0 +1,121 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.network.packet import Packet
+
+ROOT_LOGGER_NAME = "aihub"
+SUBSYSTEMS = ("hub", "device", "delivery")
+# Pseudo-subsystem for the console handler's own threshold, so DEBUG tracing can fill the ring buffer without
+# also printing every record.
+CONSOLE = "console"
+
+
+def getLogger(subsystem: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{subsystem}")
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the most recent log records in memory. Records are stored as-is and only formatted when queried.
+    """
+
+    def __init__(self, capacity: int = 2000) -> None:
+        super().__init__()
+        self._records: Deque[logging.LogRecord] = deque(maxlen=capacity)
+        self._recordsLock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._records.maxlen or 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        with self._recordsLock:
+            self._records.append(record)
+
+    def clear(self) -> None:
+        with self._recordsLock:
+            self._records.clear()
+
+    def query(
+        self,
+        limit: int = 100,
+        subsystem: Optional[str] = None,
+        nodeUuid: Optional[str] = None,
+        packetType: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Return up to limit matching records, newest last.
+        """
+        with self._recordsLock:
+            records = list(self._records)
+        loggerName = f"{ROOT_LOGGER_NAME}.{subsystem}" if subsystem else None
+        matched: List[Dict[str, Any]] = []
+        for record in reversed(records):
+            if loggerName and record.name != loggerName:
+                continue
+            packet: Optional[Packet] = getattr(record, "packet", None)
+            recordNodeUuid = getattr(record, "nodeUuid", None)
+            if nodeUuid and str(recordNodeUuid) != nodeUuid:
+                continue
+            if packetType and (packet is None or packet.type != packetType):
+                continue
+            matched.append({
+                "timestamp": record.created,
+                "subsystem": record.name.removeprefix(f"{ROOT_LOGGER_NAME}."),
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "nodeUuid": str(recordNodeUuid) if recordNodeUuid else None,
+                "packet": packet.toActionPacket().model_dump(mode="json") if packet is not None else None,
+            })
+            if len(matched) >= limit:
+                break
+        matched.reverse()
+        return matched
+
+
+ringBuffer = RingBufferHandler()
+consoleHandler = logging.StreamHandler()
+consoleHandler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+
+
+def setLogLevels(levels: Dict[str, str]) -> None:
+    for subsystem, level in levels.items():
+        if subsystem == CONSOLE:
+            consoleHandler.setLevel(level.upper())
+        elif subsystem in SUBSYSTEMS:
+            getLogger(subsystem).setLevel(level.upper())
+        else:
+            raise ValueError(f"Unknown subsystem: {subsystem}")
+
+
+def getLogLevels() -> Dict[str, str]:
+    levels = {
+        subsystem: logging.getLevelName(getLogger(subsystem).getEffectiveLevel())
+        for subsystem in SUBSYSTEMS
+    }
+    levels[CONSOLE] = logging.getLevelName(consoleHandler.level)
+    return levels
+
+
+def configureLogging(levels: str = "") -> None:
+    """
+    Attach the console and ring buffer handlers and apply levels given as "hub=DEBUG,device=INFO".
+
+    Packet tracing on the hub is off by default. Device debug output is on, so devices created with debug=True
+    still print their streaming chunks. "console=INFO" keeps DEBUG records out of stdout while they still reach
+    the ring buffer behind /debug/packets.
+    """
+    rootLogger = logging.getLogger(ROOT_LOGGER_NAME)
+    if ringBuffer not in rootLogger.handlers:
+        rootLogger.addHandler(consoleHandler)
+        rootLogger.addHandler(ringBuffer)
+        rootLogger.propagate = False
+    rootLogger.setLevel(logging.DEBUG)
+    parsedLevels = {"hub": "WARNING", "device": "DEBUG", "delivery": "WARNING", CONSOLE: "DEBUG"}
+    for item in levels.split(","):
+        if "=" in item:
+            subsystem, level = item.split("=", 1)
+            parsedLevels[subsystem.strip()] = level.strip()
+    setLogLevels(parsedLevels)
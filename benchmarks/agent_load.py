@@ -0,0 +1,121 @@
+"""
+Run many AI devices against the fake completion backend and report agent-loop throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.agent_load --agents 200 --duration 20
+"""
+import argparse
+import json
+import threading
+from collections import Counter
+from time import perf_counter, sleep
+from typing import Any, Dict
+
+from app import metrics
+from app.llm.agent_runtime import createAgentRuntime
+from app.llm.fake_openai import FakeCompletionConfig
+from app.network.delivery import ThreadedDeliveryEngine
+from app.network.manager import Manager
+
+
+def measureLoad(
+    agents: int,
+    hubs: int,
+    duration: float,
+    config: FakeCompletionConfig,
+    timeOut: float,
+    runtime: str,
+    requestTimeout: float = 0.0,
+    coalesceWindow: float = 0.0,
+) -> Dict[str, Any]:
+    manager = Manager(
+        deliveryEngine=ThreadedDeliveryEngine(maxInboxSize=65536),
+        llmBackend="fake",
+        fakeCompletionConfig=config,
+        agentRuntime=createAgentRuntime(runtime),
+    )
+    roomHubs = [manager.createRoomHub(f"room-{index}") for index in range(hubs)]
+    for first, second in zip(roomHubs, roomHubs[1:]):
+        manager.connectRoomHubs(first.node.uuid, second.node.uuid)
+
+    events: Counter = Counter()
+    eventsLock = threading.Lock()
+
+    def onEvent(event: Dict[str, Any]) -> None:
+        with eventsLock:
+            events[event["type"]] += 1
+            if event["type"] == "user.message":
+                # Answers to request tools that arrived as input, each costing the agent another completion.
+                events["asyncResponses"] += event["message"]["content"].count("ASYNC: Response arrived")
+
+    wastedBefore = (metrics.llmWastedPromptTokens.value, metrics.llmWastedCompletionTokens.value)
+    threadsBefore = threading.active_count()
+    start = perf_counter()
+    for index in range(agents):
+        device = manager.createAIDevice(
+            f"agent-{index}", timeOut=timeOut, requestTimeout=requestTimeout, coalesceWindow=coalesceWindow
+        )
+        device.registerEventListener(onEvent)
+        device.joinHub(roomHubs[index % hubs].node.uuid)
+    sleep(duration)
+    elapsed = perf_counter() - start
+    with eventsLock:
+        snapshot = dict(events)
+    wastedPromptTokens = metrics.llmWastedPromptTokens.value - wastedBefore[0]
+    wastedCompletionTokens = metrics.llmWastedCompletionTokens.value - wastedBefore[1]
+    agentThreads = threading.active_count() - threadsBefore
+    manager.agentRuntime.shutdown()
+    return {
+        "runtime": runtime,
+        "requestTimeout": requestTimeout,
+        "coalesceWindow": coalesceWindow,
+        "agents": agents,
+        "hubs": hubs,
+        "durationSec": round(elapsed, 2),
+        "agentThreads": agentThreads,
+        "completions": snapshot.get("assistant.message", 0) + snapshot.get("assistant.interrupted", 0),
+        "completionsPerSec": round(
+            (snapshot.get("assistant.message", 0) + snapshot.get("assistant.interrupted", 0)) / elapsed, 1
+        ),
+        "toolCalls": snapshot.get("assistant.tool_call", 0),
+        "interrupted": snapshot.get("assistant.interrupted", 0),
+        "interruptionRate": round(
+            snapshot.get("assistant.interrupted", 0)
+            / max(1, snapshot.get("assistant.message", 0) + snapshot.get("assistant.interrupted", 0)),
+            3,
+        ),
+        "wastedPromptTokens": int(wastedPromptTokens),
+        "wastedCompletionTokens": int(wastedCompletionTokens),
+        "deltaEvents": snapshot.get("assistant.delta", 0),
+        "asyncResponses": snapshot.get("asyncResponses", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--hubs", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--time-out", type=float, default=10.0, help="AIDevice.timeOut, the idle turn interval")
+    parser.add_argument("--spec", default="", help="fake backend options, as for AIHUB_FAKE_LLM")
+    parser.add_argument("--runtime", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--request-timeout", type=float, default=0.0, help="AIDevice.requestTimeout")
+    parser.add_argument("--coalesce-window", type=float, default=0.0, help="AIDevice.coalesceWindow")
+    args = parser.parse_args()
+    config = FakeCompletionConfig.fromSpec(args.spec)
+    report = measureLoad(
+        args.agents,
+        args.hubs,
+        args.duration,
+        config,
+        args.time_out,
+        args.runtime,
+        args.request_timeout,
+        args.coalesce_window,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
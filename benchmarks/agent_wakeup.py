@@ -0,0 +1,114 @@
+"""
+Measure how long idle agents take to react to a packet, and how often idle agent threads wake up.
+
+Agents run against the fake completion backend. A runAI=False device says something in the room, and the latency
+is the time until each agent emits the user.message event for that input.
+
+Run from the repository root:
+
+    python -m benchmarks.agent_wakeup --agents 100
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from app.enums.action_type import ActionType
+from app.llm.fake_openai import FakeCompletionConfig
+from app.network.delivery import ThreadedDeliveryEngine
+from app.network.manager import Manager
+from app.network.packet import Packet
+from app.network.devices.ai_device import AIDevice
+
+
+def countIdleWakeups(seconds: float) -> int:
+    """
+    Count calls to time.time() made while the agents sit idle. Each pass of a wait loop calls it at least once.
+    """
+    calls = [0]
+    originalTime = time.time
+
+    def countingTime() -> float:
+        calls[0] += 1
+        return originalTime()
+
+    import app.network.devices.ai_device as aiDeviceModule
+    aiDeviceModule.time = countingTime
+    try:
+        time.sleep(seconds)
+    finally:
+        aiDeviceModule.time = originalTime
+    return calls[0]
+
+
+def measureWakeup(agents: int, rounds: int, idleSeconds: float) -> Dict[str, Any]:
+    manager = Manager(
+        deliveryEngine=ThreadedDeliveryEngine(maxInboxSize=65536),
+        llmBackend="fake",
+        fakeCompletionConfig=FakeCompletionConfig(tokensPerSecond=0, timeToFirstToken=0, toolCallRate=0, seed=0),
+    )
+    hub = manager.createRoomHub("room")
+    speaker = AIDevice(name="speaker", manager=manager, client=None, runAI=False)
+    speaker.joinHub(hub.node.uuid)
+
+    pending: Dict[str, float] = {}
+    latencies: List[float] = []
+    lock = threading.Lock()
+    received = threading.Condition(lock)
+
+    def onEvent(event: Dict[str, Any]) -> None:
+        if event["type"] != "user.message":
+            return
+        arrivedAt = time.perf_counter()
+        content = event["message"]["content"]
+        with lock:
+            for marker, sentAt in pending.items():
+                if marker in content:
+                    latencies.append((arrivedAt - sentAt) * 1e3)
+                    received.notify_all()
+
+    for index in range(agents):
+        device = manager.createAIDevice(f"agent-{index}", timeOut=3600)
+        device.registerEventListener(onEvent)
+        device.joinHub(hub.node.uuid)
+    # Let every agent finish its JOIN turn and settle into waiting for input.
+    time.sleep(1.0)
+    idleWakeups = countIdleWakeups(idleSeconds)
+
+    for index in range(rounds):
+        marker = f"round-{index}"
+        with lock:
+            pending.clear()
+            expected = len(latencies) + agents
+            pending[marker] = time.perf_counter()
+        speaker.sendPacket(Packet(type=ActionType.TALK, sender=speaker.node.uuid, context=marker))
+        with lock:
+            received.wait_for(lambda: len(latencies) >= expected, timeout=5.0)
+        time.sleep(0.2)
+
+    latencies.sort()
+    return {
+        "agents": agents,
+        "idleWakeupsPerSec": round(idleWakeups / idleSeconds, 1),
+        "reactions": len(latencies),
+        "wakeupLatencyMs": {
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    print(json.dumps(measureWakeup(args.agents, args.rounds, args.idle_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare time-to-first-action with and without early tool dispatch, on a fake completion that makes several calls.
+
+Run from the repository root:
+
+    python -m benchmarks.early_dispatch --tool-calls 3 --tokens-per-second 50
+"""
+import argparse
+import json
+from statistics import mean
+from typing import Any, Dict, List
+
+from app.llm.fake_openai import FakeCompletionConfig, FakeStream, FakeTurn, iterChunks
+from app.network.delivery import SynchronousDeliveryEngine
+from app.network.devices.ai_device import AgentTurnState, StreamedTurn
+from app.network.manager import Manager
+
+
+def measureDispatch(earlyToolDispatch: bool, toolCalls: int, config: FakeCompletionConfig, turns: int) -> Dict[str, Any]:
+    manager = Manager(deliveryEngine=SynchronousDeliveryEngine(), llmBackend="fake")
+    hub = manager.createRoomHub("room")
+    device = manager.createAIDevice("agent", runAI=False, earlyToolDispatch=earlyToolDispatch)
+    device.joinHub(hub.node.uuid)
+    events: List[str] = []
+    device.registerEventListener(lambda event: events.append(event["type"]))
+    fakeTurn = FakeTurn(
+        "Everyone should hear about this, one point at a time.",
+        [
+            ("talk", json.dumps({"target": "everyone", "context": f"Point {index}: " + "details " * 12}))
+            for index in range(toolCalls)
+        ],
+    )
+    firstAction: List[float] = []
+    for _ in range(turns):
+        # Pending input would cut the stream short; this measures uninterrupted turns only.
+        device.takePackets()
+        state = AgentTurnState(device.generateSystemPrompt())
+        state.needsThinking = True
+        turn = StreamedTurn()
+        for chunk in FakeStream(iterChunks(fakeTurn, "fake", config)):
+            if not device._consumeChunk(state, turn, chunk):
+                break
+        device._finishTurn(state, turn)
+        firstAction.append(turn.firstActionAt - turn.completionStartTime)
+    toolEvents = [event for event in events if event in ("assistant.tool_call", "tool.result")]
+    firstTurnEvents = ["call" if event == "assistant.tool_call" else "result" for event in toolEvents[:toolCalls * 2]]
+    return {
+        "earlyToolDispatch": earlyToolDispatch,
+        "toolCalls": toolCalls,
+        "turns": turns,
+        "meanTimeToFirstActionMs": round(mean(firstAction) * 1e3, 1),
+        "toolEvents": len(toolEvents),
+        "firstTurnEventOrder": firstTurnEvents,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tool-calls", type=int, default=3)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--time-to-first-token", type=float, default=0.2)
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+    config = FakeCompletionConfig(tokensPerSecond=args.tokens_per_second, timeToFirstToken=args.time_to_first_token)
+    report = [measureDispatch(early, args.tool_calls, config, args.turns) for early in (False, True)]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
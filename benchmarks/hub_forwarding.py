@@ -0,0 +1,52 @@
+"""
+Measure unicast forwarding cost from a hub node as the room grows.
+
+Run from the repository root:
+
+    python -m benchmarks.hub_forwarding
+"""
+import argparse
+import json
+from time import perf_counter
+from typing import Any, Dict, List
+
+from app.enums.action_type import ActionType
+from app.network.manager import Manager
+from app.network.packet import Packet
+from app.network.devices.ai_device import AIDevice
+
+
+def measureRoom(roomSize: int, iterations: int) -> Dict[str, Any]:
+    manager = Manager()
+    hub = manager.createRoomHub("bench")
+    devices: List[AIDevice] = []
+    for index in range(roomSize):
+        device = AIDevice(name=f"device-{index}", manager=manager, client=None, runAI=False)
+        device.joinHub(hub.node.uuid)
+        device.cachePackets.clear()
+        devices.append(device)
+
+    # The most recently joined device is the worst case for a linear connection scan.
+    target = devices[-1]
+    packet = Packet(type=ActionType.WHISPER, sender=devices[0].node.uuid, recipient=target.node.uuid, context="hi")
+    start = perf_counter()
+    for _ in range(iterations):
+        hub.node.sendPacket(target.node.uuid, packet)
+    elapsed = perf_counter() - start
+    target.cachePackets.clear()
+    return {
+        "roomSize": roomSize,
+        "nsPerUnicast": round(elapsed / iterations * 1e9, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps([measureRoom(size, args.iterations) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measure the idle completions agents start when nothing happens, with and without idle backoff and a shared cap.
+
+Agents use the fake backend with tool calls turned off, so every completion is an idle turn, and the LLM scheduler
+is left unlimited so it does not hide the idle load. A short --time-out compresses minutes of idling into seconds.
+Agent threads cannot be stopped, so each run measures one configuration.
+
+Run from the repository root, once per configuration:
+
+    python -m benchmarks.idle_load --agents 200 --time-out 0.5 --duration 20 --idle "backoff=1"
+    python -m benchmarks.idle_load --agents 200 --time-out 0.5 --duration 20 --idle "backoff=2,maxInterval=4"
+"""
+import argparse
+import json
+from time import perf_counter, sleep
+from typing import Any, Dict
+
+from app import metrics
+from app.llm.agent_runtime import createAgentRuntime
+from app.llm.fake_openai import FakeCompletionConfig
+from app.llm.idle_budget import IdleBudget, IdleConfig
+from app.llm.scheduler import LLMScheduler, SchedulerConfig
+from app.network.delivery import ThreadedDeliveryEngine
+from app.network.manager import Manager
+
+
+def measureIdle(
+    agents: int,
+    duration: float,
+    timeOut: float,
+    idleConfig: IdleConfig,
+    config: FakeCompletionConfig,
+    runtime: str,
+) -> Dict[str, Any]:
+    manager = Manager(
+        deliveryEngine=ThreadedDeliveryEngine(),
+        llmBackend="fake",
+        fakeCompletionConfig=config,
+        agentRuntime=createAgentRuntime(runtime),
+        llmScheduler=LLMScheduler(SchedulerConfig(maxInFlight=0)),
+        idleBudget=IdleBudget(idleConfig),
+    )
+    hub = manager.createRoomHub("room")
+    devices = [manager.createAIDevice(f"agent-{index}", runAI=False, timeOut=timeOut) for index in range(agents)]
+    for device in devices:
+        device.joinHub(hub.node.uuid)
+    # Joined before any loop starts, so the JOIN notices do not turn into a burst of non-idle turns mid-run.
+    for device in devices:
+        device.takePackets()
+    startedBefore = metrics.idleTurnsStarted.value
+    skippedBefore = metrics.idleTurnsSkipped.value
+    start = perf_counter()
+    for device in devices:
+        manager.agentRuntime.start(device)
+    sleep(duration)
+    elapsed = perf_counter() - start
+    started = metrics.idleTurnsStarted.value - startedBefore
+    skipped = metrics.idleTurnsSkipped.value - skippedBefore
+    manager.agentRuntime.shutdown()
+    return {
+        "runtime": runtime,
+        "idle": idleConfig.toDict(),
+        "agents": agents,
+        "timeOut": timeOut,
+        "durationSec": round(elapsed, 2),
+        "idleTurns": int(started),
+        "idleTurnsPerSec": round(started / elapsed, 2),
+        "skipped": int(skipped),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--time-out", type=float, default=0.5, help="AIDevice.timeOut, the first idle interval")
+    parser.add_argument("--idle", default="", help="idle options, as for AIHUB_IDLE_TURNS")
+    parser.add_argument("--spec", default="toolCallRate=0", help="fake backend options, as for AIHUB_FAKE_LLM")
+    parser.add_argument("--runtime", choices=("thread", "asyncio"), default="thread")
+    args = parser.parse_args()
+    report = measureIdle(
+        args.agents,
+        args.duration,
+        args.time_out,
+        IdleConfig.fromSpec(args.idle),
+        FakeCompletionConfig.fromSpec(args.spec),
+        args.runtime,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for Manager registry lookups.
+
+Run from the repository root:
+
+    python -m benchmarks.manager_lookup
+"""
+import argparse
+import json
+from time import perf_counter
+from typing import Any, Dict, List
+
+from app.network.manager import Manager
+from app.network.devices.ai_device import AIDevice
+
+
+def buildTopology(hubCount: int, devicesPerHub: int) -> Manager:
+    manager = Manager()
+    hubs = [manager.createRoomHub(f"hub-{index}") for index in range(hubCount)]
+    for index in range(1, hubCount):
+        manager.connectRoomHubs(hubs[index - 1].node.uuid, hubs[index].node.uuid)
+    for hubIndex, hub in enumerate(hubs):
+        for deviceIndex in range(devicesPerHub):
+            device = AIDevice(
+                name=f"device-{hubIndex}-{deviceIndex}",
+                manager=manager,
+                client=None,
+                runAI=False,
+            )
+            device.joinHub(hub.node.uuid)
+    return manager
+
+
+def measureLookups(manager: Manager, iterations: int) -> Dict[str, float]:
+    hubUuids = list(manager.roomHubs.keys())
+    deviceUuids = list(manager.devices.keys())
+    probes = [deviceUuids[-1], hubUuids[-1], deviceUuids[len(deviceUuids) // 2]]
+
+    results: Dict[str, float] = {}
+    for label, lookup in (
+        ("getNodeByUuid", manager.getNodeByUuid),
+        ("getRoomHubByUuid", manager.getRoomHubByUuid),
+        ("getDeviceByUuid", manager.getDeviceByUuid),
+        ("resolveNodeInfo", manager.resolveNodeInfo),
+    ):
+        start = perf_counter()
+        for _ in range(iterations):
+            for uuid in probes:
+                lookup(uuid)
+        elapsed = perf_counter() - start
+        results[label] = round(elapsed / (iterations * len(probes)) * 1e9, 1)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--devices-per-hub", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    report: List[Dict[str, Any]] = []
+    for hubCount in args.sizes:
+        manager = buildTopology(hubCount, args.devices_per_hub)
+        report.append({
+            "hubs": hubCount,
+            "nodes": len(manager.nodes),
+            "nsPerLookup": measureLookups(manager, args.iterations),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
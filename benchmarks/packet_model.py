@@ -0,0 +1,76 @@
+"""
+Compare the internal slotted Packet against the pydantic ActionPacket model.
+
+Run from the repository root:
+
+    python -m benchmarks.packet_model
+"""
+import argparse
+import json
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict
+from uuid import uuid4
+
+from app.enums.action_type import ActionType
+from app.models.action_packet import ActionPacket
+from app.network.packet import Packet
+
+
+def nsPerCall(function: Callable[[], Any], iterations: int) -> float:
+    start = perf_counter()
+    for _ in range(iterations):
+        function()
+    return round((perf_counter() - start) / iterations * 1e9, 1)
+
+
+def bytesPerInstance(factory: Callable[[], Any], count: int) -> float:
+    tracemalloc.start()
+    instances = [factory() for _ in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del instances
+    return round(current / count, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--instances", type=int, default=10000)
+    args = parser.parse_args()
+
+    sender = uuid4()
+    recipient = uuid4()
+    model = ActionPacket(type=ActionType.TALK, sender=sender, recipient=recipient, context="hello")
+    packet = Packet.fromActionPacket(model)
+    assert packet.toActionPacket() == model
+
+    report: Dict[str, Dict[str, float]] = {
+        "ActionPacket": {
+            "constructNs": nsPerCall(
+                lambda: ActionPacket(type=ActionType.TALK, sender=sender, recipient=recipient, context="hello"),
+                args.iterations,
+            ),
+            "hopCopyNs": nsPerCall(lambda: model.model_copy(update={"ttl": model.ttl - 1}), args.iterations),
+            "bytesPerInstance": bytesPerInstance(
+                lambda: ActionPacket(type=ActionType.TALK, sender=sender, recipient=recipient, context="hello"),
+                args.instances,
+            ),
+        },
+        "Packet": {
+            "constructNs": nsPerCall(
+                lambda: Packet(type=ActionType.TALK, sender=sender, recipient=recipient, context="hello"),
+                args.iterations,
+            ),
+            "hopCopyNs": nsPerCall(lambda: packet.withTtl(packet.ttl - 1), args.iterations),
+            "bytesPerInstance": bytesPerInstance(
+                lambda: Packet(type=ActionType.TALK, sender=sender, recipient=recipient, context="hello"),
+                args.instances,
+            ),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare TEXT delivery latency between discovery flooding and Manager shortest-path routing on a hub grid.
+
+Run from the repository root:
+
+    python -m benchmarks.routing_modes
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+from time import perf_counter
+from typing import Any, Dict, List
+
+from app.enums.action_type import ActionType
+from app.network.delivery import ThreadedDeliveryEngine
+from app.network.manager import Manager
+from app.network.packet import Packet
+from app.network.devices.ai_device import AIDevice
+
+
+def buildGrid(manager: Manager, width: int) -> List[List[Any]]:
+    grid = [[manager.createRoomHub(f"hub-{row}-{column}") for column in range(width)] for row in range(width)]
+    for row in range(width):
+        for column in range(width):
+            if row + 1 < width:
+                manager.connectRoomHubs(grid[row][column].node.uuid, grid[row + 1][column].node.uuid)
+            if column + 1 < width:
+                manager.connectRoomHubs(grid[row][column].node.uuid, grid[row][column + 1].node.uuid)
+    return grid
+
+
+def measureMode(routingMode: str, width: int, pairs: int, seed: int, timeout: float) -> Dict[str, Any]:
+    engine = ThreadedDeliveryEngine(maxInboxSize=65536)
+    manager = Manager(deliveryEngine=engine, routingMode=routingMode)
+    hubs = [hub for row in buildGrid(manager, width) for hub in row]
+    rng = random.Random(seed)
+
+    devices: List[AIDevice] = []
+    for index, hub in enumerate(hubs):
+        device = AIDevice(name=f"device-{index}", manager=manager, client=None, runAI=False)
+        device.joinHub(hub.node.uuid)
+        devices.append(device)
+
+    transfers = [0]
+    manager.registerPacketTransferListener(lambda source, target, packet: transfers.__setitem__(0, transfers[0] + 1))
+    manager.registerPacketMulticastListener(
+        lambda source, targets, packet: transfers.__setitem__(0, transfers[0] + len(targets))
+    )
+
+    arrived = threading.Event()
+    expected: Dict[str, Any] = {}
+
+    def makeReceiver(device: AIDevice):
+        def onReceive(packet: Packet) -> None:
+            if packet.type == ActionType.TEXT and packet.recipient == device.node.uuid:
+                if packet.context == expected.get("context"):
+                    arrived.set()
+        return onReceive
+
+    for device in devices:
+        device.node.onPacketReceived = makeReceiver(device)
+
+    engine.drain()
+    latencies: List[float] = []
+    lost = 0
+    transfers[0] = 0
+    for index in range(pairs):
+        sender, recipient = rng.sample(devices, 2)
+        expected["context"] = f"message-{index}"
+        arrived.clear()
+        start = perf_counter()
+        sender.sendPacket(Packet(
+            type=ActionType.TEXT,
+            sender=sender.node.uuid,
+            recipient=recipient.node.uuid,
+            context=expected["context"],
+        ))
+        if arrived.wait(timeout):
+            latencies.append((perf_counter() - start) * 1e3)
+        else:
+            lost += 1
+    engine.stop()
+
+    latencies.sort()
+    return {
+        "routingMode": routingMode,
+        "hubs": len(hubs),
+        "messages": pairs,
+        "lost": lost,
+        "packetTransfers": transfers[0],
+        "latencyMs": {
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=8, help="grid width; the mesh has width * width hubs")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+    report = [
+        measureMode(mode, args.width, args.messages, args.seed, args.timeout)
+        for mode in Manager.ROUTING_MODES
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure the agent's per-chunk cost of consuming one streamed completion with long tool-call arguments.
+
+Run from the repository root:
+
+    python -m benchmarks.stream_chunks --argument-tokens 1000 4000 16000
+"""
+import argparse
+import json
+from time import perf_counter
+from typing import Any, Dict, List
+
+from app.llm.fake_openai import FakeCompletionConfig, FakeTurn, iterChunks
+from app.network.devices.ai_device import AgentTurnState, StreamedTurn
+from app.network.manager import Manager
+
+
+def measureStream(argumentTokens: int, contentTokens: int, repeats: int) -> Dict[str, Any]:
+    manager = Manager(llmBackend="fake")
+    device = manager.createAIDevice("agent", runAI=False)
+    words = " ".join(f"word{index}" for index in range(argumentTokens))
+    turn = FakeTurn(
+        " ".join("thought" for _ in range(contentTokens)),
+        [("talk", json.dumps({"target": "everyone", "context": words}))],
+    )
+    config = FakeCompletionConfig(tokensPerSecond=0, timeToFirstToken=0)
+    chunks = [chunk for _, chunk in iterChunks(turn, "fake", config)]
+    perChunk: List[float] = []
+    for _ in range(repeats):
+        state = AgentTurnState(device.generateSystemPrompt())
+        streamed = StreamedTurn()
+        start = perf_counter()
+        for chunk in chunks:
+            device._consumeChunk(state, streamed, chunk)
+        perChunk.append((perf_counter() - start) / len(chunks))
+    return {
+        "argumentTokens": argumentTokens,
+        "chunks": len(chunks),
+        "usPerChunk": round(min(perChunk) * 1e6, 2),
+        "msPerStream": round(min(perChunk) * len(chunks) * 1e3, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--argument-tokens", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--content-tokens", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    report = [measureStream(tokens, args.content_tokens, args.repeats) for tokens in args.argument_tokens]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Drive scripted traffic over synthetic hub topologies and report forwarding throughput, route discovery latency
+and memory use: the traced peak and the blocks still held per hop.
+
+Hubs are built through Manager.createRoomHub and connectRoomHubs, with one runAI=False device per hub. Packets are
+delivered by a QueuedDeliveryEngine drained on the calling thread, so runs are deterministic and do not recurse
+once per hop.
+
+Run from the repository root:
+
+    python -m benchmarks.topologies
+    python -m benchmarks.topologies --topologies grid mesh --hubs 64 --traffic text discovery
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.enums.action_type import ActionType
+from app.network.delivery import QueuedDeliveryEngine
+from app.network.manager import Manager
+from app.network.packet import Packet
+from app.network.devices.ai_device import AIDevice
+from app.network.devices.room_hub import RoomHub
+
+TOPOLOGIES = ("line", "ring", "grid", "star", "mesh")
+TRAFFIC = ("talk", "text", "ping", "discovery")
+# Source files whose memory is counted in retainedAppBlocksPerHop; the benchmark's own bookkeeping is left out.
+NETWORK_CODE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "*")
+
+
+def linkLine(count: int, rng: random.Random) -> List[Tuple[int, int]]:
+    return [(index, index + 1) for index in range(count - 1)]
+
+
+def linkRing(count: int, rng: random.Random) -> List[Tuple[int, int]]:
+    return linkLine(count, rng) + ([(count - 1, 0)] if count > 2 else [])
+
+
+def linkGrid(count: int, rng: random.Random) -> List[Tuple[int, int]]:
+    width = math.ceil(math.sqrt(count))
+    links = []
+    for index in range(count):
+        if (index + 1) % width and index + 1 < count:
+            links.append((index, index + 1))
+        if index + width < count:
+            links.append((index, index + width))
+    return links
+
+
+def linkStar(count: int, rng: random.Random) -> List[Tuple[int, int]]:
+    return [(0, index) for index in range(1, count)]
+
+
+def linkMesh(count: int, rng: random.Random) -> List[Tuple[int, int]]:
+    # A random spanning tree keeps the mesh connected; extra links bring the average degree to about four.
+    links = {(rng.randrange(index), index) for index in range(1, count)}
+    while len(links) < min(2 * count, count * (count - 1) // 2):
+        first, second = sorted(rng.sample(range(count), 2))
+        links.add((first, second))
+    return sorted(links)
+
+
+LINKERS: Dict[str, Callable[[int, random.Random], List[Tuple[int, int]]]] = {
+    "line": linkLine,
+    "ring": linkRing,
+    "grid": linkGrid,
+    "star": linkStar,
+    "mesh": linkMesh,
+}
+
+
+class Network:
+    def __init__(self, topology: str, hubCount: int, routingMode: str, seed: int) -> None:
+        self.engine = QueuedDeliveryEngine(maxInboxSize=1 << 20)
+        self.manager = Manager(deliveryEngine=self.engine, routingMode=routingMode)
+        self.rng = random.Random(seed)
+        self.hubs: List[RoomHub] = [self.manager.createRoomHub(f"hub-{index}") for index in range(hubCount)]
+        self.links = LINKERS[topology](hubCount, self.rng)
+        for first, second in self.links:
+            self.manager.connectRoomHubs(self.hubs[first].node.uuid, self.hubs[second].node.uuid)
+        self.devices: List[AIDevice] = []
+        for index, hub in enumerate(self.hubs):
+            device = AIDevice(name=f"device-{index}", manager=self.manager, client=None, runAI=False)
+            device.joinHub(hub.node.uuid)
+            self.devices.append(device)
+        self.hops = 0
+        self.manager.registerPacketTransferListener(self._onTransfer)
+        self.manager.registerPacketMulticastListener(self._onMulticast)
+        self.settle()
+
+    def _onTransfer(self, source: Any, target: Any, packet: Packet) -> None:
+        self.hops += 1
+
+    def _onMulticast(self, source: Any, targets: Any, packet: Packet) -> None:
+        self.hops += len(targets)
+
+    def settle(self) -> None:
+        self.engine.drain()
+        for device in self.devices:
+            device.cachePackets.clear()
+
+    def resetRoutes(self) -> None:
+        for hub in self.hubs:
+            hub.clearRoutes()
+            hub.clearPendingDiscoveries()
+
+
+def sendTalk(network: Network, index: int) -> None:
+    sender = network.rng.choice(network.devices)
+    sender.sendPacket(Packet(type=ActionType.TALK, sender=sender.node.uuid, context=f"talk-{index}"))
+
+
+def sendText(network: Network, index: int) -> None:
+    sender, recipient = network.rng.sample(network.devices, 2)
+    sender.sendPacket(Packet(
+        type=ActionType.TEXT,
+        sender=sender.node.uuid,
+        recipient=recipient.node.uuid,
+        context=f"text-{index}",
+    ))
+
+
+def sendPing(network: Network, index: int) -> None:
+    sender = network.rng.choice(network.devices)
+    sender.sendPacket(Packet(type=ActionType.PING, sender=sender.node.uuid))
+
+
+def sendDiscovery(network: Network, index: int) -> None:
+    source, destination = network.rng.sample(network.hubs, 2)
+    network.resetRoutes()
+    source.findRoute(destination.node.uuid, lambda route: None)
+
+
+SENDERS: Dict[str, Callable[[Network, int], None]] = {
+    "talk": sendTalk,
+    "text": sendText,
+    "ping": sendPing,
+    "discovery": sendDiscovery,
+}
+
+
+def measureDiscoveryLatency(network: Network, samples: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    unresolved = 0
+    for _ in range(samples):
+        source, destination = network.rng.sample(network.hubs, 2)
+        network.resetRoutes()
+        found: List[float] = []
+        start = perf_counter()
+        source.findRoute(destination.node.uuid, lambda route: found.append(perf_counter()))
+        network.engine.drain()
+        if found:
+            latencies.append((found[0] - start) * 1e6)
+        else:
+            unresolved += 1
+    network.settle()
+    latencies.sort()
+    return {
+        "samples": samples,
+        "unresolved": unresolved,
+        "p50Us": round(latencies[len(latencies) // 2], 1) if latencies else None,
+        "p95Us": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+        "meanUs": round(statistics.fmean(latencies), 1) if latencies else None,
+    }
+
+
+def runTraffic(network: Network, traffic: str, messages: int) -> Tuple[int, float]:
+    send = SENDERS[traffic]
+    network.hops = 0
+    start = perf_counter()
+    for index in range(messages):
+        send(network, index)
+        network.engine.drain()
+    elapsed = perf_counter() - start
+    hops = network.hops
+    network.settle()
+    return hops, elapsed
+
+
+def measureScenario(
+    topology: str,
+    hubCount: int,
+    traffic: str,
+    messages: int,
+    routingMode: str,
+    seed: int,
+) -> Dict[str, Any]:
+    network = Network(topology, hubCount, routingMode, seed)
+    runTraffic(network, traffic, min(messages, 20))
+    hops, elapsed = runTraffic(network, traffic, messages)
+
+    # A second pass under tracemalloc; it is far slower, so it is kept out of the timed numbers.
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracedHops, _ = runTraffic(network, traffic, messages)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    # Python cannot count every allocation, only what is still held, so this reports blocks the app code keeps
+    # per hop (routing state, buffers, queues) rather than allocations; transient churn shows up in the peak.
+    networkOnly = [tracemalloc.Filter(True, NETWORK_CODE)]
+    retained = after.filter_traces(networkOnly).compare_to(before.filter_traces(networkOnly), "filename")
+    retainedBlocks = sum(stat.count_diff for stat in retained)
+
+    report: Dict[str, Any] = {
+        "topology": topology,
+        "hubs": hubCount,
+        "links": len(network.links),
+        "traffic": traffic,
+        "routingMode": routingMode,
+        "messages": messages,
+        "hops": hops,
+        "hopsPerMessage": round(hops / messages, 2),
+        "packetsPerSec": round(hops / elapsed) if elapsed else None,
+        "usPerMessage": round(elapsed / messages * 1e6, 1),
+        "peakMemoryKiB": round((peak - baseline) / 1024, 1),
+        "retainedAppBlocksPerHop": round(retainedBlocks / tracedHops, 3) if tracedHops else None,
+    }
+    if traffic == "discovery":
+        report["discoveryLatency"] = measureDiscoveryLatency(network, min(messages, 200))
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologies", nargs="+", choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--traffic", nargs="+", choices=TRAFFIC, default=list(TRAFFIC))
+    parser.add_argument("--hubs", type=int, default=16)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--routing-mode", choices=Manager.ROUTING_MODES, default="discovery")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.hubs < 2:
+        parser.error("--hubs must be at least 2")
+    report = [
+        measureScenario(topology, args.hubs, traffic, args.messages, args.routing_mode, args.seed)
+        for topology in args.topologies
+        for traffic in args.traffic
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
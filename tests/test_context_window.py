@@ -0,0 +1,64 @@
+from typing import Any, Dict, List
+
+from app.llm.context_window import ContextWindowConfig, ConversationWindow, TimestampedMessage
+
+
+def userMessage(content: str, timestamp: float = 0.0) -> TimestampedMessage:
+    return TimestampedMessage({"role": "user", "content": content}, timestamp)
+
+
+def toolCallMessage(content: str, callIds: List[str], timestamp: float = 0.0) -> TimestampedMessage:
+    toolCalls: List[Dict[str, Any]] = [
+        {"id": callId, "type": "function", "function": {"name": "talk", "arguments": "{}"}} for callId in callIds
+    ]
+    return TimestampedMessage({"role": "assistant", "content": content, "tool_calls": toolCalls}, timestamp)
+
+
+def toolResult(callId: str, timestamp: float = 0.0) -> TimestampedMessage:
+    return TimestampedMessage({"role": "tool", "tool_call_id": callId, "content": "ok"}, timestamp)
+
+
+def makeWindow(config: ContextWindowConfig, messages: List[TimestampedMessage]) -> ConversationWindow:
+    window = ConversationWindow({"role": "system", "content": "You are an agent."}, config)
+    for message in messages:
+        window.append(message)
+    return window
+
+
+def testAssistantIsEvictedWithItsToolResults() -> None:
+    assistant = toolCallMessage("x" * 4000, ["a", "b"])
+    results = [toolResult("a"), toolResult("b")]
+    latest = userMessage("what now?")
+    systemTokens = makeWindow(ContextWindowConfig(maxTokens=0), []).tokens
+    # Evicting the assistant message alone would already fit the target.
+    config = ContextWindowConfig(maxTokens=900, targetTokens=systemTokens + latest.tokens + 2 * results[0].tokens)
+    window = makeWindow(config, [assistant, *results, latest])
+
+    evicted = window.trim(now=0.0)
+
+    assert evicted == [assistant, *results]
+    assert [message["role"] for message in window.params()] == ["system", "user"]
+    assert window.tokens == systemTokens + latest.tokens
+
+
+def testNewestTurnIsKeptWithItsToolResults() -> None:
+    oldest = userMessage("x" * 4000)
+    assistant = toolCallMessage("y" * 4000, ["a"])
+    result = toolResult("a")
+    window = makeWindow(ContextWindowConfig(maxTokens=10, targetTokens=10), [oldest, assistant, result])
+
+    assert window.trim(now=0.0) == [oldest]
+    assert [message["role"] for message in window.params()] == ["system", "assistant", "tool"]
+
+
+def testOldMessagesAreEvictedDownToKeepAge() -> None:
+    config = ContextWindowConfig(maxTokens=0, maxAge=100.0, keepAge=50.0)
+    old = userMessage("old", timestamp=0.0)
+    assistant = toolCallMessage("calling", ["a"], timestamp=10.0)
+    # The result is recent, but it still goes with the assistant message that called it.
+    result = toolResult("a", timestamp=80.0)
+    recent = userMessage("recent", timestamp=90.0)
+    window = makeWindow(config, [old, assistant, result, recent])
+
+    assert window.trim(now=120.0) == [old, assistant, result]
+    assert [message["role"] for message in window.params()] == ["system", "user"]
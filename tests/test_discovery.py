@@ -0,0 +1,57 @@
+from time import monotonic, sleep
+from typing import Callable, List, Tuple
+
+from uuid6 import uuid7
+
+from app import metrics
+from app.network.devices.room_hub import RoomHub, RouteTableItem
+from app.network.manager import Manager
+
+
+def waitFor(condition: Callable[[], bool], timeout: float = 2.0) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.005)
+    return True
+
+
+def connectedHubs() -> Tuple[RoomHub, RoomHub]:
+    manager = Manager(llmBackend="fake")
+    first = manager.createRoomHub("first")
+    second = manager.createRoomHub("second")
+    manager.connectRoomHubs(first.node.uuid, second.node.uuid)
+    return first, second
+
+
+def testUnansweredDiscoveryExpiresWithoutFurtherTraffic() -> None:
+    hub, _ = connectedHubs()
+    hub.discoveryTimeout = 0.05
+    hub.maxDiscoveryAttempts = 2
+    requestsBefore = metrics.discoveryRequests.value
+    droppedBefore = metrics.discoveryWaitersDropped.value
+    found: List[RouteTableItem] = []
+
+    hub.findRoute(uuid7(), found.append)
+
+    assert waitFor(lambda: not hub.pendingDiscoveries)
+    assert found == []
+    assert hub.expiredDiscoveryCount == 1
+    assert hub.droppedWaiterCount == 1
+    assert metrics.discoveryRequests.value - requestsBefore == 2
+    assert metrics.discoveryWaitersDropped.value - droppedBefore == 1
+
+
+def testRemovingRoutesCountsWaitingPackets() -> None:
+    hub, _ = connectedHubs()
+    destination = uuid7()
+    droppedBefore = metrics.discoveryWaitersDropped.value
+    hub.findRoute(destination, lambda route: None)
+    hub.findRoute(destination, lambda route: None)
+
+    hub.removeRoutesFor(destination)
+
+    assert destination not in hub.pendingDiscoveries
+    assert hub.droppedWaiterCount == 2
+    assert metrics.discoveryWaitersDropped.value - droppedBefore == 2
@@ -0,0 +1,42 @@
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List
+
+from app.llm.agent_runtime import createAgentRuntime
+from app.llm.fake_openai import FakeCompletionConfig
+from app.network.manager import Manager
+
+
+def waitFor(condition: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.005)
+    return True
+
+
+def testEarlyToolEventsFollowTheAssistantMessage() -> None:
+    script = [{
+        "content": "I will ping the room so everyone knows I am here.",
+        "toolCalls": [{"name": "ping", "arguments": {}}],
+    }]
+    manager = Manager(
+        llmBackend="fake",
+        fakeCompletionConfig=FakeCompletionConfig(tokensPerSecond=2000, timeToFirstToken=0.0, script=script),
+        agentRuntime=createAgentRuntime("asyncio"),
+    )
+    hub = manager.createRoomHub("room")
+    device = manager.createAIDevice("agent", runAI=False, earlyToolDispatch=True, timeOut=0.05)
+    device.joinHub(hub.node.uuid)
+    events: List[Dict[str, Any]] = []
+    device.registerEventListener(events.append)
+    manager.agentRuntime.start(device)
+    try:
+        assert waitFor(lambda: any(event["type"] == "tool.result" for event in events))
+    finally:
+        manager.agentRuntime.shutdown()
+
+    turnEvents = [
+        event["type"] for event in events if event["type"] in ("assistant.message", "assistant.tool_call", "tool.result")
+    ]
+    assert turnEvents[:3] == ["assistant.message", "assistant.tool_call", "tool.result"]
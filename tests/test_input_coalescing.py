@@ -0,0 +1,59 @@
+import pytest
+
+from app.llm.input_coalescing import GAP_SMOOTHING, MIN_HOLDOFF, QUIET_GAPS, InputCoalescer
+
+
+def testAverageGapIsSmoothedAcrossArrivals() -> None:
+    coalescer = InputCoalescer(maxWindow=1.0)
+    coalescer.observe(0.0)
+    assert coalescer.averageGap is None
+    coalescer.observe(0.1)
+    assert coalescer.averageGap == pytest.approx(0.1)
+    coalescer.observe(0.3)
+    expected = 0.1 + GAP_SMOOTHING * (0.2 - 0.1)
+    assert coalescer.averageGap == pytest.approx(expected)
+    assert coalescer.quietGap() == pytest.approx(QUIET_GAPS * expected)
+
+
+def testLongSilenceIsCappedAndReadsAsQuiet() -> None:
+    coalescer = InputCoalescer(maxWindow=0.5)
+    coalescer.observe(0.0)
+    coalescer.observe(100.0)
+    assert coalescer.averageGap == pytest.approx(1.0)
+    assert coalescer.quietGap() == 0.0
+    # A burst after the silence pulls the average back under the window within a few packets.
+    for index in range(1, 6):
+        coalescer.observe(100.0 + index * 0.01)
+    assert coalescer.averageGap < 0.5
+    assert 0 < coalescer.quietGap() <= 0.5
+
+
+def testInterruptionsGrowTheHoldoffAndCompletionsShrinkIt() -> None:
+    coalescer = InputCoalescer(maxWindow=0.3)
+    coalescer.onStreamEnd(interrupted=True)
+    assert coalescer.holdoff == pytest.approx(MIN_HOLDOFF)
+    coalescer.onStreamEnd(interrupted=True)
+    coalescer.onStreamEnd(interrupted=True)
+    coalescer.onStreamEnd(interrupted=True)
+    assert coalescer.holdoff == pytest.approx(0.3)
+    assert coalescer.quietGap() == pytest.approx(0.3)
+    coalescer.onStreamEnd(interrupted=False)
+    assert coalescer.holdoff == pytest.approx(0.15)
+
+
+def testWakeAtNeverPassesTheWindow() -> None:
+    coalescer = InputCoalescer(maxWindow=0.2)
+    coalescer.observe(10.0)
+    coalescer.observe(10.15)
+    coalescer.observe(10.3)
+    assert coalescer.wakeAt(10.0) == pytest.approx(10.2)
+    assert coalescer.wakeAt(10.3) == pytest.approx(10.3 + coalescer.quietGap())
+
+
+def testZeroWindowDisablesCoalescing() -> None:
+    coalescer = InputCoalescer()
+    coalescer.observe(0.0)
+    coalescer.observe(0.01)
+    coalescer.onStreamEnd(interrupted=True)
+    assert coalescer.averageGap is None
+    assert coalescer.quietGap() == 0.0
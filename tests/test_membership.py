@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from time import monotonic, sleep
+from typing import Callable, Iterator, List
+
+import pytest
+
+from app.enums.action_type import ActionType
+from app.network.delivery import createDeliveryEngine
+from app.network.devices.ai_device import AIDevice
+from app.network.manager import Manager
+from app.network.packet import Packet
+
+
+def waitFor(condition: Callable[[], bool], timeout: float = 2.0) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.005)
+    return True
+
+
+@pytest.fixture(params=["sync", "thread", "asyncio"])
+def manager(request: pytest.FixtureRequest) -> Iterator[Manager]:
+    engine = createDeliveryEngine(request.param)
+    loop = None
+    if request.param == "asyncio":
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result()
+        loop.call_soon_threadsafe(engine.start, loop)
+    yield Manager(deliveryEngine=engine, llmBackend="fake")
+    if loop is not None:
+        loop.call_soon_threadsafe(engine.stop)
+        # Let the cancelled drain task finish before the loop stops.
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    else:
+        engine.stop()
+
+
+def receivedTypes(device: AIDevice, expected: List[ActionType]) -> List[ActionType]:
+    received: List[ActionType] = []
+
+    def collect() -> bool:
+        received.extend(packet.type for packet in device.takePackets())
+        return received == expected
+
+    waitFor(collect)
+    return received
+
+
+def testJoinAndLeaveReachOtherMembers(manager: Manager) -> None:
+    hub = manager.createRoomHub("room")
+    first = manager.createAIDevice("first", runAI=False)
+    second = manager.createAIDevice("second", runAI=False)
+    first.joinHub(hub.node.uuid)
+    assert receivedTypes(first, [ActionType.JOIN]) == [ActionType.JOIN]
+
+    second.joinHub(hub.node.uuid)
+    assert receivedTypes(first, [ActionType.JOIN]) == [ActionType.JOIN]
+
+    second.leaveHub()
+    assert receivedTypes(first, [ActionType.LEAVE]) == [ActionType.LEAVE]
+    assert list(hub.connectedDevices) == [first.node.uuid]
+
+
+def sendLeave(manager: Manager, device: AIDevice, hubUuid) -> None:
+    manager.createConnectionByUuids(device.node.uuid, hubUuid)
+    device.node.sendPacket(hubUuid, Packet(type=ActionType.LEAVE, sender=device.node.uuid, context=f"{hubUuid}"))
+
+
+def testLeaveFromDeviceThatNeverJoinedIsIgnored(manager: Manager) -> None:
+    hub = manager.createRoomHub("room")
+    member = manager.createAIDevice("member", runAI=False)
+    stranger = manager.createAIDevice("stranger", runAI=False)
+    latecomer = manager.createAIDevice("latecomer", runAI=False)
+    member.joinHub(hub.node.uuid)
+    assert receivedTypes(member, [ActionType.JOIN]) == [ActionType.JOIN]
+
+    sendLeave(manager, stranger, hub.node.uuid)
+    # Delivery is in order, so a LEAVE broadcast would reach the member before this JOIN.
+    latecomer.joinHub(hub.node.uuid)
+    assert receivedTypes(member, [ActionType.JOIN]) == [ActionType.JOIN]
+    assert list(hub.connectedDevices) == [member.node.uuid, latecomer.node.uuid]
+
+
+def testRepeatedLeaveIsAnnouncedOnce(manager: Manager) -> None:
+    hub = manager.createRoomHub("room")
+    member = manager.createAIDevice("member", runAI=False)
+    leaver = manager.createAIDevice("leaver", runAI=False)
+    latecomer = manager.createAIDevice("latecomer", runAI=False)
+    member.joinHub(hub.node.uuid)
+    leaver.joinHub(hub.node.uuid)
+    assert receivedTypes(member, [ActionType.JOIN, ActionType.JOIN]) == [ActionType.JOIN, ActionType.JOIN]
+
+    leaver.leaveHub()
+    assert receivedTypes(member, [ActionType.LEAVE]) == [ActionType.LEAVE]
+
+    sendLeave(manager, leaver, hub.node.uuid)
+    latecomer.joinHub(hub.node.uuid)
+    assert receivedTypes(member, [ActionType.JOIN]) == [ActionType.JOIN]
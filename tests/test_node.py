@@ -0,0 +1,25 @@
+from app.network.connection import Connection
+from app.network.node import Node
+
+
+def testRemovingAForeignConnectionIsIgnored() -> None:
+    node, peer, stranger, other = Node(), Node(), Node(), Node()
+    connection = Connection(node, peer)
+
+    node.removeConnection(Connection(stranger, other))
+
+    assert node.connections == [connection]
+    assert node.peers == {peer.uuid: connection}
+
+
+def testRemovingAConnectionFallsBackToAParallelOne() -> None:
+    node, peer = Node(), Node()
+    first = Connection(node, peer)
+    second = Connection(node, peer)
+    assert node.peers == {peer.uuid: second}
+
+    node.removeConnection(second)
+    assert node.peers == {peer.uuid: first}
+    node.removeConnection(first)
+    assert node.peers == {}
+    assert node.connections == []
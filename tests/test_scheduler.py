@@ -0,0 +1,142 @@
+import threading
+from time import monotonic, sleep
+from typing import Callable, List, Tuple
+from uuid import UUID
+
+import pytest
+from uuid6 import uuid7
+
+from app.enums.request_priority import RequestPriority
+from app.llm import scheduler as schedulerModule
+from app.llm.scheduler import LLMScheduler, SchedulerConfig, SchedulerTicket
+
+
+def waitFor(condition: Callable[[], bool], timeout: float = 2.0) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.005)
+    return True
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(schedulerModule, "monotonic", fake)
+    return fake
+
+
+def queuedCount(scheduler: LLMScheduler) -> int:
+    return sum(scheduler.stats()["queued"].values())
+
+
+def acquireInThread(
+    scheduler: LLMScheduler,
+    granted: List[Tuple[UUID, SchedulerTicket]],
+    deviceUuid: UUID,
+    priority: RequestPriority = RequestPriority.NORMAL,
+    tokens: int = 0,
+) -> None:
+    """
+    Queue a request from a background thread and wait until the scheduler has it, so queue order is deterministic.
+    """
+    queuedBefore = queuedCount(scheduler)
+    grantedBefore = len(granted)
+    threading.Thread(
+        target=lambda: granted.append((deviceUuid, scheduler.acquire(deviceUuid, priority, tokens))),
+        daemon=True,
+    ).start()
+    assert waitFor(lambda: queuedCount(scheduler) > queuedBefore or len(granted) > grantedBefore)
+
+
+def releaseInOrder(
+    scheduler: LLMScheduler,
+    holder: SchedulerTicket,
+    granted: List[Tuple[UUID, SchedulerTicket]],
+    count: int,
+) -> List[UUID]:
+    """
+    Release the holder, then each request as it is granted, and return the devices in the order they were served.
+    """
+    scheduler.release(holder)
+    for index in range(count):
+        assert waitFor(lambda: len(granted) > index)
+        scheduler.release(granted[index][1])
+    return [deviceUuid for deviceUuid, _ in granted]
+
+
+def testHigherPriorityIsServedFirstAndDevicesTakeTurns() -> None:
+    scheduler = LLMScheduler(SchedulerConfig(maxInFlight=1))
+    chatty, quiet, direct = uuid7(), uuid7(), uuid7()
+    holder = scheduler.acquire(uuid7(), RequestPriority.NORMAL)
+    granted: List[Tuple[UUID, SchedulerTicket]] = []
+    acquireInThread(scheduler, granted, chatty)
+    acquireInThread(scheduler, granted, chatty)
+    acquireInThread(scheduler, granted, chatty)
+    acquireInThread(scheduler, granted, quiet)
+    acquireInThread(scheduler, granted, direct, RequestPriority.DIRECT)
+    assert granted == []
+
+    order = releaseInOrder(scheduler, holder, granted, 5)
+
+    # The quiet device is served after one of the chatty device's requests, not after all three.
+    assert order == [direct, chatty, quiet, chatty, chatty]
+    assert scheduler.stats()["inFlight"] == 0
+
+
+def testRequestsPerMinuteWaitsForTheWindow(clock: FakeClock) -> None:
+    scheduler = LLMScheduler(SchedulerConfig(requestsPerMinute=2))
+    first = scheduler.acquire(uuid7(), RequestPriority.NORMAL)
+    second = scheduler.acquire(uuid7(), RequestPriority.NORMAL)
+    granted: List[Tuple[UUID, SchedulerTicket]] = []
+    acquireInThread(scheduler, granted, uuid7())
+    sleep(0.05)
+    assert granted == []
+    assert scheduler.stats()["requestsLastMinute"] == 2
+
+    clock.now += 30
+    scheduler.release(first)
+    sleep(0.05)
+    assert granted == []
+
+    clock.now += 31
+    scheduler.release(second)
+    assert waitFor(lambda: len(granted) == 1)
+    assert scheduler.stats()["requestsLastMinute"] == 1
+
+
+def testTokensPerMinuteUsesReportedUsage(clock: FakeClock) -> None:
+    scheduler = LLMScheduler(SchedulerConfig(tokensPerMinute=100))
+    first = scheduler.acquire(uuid7(), RequestPriority.NORMAL, tokens=60)
+    granted: List[Tuple[UUID, SchedulerTicket]] = []
+    acquireInThread(scheduler, granted, uuid7(), tokens=50)
+    sleep(0.05)
+    assert granted == []
+
+    # The request used fewer tokens than estimated, which frees room in the window.
+    scheduler.release(first, usedTokens=30)
+    assert waitFor(lambda: len(granted) == 1)
+    assert scheduler.stats()["tokensLastMinute"] == 80
+
+
+def testEmptyWindowAdmitsARequestLargerThanTheBudget(clock: FakeClock) -> None:
+    scheduler = LLMScheduler(SchedulerConfig(tokensPerMinute=100))
+    large = scheduler.acquire(uuid7(), RequestPriority.NORMAL, tokens=500)
+    assert large.granted
+    granted: List[Tuple[UUID, SchedulerTicket]] = []
+    acquireInThread(scheduler, granted, uuid7(), tokens=1)
+    sleep(0.05)
+    assert granted == []
+
+    clock.now += 61
+    scheduler.release(large)
+    assert waitFor(lambda: len(granted) == 1)
@@ -0,0 +1,40 @@
+from typing import List
+
+import pytest
+
+from app.llm.streaming_json import JsonCompletenessTracker
+
+
+def completeAfter(chunks: List[str]) -> List[bool]:
+    tracker = JsonCompletenessTracker()
+    states: List[bool] = []
+    for chunk in chunks:
+        tracker.feed(chunk)
+        states.append(tracker.complete)
+    return states
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        '{"text": "say \\"hi\\" {not a brace}", "items": [1, {"nested": "]"}]}',
+        '{"path": "C:\\\\dir\\\\", "after": "}"}',
+        '["\\\\\\"", "{"]',
+    ],
+)
+def testEveryChunkBoundaryGivesTheSameAnswer(document: str) -> None:
+    for split in range(1, len(document)):
+        states = completeAfter([document[:split], document[split:]])
+        assert states == [False, True], split
+
+
+def testEscapedQuoteSplitAfterBackslashStaysInString() -> None:
+    assert completeAfter(['{"a": "x\\', '"}', '"}']) == [False, False, True]
+
+
+def testBraceInsideStringSplitAcrossChunksIsIgnored() -> None:
+    assert completeAfter(['{"a": "', '}', '"', '}']) == [False, False, False, True]
+
+
+def testNothingButWhitespaceIsNotComplete() -> None:
+    assert completeAfter(["  ", "\n"]) == [False, False]
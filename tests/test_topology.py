@@ -0,0 +1,72 @@
+from typing import Tuple
+from uuid import UUID
+
+from uuid6 import uuid7
+
+from app.network.topology import HubTopology
+
+
+def makeTopology(*links: Tuple[UUID, UUID]) -> HubTopology:
+    topology = HubTopology()
+    for hubUuid1, hubUuid2 in links:
+        topology.addLink(hubUuid1, hubUuid2)
+    return topology
+
+
+def testNextHopFollowsShortestPathToHubsAndDevices() -> None:
+    a, b, c, d = uuid7(), uuid7(), uuid7(), uuid7()
+    topology = makeTopology((a, b), (b, c), (c, d))
+    device = uuid7()
+    topology.setDeviceHub(device, d)
+
+    assert topology.nextHop(a, d) == (b, 3)
+    assert topology.nextHop(a, device) == (b, 4)
+    assert topology.nextHop(d, device) == (device, 1)
+    assert topology.nextHop(a, a) is None
+
+
+def testRemovingANonTreeLinkKeepsTheCachedTree() -> None:
+    a, b, c = uuid7(), uuid7(), uuid7()
+    topology = makeTopology((a, b), (a, c), (b, c))
+    assert topology.nextHop(a, c) == (c, 1)
+    tree = topology._trees[a]
+
+    # a reaches b and c directly, so b-c is not on a's tree.
+    topology.removeLink(b, c)
+
+    assert topology._trees.get(a) is tree
+    assert topology.nextHop(a, c) == (c, 1)
+
+
+def testRemovingATreeLinkRecomputesTheRoute() -> None:
+    a, b, c = uuid7(), uuid7(), uuid7()
+    topology = makeTopology((a, b), (a, c), (b, c))
+    assert topology.nextHop(a, c) == (c, 1)
+
+    topology.removeLink(a, c)
+
+    assert a not in topology._trees
+    assert topology.nextHop(a, c) == (b, 2)
+
+
+def testAddingALinkShortensCachedRoutes() -> None:
+    a, b, c = uuid7(), uuid7(), uuid7()
+    topology = makeTopology((a, b), (b, c))
+    assert topology.nextHop(a, c) == (b, 2)
+
+    topology.addLink(a, c)
+
+    assert topology.nextHop(a, c) == (c, 1)
+
+
+def testRemovingAHubMakesItsSideUnreachable() -> None:
+    a, b, c = uuid7(), uuid7(), uuid7()
+    topology = makeTopology((a, b), (b, c))
+    device = uuid7()
+    topology.setDeviceHub(device, c)
+    assert topology.nextHop(a, device) == (b, 3)
+
+    topology.removeHub(b)
+
+    assert topology.nextHop(a, c) is None
+    assert topology.nextHop(a, device) is None
@@ -686,6 +686,13 @@ function handleStateStreamMessage(event) {
         handlePacketTransferEvent(payload);
         return;
     }
+    if (eventType === "packet.multicast") {
+        const targetUuids = Array.isArray(payload.targetUuids) ? payload.targetUuids : [];
+        targetUuids.forEach((targetUuid) => {
+            handlePacketTransferEvent({ ...payload, targetUuid });
+        });
+        return;
+    }
     const hubs = Array.isArray(payload.hubs) ? payload.hubs : null;
     const devices = Array.isArray(payload.devices) ? payload.devices : null;
     if (!hubs || !devices) {